@@ -0,0 +1,65 @@
+from os.path import dirname, abspath
+from rec2vec import configure_logging, logger
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = dirname(dirname(abspath(__file__)))  # root of the repository (scripts are started from here)
+
+# Commands whose startup is measured, with their budget in seconds. Budgets leave room for slower machines,
+# they fail when a heavy dependency (gensim, sklearn, ...) is imported eagerly again.
+TARGETS = {'import rec2vec': ([sys.executable, '-c', 'import rec2vec'], 0.3),
+           'scripts/test.py -h': ([sys.executable, 'scripts/test.py', '-h'], 0.6),
+           'scripts/convert_graph.py -h': ([sys.executable, 'scripts/convert_graph.py', '-h'], 0.6),
+           'scripts/train.py -h': ([sys.executable, 'scripts/train.py', '-h'], 1.5),
+           'scripts/serve.py -h': ([sys.executable, 'scripts/serve.py', '-h'], 1.5)}
+
+
+def time_startup(command: list[str], repetitions: int = 5) -> float:
+    """
+    Measures how long a command takes from start to exit (in a fresh interpreter every time).
+
+    :param command:     command to be executed
+    :param repetitions: number of timed executions
+    :return:            median time in seconds
+    """
+
+    logger.trace('time_startup(%s, %s)', command, repetitions)
+
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))}
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import and startup time of the package and scripts')
+    parser.add_argument('-r', '--repetitions', default=5, type=int, help='Number of timed executions per command')
+    parser.add_argument('-sc', '--scale', default=1.0, type=float, help='Multiply all budgets by this factor')
+    args = parser.parse_args()
+    configure_logging()
+
+    exceeded = []
+    for name, (command, budget) in TARGETS.items():
+        seconds = time_startup(command=command, repetitions=args.repetitions)
+        within = seconds <= budget * args.scale
+        status = 'ok' if within else 'EXCEEDED'
+        print(f'{name}:\t{seconds:.3f}s\t(budget {budget * args.scale:.1f}s)\t{status}')
+        if not within:
+            exceeded.append(name)
+
+    if exceeded:
+        print(f'budget exceeded by {len(exceeded)} of {len(TARGETS)} commands')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,73 @@
+from rec2vec.util.adjacency import CSRAdjacency
+from rec2vec.util.alias import MEMORY_BUDGET, SecondOrderTables
+from rec2vec.util.walks import build_walks
+from rec2vec.util.Graph import Graph
+from rec2vec import configure_logging, logger
+from benchmarks.bench_walks import power_law_adjacency
+
+import argparse
+import time
+
+
+def time_walks(adjacency: CSRAdjacency, args: argparse.Namespace, p: float = 1, q: float = 1,
+               memory_budget: int = MEMORY_BUDGET) -> tuple[float, int]:
+    """
+    Records the walks of the benchmark once (including the construction of the second order tables).
+
+    :param adjacency:       graph in CSR format
+    :param args:            user input arguments (parameters of the walks)
+    :param p:               return parameter of node2vec
+    :param q:               in-out parameter of node2vec
+    :param memory_budget:   maximum number of bytes used by the second order tables
+    :return:                seconds and number of steps taken
+    """
+
+    logger.trace('time_walks(%s, %s, %s, %s)', adjacency, p, q, memory_budget)
+
+    start = time.perf_counter()
+    _, lengths = build_walks(adjacency=adjacency, num_paths=args.number_paths, path_length=args.length_path,
+                             alpha=args.alpha, seed=args.seed, workers=args.workers, p=p, q=q,
+                             memory_budget=memory_budget)
+    return time.perf_counter() - start, int(lengths.sum() - len(lengths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the throughput of uniform and node2vec random walks')
+    parser.add_argument('-n', '--nodes', default=100_000, type=int, help='Number of nodes of the synthetic graph')
+    parser.add_argument('-e', '--edges', default=1_000_000, type=int, help='Number of edges of the synthetic graph')
+    parser.add_argument('-cp', '--config-path', default=None, type=str, help='Use the graph of a config instead')
+    parser.add_argument('-np', '--number-paths', default=2, type=int, help='Number of paths for each node')
+    parser.add_argument('-lp', '--length-path', default=40, type=int, help='Number of steps per path')
+    parser.add_argument('-a', '--alpha', default=0, type=float, help='Chance for path to be reset to start')
+    parser.add_argument('-p', '--return-param', default=0.5, type=float, help='node2vec return parameter p')
+    parser.add_argument('-q', '--inout-param', default=2, type=float, help='node2vec in-out parameter q')
+    parser.add_argument('-mb', '--memory-budget', default=2 ** 26, type=int, help='Bytes of the alias tables')
+    parser.add_argument('-wo', '--workers', default=1, type=int, help='Number of processes recording walks')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='Random seed for reproducibility')
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.config_path is None:
+        adjacency = power_law_adjacency(num_nodes=args.nodes, num_edges=args.edges)
+    else:
+        adjacency = Graph(config_path=args.config_path, backend='csr')._get_adjacency()
+    print(f'graph:\t\t\t{adjacency.num_nodes} nodes, {len(adjacency.indices)} directed edges')
+
+    start = time.perf_counter()
+    tables = SecondOrderTables.build(adjacency=adjacency, p=args.return_param, q=args.inout_param,
+                                     memory_budget=args.memory_budget)
+    print(f'tables:\t\t\t{time.perf_counter() - start:.3f}s\t{len(tables.prob):,} slots '
+          f'({(tables.prob.nbytes + tables.alias.nbytes) / 2 ** 20:.0f} MiB)')
+
+    runs = {'uniform': dict(),
+            'node2vec (alias+build)': dict(p=args.return_param, q=args.inout_param, memory_budget=args.memory_budget),
+            'node2vec (rejection)': dict(p=args.return_param, q=args.inout_param, memory_budget=0)}
+    baseline = None
+    for name, params in runs.items():
+        seconds, steps = time_walks(adjacency=adjacency, args=args, **params)
+        baseline = baseline or seconds
+        print(f'{name + ":":<24}{seconds:.3f}s\t{steps / seconds:,.0f} steps/s\t({seconds / baseline:.1f}x uniform)')
+
+
+if __name__ == '__main__':
+    exit(main())
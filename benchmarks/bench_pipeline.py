@@ -0,0 +1,139 @@
+from os import makedirs
+from os.path import abspath, dirname, join
+from tempfile import TemporaryDirectory
+from rec2vec.util.Graph import Graph
+from rec2vec.util.load_config import load_config
+from rec2vec.util.profiling import profiler, span
+from rec2vec.util.walks import train_word2vec
+from rec2vec import configure_logging, logger
+from benchmarks.synthetic import generate_dataset
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+
+ROOT = dirname(dirname(abspath(__file__)))  # root of the repository
+
+
+def run_pipeline(config_path: str, args: argparse.Namespace) -> dict:
+    """
+    Runs every stage of the pipeline once on the graph of a config and records the time and memory of each stage:
+    graph (containing load_nodes, load_edges and symmetrization), walks, training, candidates and predict_and_test
+    (containing prediction). Up-to-date artifacts of the graph are used, i.e. the loading stages are only measured
+    for new data.
+
+    :param config_path: path to the config of the graph
+    :param args:        user input arguments (parameters of the walks and of the model)
+    :return:            spans recorded by the profiler and the peak memory of the process
+    """
+
+    logger.trace('run_pipeline(%s, %s)', config_path, args)
+
+    from rec2vec.predict.candidates import build_candidate_tables
+    from scripts.test import predict_and_test
+
+    config = load_config(path=config_path)
+    test_path = join(config['data']['folder'], 'test_user_ratings.csv')
+
+    profiler.enable()
+    with span('graph', backend=args.graph_backend):
+        g = Graph(config_path=config_path, backend=args.graph_backend)
+    with span('walks', engine=args.walk_engine, number_paths=args.number_paths, length_path=args.length_path):
+        corpus = g.build_deepwalk_corpus(num_paths=args.number_paths, path_length=args.length_path,
+                                         rand=random.Random(args.seed), engine=args.walk_engine,
+                                         workers=args.workers)
+    with span('training', walks=len(corpus)):
+        model = train_word2vec(corpus=corpus, window=args.window_size, min_count=0, workers=args.workers,
+                               seed=args.seed)
+    with span('candidates'):
+        candidates = build_candidate_tables(config=config, node_dict=g.get_node_dict(), model=model)
+    with span('predict_and_test'):
+        acc, _, mse = predict_and_test(data_path=test_path, predictor_variable='users:userID;movies:movieID',
+                                       target_variable='ratings:rating', config=config, model=model,
+                                       node_dict=g.get_node_dict(), candidates=candidates)
+
+    return {**profiler.to_dict(), 'accuracy': float(acc), 'mse': float(mse)}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_isolated(config_path: str, argv: list[str]) -> dict:
+    """
+    Runs the pipeline in a fresh interpreter, so that the peak memory of every size is measured separately.
+
+    :param config_path: path to the config of the graph
+    :param argv:        command line arguments passed on (parameters of the walks and of the model)
+    :return:            result of run_pipeline()
+    """
+
+    with TemporaryDirectory() as tmp:
+        result_path = join(tmp, 'result.json')
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))}
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_pipeline', *argv, '-cp', config_path,
+                        '-o', result_path], cwd=ROOT, env=env, check=True)
+        with open(result_path) as f:
+            return json.load(f)['runs'][0]
+
+
+def _stage_summary(run: dict) -> str:
+    seconds = {}
+    for record in run['spans']:
+        seconds[record['name']] = seconds.get(record['name'], 0) + record['seconds']
+    return '  '.join(f'{name} {s:.2f}s' for name, s in seconds.items()) + f'  peak {run["peak_rss_mb"]:.0f} MiB'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and memory-profile every stage of the pipeline at several '
+                                                 'sizes of a synthetic graph')
+    parser.add_argument('-e', '--edges', default=[1e4, 1e5, 1e6], type=float, nargs='+',
+                        help='Numbers of ratings of the synthetic graphs (e.g. 1e4 1e5 1e6 1e7)')
+    parser.add_argument('-cp', '--config-path', default=None, type=str,
+                        help='Benchmark the graph of this config instead (within this process)')
+    parser.add_argument('-f', '--folder', default='./output/bench_pipeline/', type=str,
+                        help='Folder of the synthetic datasets')
+    parser.add_argument('-o', '--output', default='./output/bench_pipeline.json', type=str,
+                        help='JSON file the results are written to')
+    parser.add_argument('-gb', '--graph-backend', default='csr', choices=Graph.BACKENDS, help='Representation of the graph')
+    parser.add_argument('-we', '--walk-engine', default='vectorized', choices=Graph.ENGINES, help='Engine recording the walks')
+    parser.add_argument('-np', '--number-paths', default=5, type=int, help='Number of paths for each node')
+    parser.add_argument('-lp', '--length-path', default=20, type=int, help='Number of steps per path')
+    parser.add_argument('-ws', '--window-size', default=5, type=int, help='Window size for skipgram')
+    parser.add_argument('-wo', '--workers', default=4, type=int, help='Number of workers')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='Random seed for reproducibility')
+    args = parser.parse_args()
+    configure_logging()
+
+    args.edges = [int(edges) for edges in args.edges]
+    parameters = {key: value for key, value in vars(args).items() if key not in ('config_path', 'folder', 'output')}
+    if args.config_path is not None:
+        runs = [{'config_path': args.config_path, **run_pipeline(config_path=args.config_path, args=args)}]
+    else:
+        argv = [f'--{key.replace("_", "-")}={value}' for key, value in parameters.items() if key != 'edges']
+        runs = []
+        for edges in args.edges:
+            config_path = generate_dataset(folder=join(args.folder, str(edges), ''), num_edges=edges, seed=args.seed)
+            runs.append({'edges': edges, **_run_isolated(config_path=config_path, argv=argv)})
+            print(f'{edges:>10} edges:  {_stage_summary(runs[-1])}')
+
+    result = {'commit': _git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+              'parameters': parameters, 'runs': runs}
+    makedirs(dirname(abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    exit(main())
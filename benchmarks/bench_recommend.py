@@ -0,0 +1,88 @@
+from rec2vec.predict.recommend import Recommender, VectorIndex
+from rec2vec.util.load_config import load_config
+from rec2vec.util.mapped_vectors import load_model, load_node_dict
+from rec2vec import GRAPH_CONFIG_PATH, configure_logging, logger
+
+import numpy as np
+import argparse
+import time
+
+
+def clustered_vectors(num_vectors: int, dim: int, num_clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """
+    Creates random vectors that form clusters (like embeddings of related items).
+
+    :param num_vectors:     number of vectors
+    :param dim:             dimension of the vectors
+    :param num_clusters:    number of clusters
+    :param seed:            seed for reproducibility
+    :return:                (num_vectors, dim) vectors
+    """
+
+    logger.trace('clustered_vectors(%s, %s, %s, %s)', num_vectors, dim, num_clusters, seed)
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dim))
+    return (centers[rng.integers(0, num_clusters, size=num_vectors)] +
+            rng.normal(scale=0.8, size=(num_vectors, dim))).astype(np.float32)
+
+
+def _measure(search, queries: np.ndarray) -> tuple[list[np.ndarray], np.ndarray]:
+    """
+    Runs one search per query and measures the latency of each search.
+
+    :param search:  function taking a query and returning the positions of the results
+    :param queries: query vectors
+    :return:        results and latencies (in milliseconds) of all searches
+    """
+
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare recall and latency of the recommendation index with brute force')
+    parser.add_argument('-n', '--items', default=100_000, type=int, help='Number of items of the synthetic catalogue')
+    parser.add_argument('-d', '--dimension', default=100, type=int, help='Dimension of the synthetic vectors')
+    parser.add_argument('-mp', '--model-path', default=None, type=str, help='Use the items of a trained model instead')
+    parser.add_argument('-ndp', '--node-dict-path', default='./output/node_dict.obj', type=str, help='Path to nodedict')
+    parser.add_argument('-cp', '--config-path', default=GRAPH_CONFIG_PATH, type=str, help='Path to custom config')
+    parser.add_argument('-q', '--queries', default=200, type=int, help='Number of queries')
+    parser.add_argument('-k', '--top-n', default=10, type=int, help='Number of recommendations per query')
+    parser.add_argument('-nl', '--num-lists', default=None, type=int, help='Number of clusters of the index')
+    parser.add_argument('-pr', '--probes', default='1,4,8,16,32', type=str, help='Numbers of searched clusters to compare')
+    args = parser.parse_args()
+    configure_logging()
+
+    rng = np.random.default_rng(1)
+    start = time.perf_counter()
+    if args.model_path is None:
+        index = VectorIndex.build(vectors=clustered_vectors(num_vectors=args.items, dim=args.dimension),
+                                  num_lists=args.num_lists)
+        queries = clustered_vectors(num_vectors=args.queries, dim=args.dimension, seed=2)
+    else:
+        model = load_model(path=args.model_path)
+        node_dict = load_node_dict(model_path=args.model_path, node_dict_path=args.node_dict_path)
+        recommender = Recommender.build(config=load_config(path=args.config_path), model=model, node_dict=node_dict,
+                                        num_lists=args.num_lists)
+        index = recommender.index
+        queries = recommender.user_vectors[rng.choice(len(recommender.user_vectors), size=args.queries)]
+    print(f'index:\t\t{len(index.vectors)} vectors, {index.num_lists} lists, built in '
+          f'{time.perf_counter() - start:.2f}s')
+
+    exact, latencies = _measure(lambda q: index.search_exact(query=q, n=args.top_n)[0], queries)
+    print(f'brute force:\tp50 {np.percentile(latencies, 50):.2f}ms\tp99 {np.percentile(latencies, 99):.2f}ms')
+
+    for num_probe in [int(p) for p in args.probes.split(',')]:
+        found, latencies = _measure(lambda q: index.search(query=q, n=args.top_n, num_probe=num_probe)[0], queries)
+        recall = np.mean([len(np.intersect1d(f, e)) / max(len(e), 1) for f, e in zip(found, exact)])
+        print(f'probe {num_probe}:\trecall@{args.top_n} {recall:.3f}\tp50 {np.percentile(latencies, 50):.2f}ms\t'
+              f'p99 {np.percentile(latencies, 99):.2f}ms')
+
+
+if __name__ == '__main__':
+    exit(main())
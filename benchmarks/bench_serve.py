@@ -0,0 +1,103 @@
+from rec2vec import configure_logging, logger
+
+import pandas as pd
+import numpy as np
+import argparse
+import asyncio
+import json
+import time
+
+
+async def _client(requests: list[tuple[str, dict]], latencies: list[float], statuses: dict, host: str, port: int,
+                  unix_socket: str = None) -> None:
+    """
+    Sends requests one after another over one (keep-alive) connection and records their latency.
+
+    :param requests:    path and body of each request
+    :param latencies:   latencies in milliseconds (appended)
+    :param statuses:    number of responses by status code (updated)
+    :param host:        host of the server
+    :param port:        port of the server
+    :param unix_socket: path to the Unix socket of the server (instead of host and port)
+    :return:
+    """
+
+    if unix_socket is None:
+        reader, writer = await asyncio.open_connection(host=host, port=port)
+    else:
+        reader, writer = await asyncio.open_unix_connection(path=unix_socket)
+
+    for path, body in requests:
+        payload = json.dumps(body).encode()
+        start = time.perf_counter()
+        writer.write(f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload)
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        await reader.readexactly(length)
+
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    writer.close()
+
+
+async def _run(requests: list[tuple[str, dict]], concurrency: int, host: str, port: int,
+               unix_socket: str = None) -> tuple[list[float], dict, float]:
+    """
+    Sends requests over several concurrent connections.
+
+    :param requests:    path and body of each request
+    :param concurrency: number of connections
+    :param host:        host of the server
+    :param port:        port of the server
+    :param unix_socket: path to the Unix socket of the server (instead of host and port)
+    :return:            latencies, number of responses by status code and total time
+    """
+
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(requests=requests[i::concurrency], latencies=latencies, statuses=statuses,
+                                   host=host, port=port, unix_socket=unix_socket) for i in range(concurrency)])
+    return latencies, statuses, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate concurrent load for a running prediction server (scripts/serve.py)')
+    parser.add_argument('-dp', '--data-path', default='./data/test_user_ratings.csv', type=str, help='Users and items to request')
+    parser.add_argument('-s', '--separator', default=';', type=str, help='Separator of the data')
+    parser.add_argument('-uc', '--user-column', default='userID', type=str, help='Column containing the users')
+    parser.add_argument('-ic', '--item-column', default='movieID', type=str, help='Column containing the items')
+    parser.add_argument('-e', '--endpoint', default='predict', choices=['predict', 'recommend'], help='Requested endpoint')
+    parser.add_argument('-r', '--requests', default=5000, type=int, help='Number of requests')
+    parser.add_argument('-c', '--concurrency', default=64, type=int, help='Number of concurrent connections')
+    parser.add_argument('-H', '--host', default='127.0.0.1', type=str, help='Host of the server')
+    parser.add_argument('-P', '--port', default=8080, type=int, help='Port of the server')
+    parser.add_argument('-us', '--unix-socket', default=None, type=str, help='Unix socket of the server')
+    args = parser.parse_args()
+    configure_logging()
+
+    logger.trace('main(%s)', args)
+
+    df = pd.read_csv(args.data_path, sep=args.separator)
+    rows = df.iloc[np.random.default_rng(0).integers(0, len(df), size=args.requests)]
+    if args.endpoint == 'predict':
+        requests = [('/predict', {'user': int(u), 'item': int(i)})
+                    for u, i in zip(rows[args.user_column], rows[args.item_column])]
+    else:
+        requests = [('/recommend', {'user': int(u), 'n': 10}) for u in rows[args.user_column]]
+
+    latencies, statuses, seconds = asyncio.run(_run(requests=requests, concurrency=args.concurrency, host=args.host,
+                                                    port=args.port, unix_socket=args.unix_socket))
+    print(f'requests:\t{len(latencies)} ({statuses})')
+    print(f'throughput:\t{len(latencies) / seconds:,.0f} requests/s')
+    print(f'latency:\tp50 {np.percentile(latencies, 50):.2f}ms\tp99 {np.percentile(latencies, 99):.2f}ms')
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,83 @@
+from rec2vec.util.adjacency import CSRAdjacency
+from rec2vec.util.Graph import Graph
+from rec2vec import configure_logging, logger
+
+import numpy as np
+import argparse
+import random
+import time
+
+
+def power_law_adjacency(num_nodes: int, num_edges: int, exponent: float = 2.1, seed: int = 0) -> CSRAdjacency:
+    """
+    Creates a random graph whose degrees roughly follow a power law (few hubs, many nodes with small degree).
+
+    :param num_nodes:   number of vertices
+    :param num_edges:   number of (undirected) edges to be drawn
+    :param exponent:    exponent of the degree distribution
+    :param seed:        seed for reproducibility
+    :return:            adjacency in CSR format
+    """
+
+    logger.trace('power_law_adjacency(%s, %s, %s, %s)', num_nodes, num_edges, exponent, seed)
+
+    rng = np.random.default_rng(seed)
+    weights = np.arange(1, num_nodes + 1, dtype=np.float64) ** (-1 / (exponent - 1))
+    weights /= weights.sum()
+    src = rng.choice(num_nodes, size=num_edges, p=weights)
+    dst = rng.integers(0, num_nodes, size=num_edges)
+    return CSRAdjacency.from_edges(src=src, dst=dst, num_nodes=num_nodes)
+
+
+def _time(function, repetitions: int) -> float:
+    """
+    Returns the best wall-clock time of several executions of a function.
+
+    :param function:    function without arguments
+    :param repetitions: number of executions
+    :return:            minimum time in seconds
+    """
+
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the python and the vectorized random walk engine')
+    parser.add_argument('-n', '--nodes', default=20_000, type=int, help='Number of nodes of the synthetic graph')
+    parser.add_argument('-e', '--edges', default=100_000, type=int, help='Number of edges of the synthetic graph')
+    parser.add_argument('-cp', '--config-path', default=None, type=str, help='Use the graph of a config instead')
+    parser.add_argument('-np', '--number-paths', default=2, type=int, help='Number of paths for each node')
+    parser.add_argument('-lp', '--length-path', default=40, type=int, help='Number of steps per path')
+    parser.add_argument('-a', '--alpha', default=0, type=float, help='Chance for path to be reset to start')
+    parser.add_argument('-r', '--repetitions', default=1, type=int, help='Number of timed executions')
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.config_path is None:
+        adjacency = power_law_adjacency(num_nodes=args.nodes, num_edges=args.edges)
+        graphs = {'python': Graph.from_adjacency(adjacency=adjacency, backend='dict'),
+                  'vectorized': Graph.from_adjacency(adjacency=adjacency, backend='csr')}
+    else:
+        graphs = {'python': Graph(config_path=args.config_path, backend='dict'),
+                  'vectorized': Graph(config_path=args.config_path, backend='csr')}
+
+    results = {}
+    for engine, g in graphs.items():
+        steps = sum(len(walk) for walk in g.build_deepwalk_corpus(num_paths=1, path_length=args.length_path,
+                                                                   alpha=args.alpha, engine=engine))
+        seconds = _time(lambda: g.build_deepwalk_corpus(num_paths=args.number_paths, path_length=args.length_path,
+                                                        alpha=args.alpha, rand=random.Random(0), engine=engine),
+                        repetitions=args.repetitions)
+        results[engine] = seconds
+        print(f'{engine}:\t{seconds:.3f}s\t{steps * args.number_paths / seconds:,.0f} steps/s')
+
+    print(f'speedup:\t{results["python"] / results["vectorized"]:.1f}x')
+
+
+if __name__ == '__main__':
+    exit(main())
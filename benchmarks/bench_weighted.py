@@ -0,0 +1,81 @@
+from rec2vec.util.adjacency import CSRAdjacency
+from rec2vec.util.walks import build_walks
+from rec2vec import configure_logging, logger
+from benchmarks.bench_walks import power_law_adjacency
+
+import numpy as np
+import argparse
+import time
+
+
+def with_random_weights(adjacency: CSRAdjacency, max_weight: int = 5, seed: int = 0) -> CSRAdjacency:
+    """
+    Returns a copy of an adjacency whose edges have random integer weights (e.g. ratings or interaction counts).
+
+    :param adjacency:   graph in CSR format
+    :param max_weight:  weights are drawn uniformly from 1 to max_weight
+    :param seed:        seed for reproducibility
+    :return:            weighted adjacency in CSR format
+    """
+
+    logger.trace('with_random_weights(%s, %s, %s)', adjacency, max_weight, seed)
+
+    src = np.repeat(np.arange(adjacency.num_nodes, dtype=np.int64), adjacency.degrees())
+    dst = np.asarray(adjacency.indices, dtype=np.int64)
+    one_way = src < dst
+    weights = np.random.default_rng(seed).integers(1, max_weight + 1, size=int(one_way.sum()))
+    return CSRAdjacency.from_edges(src=src[one_way], dst=dst[one_way], num_nodes=adjacency.num_nodes,
+                                   nodes=adjacency.nodes, weights=weights)
+
+
+def time_walks(adjacency: CSRAdjacency, args: argparse.Namespace) -> tuple[float, int]:
+    """
+    Returns the best time of recording the walks of the benchmark and the number of steps taken.
+
+    :param adjacency:   graph in CSR format
+    :param args:        user input arguments (parameters of the walks)
+    :return:            seconds and number of steps
+    """
+
+    logger.trace('time_walks(%s)', adjacency)
+
+    timings = []
+    for _ in range(args.repetitions):
+        start = time.perf_counter()
+        _, lengths = build_walks(adjacency=adjacency, num_paths=args.number_paths, path_length=args.length_path,
+                                 alpha=args.alpha, seed=args.seed, workers=args.workers)
+        timings.append(time.perf_counter() - start)
+    return min(timings), int(lengths.sum() - len(lengths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the throughput of unweighted and weighted random walks')
+    parser.add_argument('-n', '--nodes', default=100_000, type=int, help='Number of nodes of the synthetic graph')
+    parser.add_argument('-e', '--edges', default=1_000_000, type=int, help='Number of edges of the synthetic graph')
+    parser.add_argument('-mw', '--max-weight', default=5, type=int, help='Edge weights are drawn from 1 to this value')
+    parser.add_argument('-np', '--number-paths', default=2, type=int, help='Number of paths for each node')
+    parser.add_argument('-lp', '--length-path', default=40, type=int, help='Number of steps per path')
+    parser.add_argument('-a', '--alpha', default=0, type=float, help='Chance for path to be reset to start')
+    parser.add_argument('-wo', '--workers', default=1, type=int, help='Number of processes recording walks')
+    parser.add_argument('-r', '--repetitions', default=3, type=int, help='Number of timed executions')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='Random seed for reproducibility')
+    args = parser.parse_args()
+    configure_logging()
+
+    unweighted = power_law_adjacency(num_nodes=args.nodes, num_edges=args.edges, seed=args.seed)
+    start = time.perf_counter()
+    weighted = with_random_weights(adjacency=unweighted, max_weight=args.max_weight, seed=args.seed)
+    print(f'graph:\t\t{unweighted.num_nodes} nodes, {unweighted.num_edges} directed edges '
+          f'(weights and alias tables built in {time.perf_counter() - start:.3f}s)')
+
+    results = {}
+    for name, adjacency in (('unweighted', unweighted), ('weighted', weighted)):
+        seconds, steps = time_walks(adjacency=adjacency, args=args)
+        results[name] = seconds / steps
+        print(f'{name}:\t{seconds:.3f}s\t{steps / seconds:,.0f} steps/s')
+
+    print(f'cost per step:\t{results["weighted"] / results["unweighted"]:.2f}x')
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,134 @@
+from os import makedirs
+from os.path import join
+from rec2vec import configure_logging, logger
+
+import numpy as np
+import pandas as pd
+import argparse
+import yaml
+
+SEPARATOR = ';'
+NUM_GENRES = 20
+RATING_RANGE = (1, 5)   # ratings are integers, every movie is extended by each of them
+
+
+def power_law_choice(rng: np.random.Generator, num_items: int, size: int, exponent: float = 2.1) -> np.ndarray:
+    """
+    Draws items such that the number of times each item is drawn (its degree) roughly follows a power law:
+    the item of popularity rank r is drawn with probability proportional to r^(-1 / (exponent - 1)).
+
+    :param rng:         random number generator
+    :param num_items:   number of items to draw from
+    :param size:        number of draws
+    :param exponent:    exponent of the degree distribution
+    :return:            drawn items (0 to num_items - 1, ranks shuffled)
+    """
+
+    weights = np.arange(1, num_items + 1, dtype=np.float64) ** (-1 / (exponent - 1))
+    ranks = rng.permutation(num_items)
+    return ranks[rng.choice(num_items, size=size, p=weights / weights.sum())]
+
+
+def generate_dataset(folder: str, num_edges: int, num_users: int = None, num_movies: int = None,
+                     test_fraction: float = 0.1, exponent: float = 2.1, seed: int = 0) -> str:
+    """
+    Writes a synthetic dataset with the structure of the bundled one (movies, directors, genres and ratings
+    of users) and a matching graph_config.yaml. Users and movies have power-law degrees, ratings depend on a
+    quality of the movie and a bias of the user (so that there is something to learn).
+
+    :param folder:          folder of the dataset (created if it does not exist)
+    :param num_edges:       number of ratings (train and test, without the ratings of every value per movie)
+    :param num_users:       number of users (by default num_edges / 20)
+    :param num_movies:      number of movies (by default num_edges / 50)
+    :param test_fraction:   fraction of the ratings used as test data
+    :param exponent:        exponent of the degree distributions
+    :param seed:            seed for reproducibility
+    :return:                path to the config of the dataset
+    """
+
+    logger.trace('generate_dataset(%s, %s, %s, %s, %s, %s, %s)', folder, num_edges, num_users, num_movies,
+                 test_fraction, exponent, seed)
+
+    rng = np.random.default_rng(seed)
+    num_users = num_users or max(num_edges // 20, 10)
+    num_movies = num_movies or max(num_edges // 50, 10)
+    num_directors = max(num_movies // 5, 1)
+    makedirs(folder, exist_ok=True)
+
+    movies = np.arange(1, num_movies + 1)
+    pd.DataFrame({'id': movies, 'title': [f'movie {i}' for i in movies]}) \
+        .to_csv(join(folder, 'movies.csv'), sep=SEPARATOR, index=False)
+    pd.DataFrame({'movieID': movies, 'directorID': power_law_choice(rng, num_directors, num_movies, exponent)}) \
+        .to_csv(join(folder, 'movie_directors.csv'), sep=SEPARATOR, index=False)
+    genres_per_movie = rng.integers(1, 4, size=num_movies)
+    pd.DataFrame({'movieID': np.repeat(movies, genres_per_movie),
+                  'genre': [f'genre_{g}' for g in rng.integers(0, NUM_GENRES, size=genres_per_movie.sum())]}) \
+        .drop_duplicates().to_csv(join(folder, 'movie_genres.csv'), sep=SEPARATOR, index=False)
+
+    users = power_law_choice(rng, num_users, num_edges, exponent) + 1
+    rated = power_law_choice(rng, num_movies, num_edges, exponent) + 1
+    quality = rng.normal(scale=1.0, size=num_movies + 1)
+    bias = rng.normal(scale=0.5, size=num_users + 1)
+    ratings = np.clip(np.rint(3 + quality[rated] + bias[users] + rng.normal(scale=0.5, size=num_edges)),
+                      *RATING_RANGE).astype(np.int64)
+    df = pd.DataFrame({'userID': users, 'movieID': rated, 'rating': ratings})
+
+    # Every movie is rated with every value once in the training data, so that all of its extensions are known
+    # to the model. Test ratings only contain users that also rated movies in the training data.
+    is_test = rng.random(num_edges) < test_fraction
+    values = np.arange(RATING_RANGE[0], RATING_RANGE[1] + 1)
+    seeds = pd.DataFrame({'userID': rng.choice(df['userID'][~is_test].unique(), size=num_movies * len(values)),
+                          'movieID': np.repeat(movies, len(values)), 'rating': np.tile(values, num_movies)})
+    train, test = pd.concat([df[~is_test], seeds], ignore_index=True), df[is_test]
+    test = test[test['userID'].isin(train['userID'])]
+    train.to_csv(join(folder, 'train_user_ratings.csv'), sep=SEPARATOR, index=False)
+    test.to_csv(join(folder, 'test_user_ratings.csv'), sep=SEPARATOR, index=False)
+
+    config = {'data': {'folder': folder, 'separator': SEPARATOR, 'encoding': 'utf-8',
+                       'output_folder': join(folder, 'output', ''),
+                       'objects': {'node_dict': 'node_dict.obj', 'final_graph': 'graph.obj',
+                                   'csr_graph': 'graph_csr'}},
+              'nodes': {'movies': {'source': 'movies.csv', 'column': 'id', 'id_prefix': 'm',
+                                   'extended': {'by': 'ratings', 'range': f'{RATING_RANGE[0]}-{RATING_RANGE[1]}'}},
+                        'directors': {'source': 'movie_directors.csv', 'column': 'directorID', 'id_prefix': 'd'},
+                        'genres': {'source': 'movie_genres.csv', 'column': 'genre'},
+                        'users': {'source': 'train_user_ratings.csv', 'column': 'userID', 'id_prefix': 'u'}},
+              'edges': {'movies_directors': {'source': 'movie_directors.csv',
+                                             'vertex1': {'column': 'movieID', 'type': 'movies'},
+                                             'vertex2': {'column': 'directorID', 'type': 'directors'}},
+                        'movies_genres': {'source': 'movie_genres.csv',
+                                          'vertex1': {'column': 'movieID', 'type': 'movies'},
+                                          'vertex2': {'column': 'genre', 'type': 'genres'}},
+                        'users_ratings': {'source': 'train_user_ratings.csv',
+                                          'vertex1': {'column': 'userID', 'type': 'users'},
+                                          'vertex2': {'column': 'movieID', 'type': 'ratings',
+                                                      'extend_with': 'rating', 'extending': 'movies'}}}}
+    makedirs(config['data']['output_folder'], exist_ok=True)
+    config_path = join(folder, 'graph_config.yaml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+    logger.info(f'generated {len(train)} train and {len(test)} test ratings of {num_users} users and '
+                f'{num_movies} movies in {folder}')
+    return config_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic dataset and its graph config')
+    parser.add_argument('-f', '--folder', default='./output/synthetic/', type=str, help='Folder of the dataset')
+    parser.add_argument('-e', '--edges', default=100_000, type=float, help='Number of ratings (e.g. 1e6)')
+    parser.add_argument('-u', '--users', default=None, type=int, help='Number of users (default: edges / 20)')
+    parser.add_argument('-m', '--movies', default=None, type=int, help='Number of movies (default: edges / 50)')
+    parser.add_argument('-tf', '--test-fraction', default=0.1, type=float, help='Fraction of ratings used for testing')
+    parser.add_argument('-x', '--exponent', default=2.1, type=float, help='Exponent of the degree distributions')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='Random seed for reproducibility')
+    args = parser.parse_args()
+    configure_logging()
+
+    print(generate_dataset(folder=args.folder, num_edges=int(args.edges), num_users=args.users,
+                           num_movies=args.movies, test_fraction=args.test_fraction, exponent=args.exponent,
+                           seed=args.seed))
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,14 +1,32 @@
 import logging
-import logging.config
 
-from yaml import safe_load
+from os.path import dirname, join
 from rec2vec.util.logger import addLoggingLevel
 
+CONFIG_DIR = join(dirname(__file__), 'configs')                 # configurations shipped with the package
+LOGGER_CONFIG_PATH = join(CONFIG_DIR, 'logger.yaml')
+GRAPH_CONFIG_PATH = join(CONFIG_DIR, 'graph_config.yaml')
 
-with open('./rec2vec/configs/logger.yaml') as f:
-    config = safe_load(f)
-
-logging.config.dictConfig(config=config)
 addLoggingLevel(level_name='TRACE', level_num=logging.DEBUG - 5)
 logger = logging.getLogger('rec2vec:logger')
-logger.setLevel("TRACE")
+
+
+def configure_logging(path: str = LOGGER_CONFIG_PATH) -> None:
+    """
+    Configures logging from a yaml file (by default the configuration shipped with the package).
+    Importing rec2vec does not touch the logging configuration of the application; scripts call this function
+    once after parsing their arguments.
+
+    :param path:    path to the logging configuration
+    :return:
+    """
+
+    import logging.config
+    from yaml import safe_load
+
+    with open(path) as f:
+        config = safe_load(f)
+
+    # The loggers of rec2vec exist as soon as its modules are imported, they must not be disabled
+    config.setdefault('disable_existing_loggers', False)
+    logging.config.dictConfig(config=config)
@@ -0,0 +1,218 @@
+from typing import TYPE_CHECKING
+from rec2vec.predict.prediction_data_loader import extract_suffix_and_prefix_from_extended_node
+from rec2vec import logger
+
+import numpy as np
+import pandas as pd
+import weakref
+
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+    from rec2vec.util.id_registry import IdRegistry
+
+CANDIDATES_SUFFIX = '.candidates.npz'   # candidate tables are stored next to the model, e.g. rec2vec.obj.candidates.npz
+
+_vocabulary_indexes = weakref.WeakKeyDictionary()  # index of the vocabulary (keys -> positions), by KeyedVectors
+
+
+def _vocabulary_index(model: 'Word2Vec') -> pd.Index:
+    """
+    Returns an index of a model's vocabulary. The index is cached until the vocabulary changes.
+
+    :param model:   trained model
+    :return:        index mapping keys to their position in the vocabulary
+    """
+
+    keys = model.wv.index_to_key
+    cached = _vocabulary_indexes.get(model.wv)
+    if cached is None or cached[0] is not keys or len(cached[1]) != len(keys):
+        cached = keys, pd.Index(keys)
+        _vocabulary_indexes[model.wv] = cached
+    return cached[1]
+
+
+def lookup_indices(model: 'Word2Vec', keys: np.ndarray, strict: bool = True, positional: bool = True) -> np.ndarray:
+    """
+    Looks up the indices of keys in a model's vocabulary, following the rules of KeyedVectors.get_index():
+    integer keys that are not part of the vocabulary are used as indices themselves (if they are in range).
+
+    :param model:       trained model
+    :param keys:        array of keys (unique ids)
+    :param strict:      whether to raise a KeyError for unknown keys (otherwise their index is -1)
+    :param positional:  whether unknown integer keys are used as indices (otherwise only keys of the vocabulary)
+    :return:            array of indices (same shape as keys)
+    """
+
+    flat = keys.ravel()
+    indices = _vocabulary_index(model=model).get_indexer(flat)
+
+    missing = indices < 0
+    if positional and missing.any() and np.issubdtype(flat.dtype, np.integer):
+        positional = missing & (flat >= 0) & (flat < len(model.wv.index_to_key))
+        indices[positional] = flat[positional]
+        missing &= ~positional
+    if strict and missing.any():
+        raise KeyError(f"Key '{flat[np.argmax(missing)]}' not present")
+
+    return indices.reshape(keys.shape)
+
+
+def unit_vectors(vectors: np.ndarray) -> np.ndarray:
+    """
+    Normalizes vectors to unit length along the last axis. Zero vectors stay zero (like gensim's unitvec()).
+
+    :param vectors: array of vectors
+    :return:        array of normalized vectors
+    """
+
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class CandidateTable:
+    """
+    A CandidateTable holds the candidates of every item of an extended node type, e.g. the ratings 0-5 of every movie.
+    - item_keys:    generated ids of the items (e.g. 'm_932'), row i belongs to item_keys[i]
+    - ids:          (n_items, k) unique ids of the candidates (e.g. the ids of m_932_0, ..., m_932_5), -1 if unknown
+    - vectors:      (n_items, k, dim) normalized vectors of the candidates
+
+    Predictions look up the row of each item once and index into ids and vectors directly, no ids are generated.
+    """
+
+    ARRAYS = ('item_keys', 'ids', 'vectors', 'suffix')
+
+    def __init__(self, node_type: str, target_node_type: str, suffix: np.ndarray, item_keys: np.ndarray,
+                 ids: np.ndarray, vectors: np.ndarray):
+        self.node_type = node_type
+        self.target_node_type = target_node_type
+        self.suffix = suffix
+        self.item_keys = item_keys
+        self.ids = ids
+        self.vectors = vectors
+        self._index = pd.Index(item_keys)
+
+    def find(self, item_keys: list[str]) -> np.ndarray:
+        """
+        Returns the rows of items, -1 for items that (or whose candidates) are unknown.
+
+        :param item_keys:   generated ids of the items (e.g. 'm_932')
+        :return:            row of each item
+        """
+
+        rows = self._index.get_indexer(item_keys)
+        known = rows >= 0
+        known[known] = (self.ids[rows[known]] >= 0).all(axis=1)
+        rows[~known] = -1
+        return rows
+
+    def rows(self, item_keys: list[str]) -> np.ndarray:
+        """
+        Returns the rows of items. Raises a KeyError if an item (or one of its candidates) is unknown.
+
+        :param item_keys:   generated ids of the items (e.g. 'm_932')
+        :return:            row of each item
+        """
+
+        logger.trace('rows(%s)', len(item_keys))
+
+        rows = self.find(item_keys=item_keys)
+        if (rows < 0).any():
+            raise KeyError(f"Item '{item_keys[np.argmax(rows < 0)]}' has no candidates")
+        return rows
+
+
+def build_candidate_table(config: dict, node_dict: 'IdRegistry', model: 'Word2Vec', node_type: str) -> CandidateTable:
+    """
+    Builds the candidate table of an extended node type (see nodes.<type>.extended in the configuration).
+
+    :param config:      configuration of the graph
+    :param node_dict:   registry mapping original ids to unique ids
+    :param model:       trained model
+    :param node_type:   extended node type (e.g. movies)
+    :return:            candidate table
+    """
+
+    logger.trace('build_candidate_table(%s, %s, %s)', config, model, node_type)
+
+    target_node_type = config['nodes'][node_type]['extended']['by']
+    suffix, _ = extract_suffix_and_prefix_from_extended_node(config=config, target_node_type=target_node_type,
+                                                             node_type=node_type)
+
+    # The ids of the extensions are computed from the ids of the items (see IdRegistry)
+    item_keys = node_dict.generated_ids(node_type=node_type)
+    offsets = node_dict.extension_offsets(node_type=node_type, suffixes=suffix)
+    ids = np.where(offsets >= 0, node_dict.unique_ids(node_type=node_type)[:, None] + offsets, -1)
+
+    # Candidates that are unknown to the model are marked as unknown as well
+    indices = lookup_indices(model=model, keys=ids, strict=False)
+    ids[indices < 0] = -1
+    vectors = unit_vectors(model.wv.vectors[np.maximum(indices, 0)])
+    vectors[indices < 0] = 0
+
+    return CandidateTable(node_type=node_type, target_node_type=target_node_type, suffix=np.array(suffix, dtype=str),
+                          item_keys=item_keys, ids=ids, vectors=vectors)
+
+
+def build_candidate_tables(config: dict, node_dict: 'IdRegistry', model: 'Word2Vec') -> dict[str, CandidateTable]:
+    """
+    Builds the candidate tables of all extended node types.
+
+    :param config:      configuration of the graph
+    :param node_dict:   registry mapping original ids to unique ids
+    :param model:       trained model
+    :return:            candidate tables by target node type (e.g. ratings)
+    """
+
+    logger.trace('build_candidate_tables(%s, %s)', config, model)
+
+    tables = [build_candidate_table(config=config, node_dict=node_dict, model=model, node_type=node_type)
+              for node_type in config['nodes'] if 'extended' in config['nodes'][node_type]]
+    return {table.target_node_type: table for table in tables}
+
+
+def get_candidates_path(model_path: str) -> str:
+    """
+    Returns the path of the candidate tables that belong to a model.
+
+    :param model_path:  path to the (pickled) model
+    :return:            path to the candidate tables
+    """
+
+    return model_path + CANDIDATES_SUFFIX
+
+
+def save_candidates(path: str, tables: dict[str, CandidateTable]) -> None:
+    """
+    Stores candidate tables in one .npz file.
+
+    :param path:    path to the file
+    :param tables:  candidate tables by target node type
+    :return:
+    """
+
+    logger.trace('save_candidates(%s, %s)', path, list(tables))
+
+    arrays = {'target_node_types': np.array(list(tables), dtype=str),
+              'node_types': np.array([table.node_type for table in tables.values()], dtype=str)}
+    for i, table in enumerate(tables.values()):
+        arrays.update({f'{name}_{i}': getattr(table, name) for name in CandidateTable.ARRAYS})
+
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_candidates(path: str) -> dict[str, CandidateTable]:
+    """
+    Loads candidate tables stored by save_candidates().
+
+    :param path:    path to the file
+    :return:        candidate tables by target node type
+    """
+
+    logger.trace('load_candidates(%s)', path)
+
+    with np.load(path) as arrays:
+        return {target: CandidateTable(node_type=node_type, target_node_type=target,
+                                       **{name: arrays[f'{name}_{i}'] for name in CandidateTable.ARRAYS})
+                for i, (target, node_type) in enumerate(zip(arrays['target_node_types'].tolist(),
+                                                            arrays['node_types'].tolist()))}
@@ -1,7 +1,12 @@
+from typing import TYPE_CHECKING
 from rec2vec import logger
 
+import numpy as np
 import pandas as pd
 
+if TYPE_CHECKING:
+    from rec2vec.util.id_registry import IdRegistry
+
 
 def get_node_prefix(config: dict, node_type: str) -> str:
     """
@@ -13,7 +18,7 @@ def get_node_prefix(config: dict, node_type: str) -> str:
     :return:            prefix of this node type
     """
 
-    logger.trace(f'get_node_prefix({config}, {node_type})')
+    logger.trace('get_node_prefix(%s, %s)', config, node_type)
 
     return config['nodes'][node_type]['id_prefix'] + '_' if 'id_prefix' in config['nodes'][node_type] else ''
 
@@ -29,7 +34,7 @@ def extract_suffix_and_prefix_from_extended_node(config: dict, target_node_type:
     :return:
     """
 
-    logger.trace(f'extract_suffix_and_prefix_from_extended_node({config}, {target_node_type}, {node_type})')
+    logger.trace('extract_suffix_and_prefix_from_extended_node(%s, %s, %s)', config, target_node_type, node_type)
 
     suffix, target_prefix = None, None
 
@@ -47,13 +52,118 @@ def extract_suffix_and_prefix_from_extended_node(config: dict, target_node_type:
     return suffix, target_prefix
 
 
-def create_x_and_y(config: dict, node_dict: dict, predictor_columns_list: list, suffix: list[str],
+class UnknownIdsError(KeyError):
+    """
+    Raised if ids of the data cannot be found in the node dictionary. Unlike a plain KeyError, it reports all
+    unknown ids at once (by node type).
+    """
+
+    def __init__(self, missing: dict[str, list[str]]):
+        self.missing = missing
+        examples = '; '.join(f'{node_type}: {ids[:5]}' for node_type, ids in missing.items())
+        super().__init__(f'{sum(len(ids) for ids in missing.values())} unknown ids ({examples})')
+
+
+def get_prefix_index(config: dict) -> dict[str, str]:
+    """
+    Returns the node type of every id prefix (including the underscore). E.g. m_ -> movies
+
+    :param config:  dictionary, containing the graph configuration
+    :return:        node type by prefix
+    """
+
+    logger.trace('get_prefix_index(%s)', config)
+
+    return {get_node_prefix(config, node_type): node_type
+            for node_type in config['nodes'] if 'id_prefix' in config['nodes'][node_type]}
+
+
+def _get_column_node_type(column: pd.Series, prefix_index: dict[str, str]) -> str | None:
+    """
+    Identifies the node type of a column by the prefix of its values (the longest matching prefix wins).
+
+    :param column:          column of generated ids (e.g. m_932)
+    :param prefix_index:    node type by prefix (see get_prefix_index())
+    :return:                node type or None if no prefix matches
+    """
+
+    first = str(column.iloc[0]) if len(column) else ''
+    matches = [prefix for prefix in prefix_index if first.startswith(prefix)]
+    return prefix_index[max(matches, key=len)] if matches else None
+
+
+def _map_ids(values: pd.Series, unique_ids: np.ndarray, node_type: str, missing: dict[str, list[str]],
+             suffix: str = None) -> pd.Series:
+    """
+    Combines generated ids with their unique ids (as looked up in the node registry, see IdRegistry.lookup()).
+    Unknown ids are collected instead of raising an error.
+
+    :param values:      generated ids
+    :param unique_ids:  unique id of each generated id (-1 for unknown ids)
+    :param node_type:   node type of the ids
+    :param missing:     unknown ids by node type (updated)
+    :param suffix:      suffix of the generated ids that is not part of the values (e.g. rating), if any
+    :return:            unique ids (NaN for unknown ids)
+    """
+
+    mapped = pd.Series(unique_ids, index=values.index)
+    unknown = values[mapped < 0]
+    if len(unknown):
+        unknown = unknown if suffix is None else unknown + '_' + suffix
+        missing.setdefault(node_type, []).extend(unknown.unique().tolist())
+    return mapped.where(mapped >= 0)
+
+
+def _split_columns(config: dict, predictor_columns_list: list, target_prefix: str) \
+        -> tuple[list[tuple[str, pd.Series]], pd.Series | None]:
+    """
+    Separates the columns of the target's items (identified by the target prefix) from the predictor columns.
+
+    :param config:                  dictionary configuring the graph
+    :param predictor_columns_list:  list of columns used for predictions
+    :param target_prefix:           prefix of the items that are extended by the target node
+    :return:                        node type and values of each predictor column, item column (if any)
+    """
+
+    prefix_index = get_prefix_index(config)
+    item_type = prefix_index.get(target_prefix + '_') if target_prefix is not None else None
+
+    predictors, items = [], None
+    for column in predictor_columns_list:
+        column = pd.Series(column, dtype=object) if not isinstance(column, pd.Series) else column
+        node_type = _get_column_node_type(column=column, prefix_index=prefix_index)
+        if node_type is not None and node_type == item_type:
+            items = column
+        elif node_type is not None:
+            predictors.append((node_type, column))
+
+    return predictors, items
+
+
+def _map_predictors(node_dict: 'IdRegistry', predictors: list[tuple[str, pd.Series]],
+                    missing: dict[str, list[str]]) -> pd.Series:
+    """
+    Maps the predictor columns to unique ids (all columns concatenated).
+
+    :param node_dict:   registry mapping original ids to unique ids
+    :param predictors:  node type and values of each predictor column
+    :param missing:     unknown ids by node type (updated)
+    :return:            unique ids of the predictors
+    """
+
+    mapped = [_map_ids(values=column, unique_ids=node_dict.lookup(node_type=node_type, keys=column),
+                       node_type=node_type, missing=missing) for node_type, column in predictors]
+    return pd.concat(mapped, ignore_index=True) if mapped else pd.Series([], dtype=object)
+
+
+def create_x_and_y(config: dict, node_dict: 'IdRegistry', predictor_columns_list: list, suffix: list[str],
                    target_node_type: str, target_prefix) -> tuple[list[list[str]], list[list]]:
     """
-    Creates lists of data that can be used for predictions.
+    Creates lists of data that can be used for predictions. Columns are identified by the prefix of their ids,
+    ids are mapped to unique ids column by column. The input is not changed.
 
     :param config:                  dictionary configuring the graph
-    :param node_dict:               dictionary mapping original ids to unique ids
+    :param node_dict:               registry mapping original ids to unique ids
     :param predictor_columns_list:  list of columns used for predictions
     :param suffix:                  list of extensions of target node
     :param target_node_type:        type of target node
@@ -61,33 +171,57 @@ def create_x_and_y(config: dict, node_dict: dict, predictor_columns_list: list,
     :return:                        lists with same length, for each predictor there x possible targets
     """
 
-    logger.trace(f'create_x_and_y({config}, {node_dict}, {predictor_columns_list}, {suffix}, {target_node_type}, '
-                 f'{target_prefix})')
+    logger.trace('create_x_and_y(%s, %s, %s, %s, %s, %s)', config, node_dict, predictor_columns_list, suffix,
+                 target_node_type, target_prefix)
 
-    target_list_id, predictor_list_id = [], []
+    predictors, items = _split_columns(config=config, predictor_columns_list=predictor_columns_list,
+                                       target_prefix=target_prefix)
+    missing = {}
 
-    # For every variable...
-    for column in predictor_columns_list:
+    # Unique ids of all extensions of each item, one column per extension (computed from the ids of the items)
+    target_columns = []
+    if items is not None:
+        item_type = get_prefix_index(config)[target_prefix + '_']
+        target_columns = [_map_ids(values=items, unique_ids=node_dict.lookup_extension(node_type=item_type, keys=items,
+                                                                                       suffixes=[i] * len(items)),
+                                   node_type=target_node_type, missing=missing, suffix=i) for i in suffix]
+    predictor_ids = _map_predictors(node_dict=node_dict, predictors=predictors, missing=missing)
 
-        # If it's a target variable, add it to the target list (identify target by prefix)
-        if column[0].startswith(target_prefix + '_'):
-            for row in column:
-                target_list_id.append([node_dict[target_node_type][row + '_' + i] for i in suffix])
-            predictor_columns_list.remove(column)
+    if missing:
+        raise UnknownIdsError(missing=missing)
 
-        # If it's a predictor variable, add it to the predictor list
-        else:
-            for node in config['nodes']:
-                if 'id_prefix' in config['nodes'][node]:
-                    if column[0].startswith(config['nodes'][node]['id_prefix'] + '_'):
-                        for row in column:
-                            predictor_list_id.append(node_dict[node][row])
+    target_list_id = pd.concat(target_columns, axis=1).astype('int64').values.tolist() if target_columns else []
+    return predictor_ids.astype('int64').tolist(), target_list_id
 
-    return predictor_list_id, target_list_id
+
+def create_x_and_items(config: dict, node_dict: 'IdRegistry', predictor_columns_list: list, target_prefix: str) \
+        -> tuple[list, list[str]]:
+    """
+    Creates lists of data that can be used for predictions with a candidate table. Unlike create_x_and_y(),
+    the targets are not extended, the generated ids of the items are returned instead (e.g. m_932).
+
+    :param config:                  dictionary configuring the graph
+    :param node_dict:               registry mapping original ids to unique ids
+    :param predictor_columns_list:  list of columns used for predictions
+    :param target_prefix:           prefix of the items that are extended by the target node
+    :return:                        lists with same length, unique ids of the predictors and generated ids of the items
+    """
+
+    logger.trace('create_x_and_items(%s, %s, %s, %s)', config, node_dict, predictor_columns_list, target_prefix)
+
+    predictors, items = _split_columns(config=config, predictor_columns_list=predictor_columns_list,
+                                       target_prefix=target_prefix)
+    missing = {}
+    predictor_ids = _map_predictors(node_dict=node_dict, predictors=predictors, missing=missing)
+
+    if missing:
+        raise UnknownIdsError(missing=missing)
+
+    return predictor_ids.astype('int64').tolist(), [] if items is None else items.tolist()
 
 
 def get_predictor_column_list(config: dict, df: pd.DataFrame, predictor_variable: str, target_variable: str) \
-        -> tuple[list[list[str]], list[str], str, str, str]:
+        -> tuple[list[pd.Series], list[str], str, str, str]:
     """
     Extracts columns, suffix and target properties from config and dataframe.
     It is important that the user input has the format:
@@ -101,7 +235,7 @@ def get_predictor_column_list(config: dict, df: pd.DataFrame, predictor_variable
     :return:                    columns, suffix and target properties from config and dataframe
     """
 
-    logger.trace(f'get_predictor_column_list({config}, {df}, {predictor_variable}, {target_variable})')
+    logger.trace('get_predictor_column_list(%s, %s, %s, %s)', config, df, predictor_variable, target_variable)
 
     # Parse user input for predictor variable
     predictor_input = predictor_variable
@@ -123,12 +257,9 @@ def get_predictor_column_list(config: dict, df: pd.DataFrame, predictor_variable
         suffix, target_prefix = extract_suffix_and_prefix_from_extended_node(config=config, target_node_type=target_node_type, node_type=var[0])
         prefix = get_node_prefix(config, var[0])
 
-        # Manipulates original IDs by adding prefixes, so that they can be found in the node dictionary (node_dict)
-        df[var[1]] = [prefix + str(row) for row in df[var[1]]]
-
-        # Add the new values to the list
-        predictor_ids = df[var[1]].to_list()
-        predictor_columns_list.append(predictor_ids)
+        # Add prefixes to the original IDs, so that they can be found in the node dictionary (node_dict)
+        # The data frame itself is not changed
+        predictor_columns_list.append(prefix + df[var[1]].astype(str))
 
     # Return extracted information of interest, used for predictions
     return predictor_columns_list, suffix, target_column, target_node_type, target_prefix
\ No newline at end of file
@@ -1,11 +1,21 @@
+from typing import TYPE_CHECKING
+import numpy as np
 import pandas as pd
-from gensim.models import Word2Vec
 from tqdm import tqdm
 from rec2vec.predict import prediction_data_loader
+from rec2vec.predict.candidates import CandidateTable, lookup_indices, unit_vectors
+from rec2vec.util.profiling import profiled
 from rec2vec import logger
 
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+    from rec2vec.util.id_registry import IdRegistry
 
-def predict(model: Word2Vec, predictor: str, target_seq: list[str]) -> int:
+MEMORY_BUDGET = 2 ** 28     # maximum number of bytes used for the target vectors of one batch
+TIE_TOLERANCE = 1e-4        # similarities closer than this are compared exactly (see predict_batch())
+
+
+def predict(model: 'Word2Vec', predictor: str, target_seq: list[str]) -> int:
     """
     Predicts the best fitting node for a predictor, given a target sequence.
     A predictor could be the user id and a target sequence could be a list of possible ratings for an item.
@@ -24,7 +34,7 @@ def predict(model: Word2Vec, predictor: str, target_seq: list[str]) -> int:
     :return:            index of target with maximum similarity
     """
 
-    logger.trace(f'predict_variable({model}, {predictor}, {target_seq})')
+    logger.trace('predict_variable(%s, %s, %s)', model, predictor, target_seq)
 
     # Initialization, those values should not be returned and have to be overriden
     max_similarity = float('-inf')
@@ -40,8 +50,102 @@ def predict(model: Word2Vec, predictor: str, target_seq: list[str]) -> int:
     return result
 
 
-def predict_from_data(config: dict, df: pd.DataFrame, model: Word2Vec, node_dict: dict,
-                      predictor_variable: str, target_variable: str) -> tuple[list[int], str, list[str]]:
+def _argmax_similarity(model: 'Word2Vec', predictors: list, num_targets: int, target_vectors, target_seq,
+                       memory_budget: int = MEMORY_BUDGET) -> list[int]:
+    """
+    Computes the index of the most similar target for every row, batch by batch. Within a batch, all similarities
+    are computed as one matrix product of the normalized predictor vectors (rows, dim) and target vectors
+    (rows, k, dim).
+
+    Batched and pairwise products may differ in the last bits. Rows whose two most similar targets are closer
+    than TIE_TOLERANCE are therefore recomputed with predict(), so that near-ties are broken exactly the same way.
+
+    :param model:           trained model
+    :param predictors:      predictor of each row
+    :param num_targets:     number of targets per row (k)
+    :param target_vectors:  function returning the normalized target vectors of a batch (slice of rows)
+    :param target_seq:      function returning the targets of a row (used to recompute near-ties)
+    :param memory_budget:   maximum number of bytes used for the target vectors of one batch
+    :return:                index of the target with maximum similarity, for each row
+    """
+
+    logger.trace('_argmax_similarity(%s, %s, %s, %s)', model, len(predictors), num_targets, memory_budget)
+
+    if len(predictors) == 0:
+        return []
+    if num_targets == 0:
+        return [-1] * len(predictors)
+
+    predictor_indices = lookup_indices(model=model, keys=np.asarray(predictors))
+    vectors = model.wv.vectors
+    batch_size = max(1, memory_budget // (num_targets * vectors.shape[1] * vectors.itemsize))
+
+    result = np.empty(len(predictors), dtype=np.int64)
+    for start in tqdm(range(0, len(predictors), batch_size), disable=len(predictors) <= batch_size):
+        batch = slice(start, start + batch_size)
+        predictor_vectors = unit_vectors(vectors[predictor_indices[batch]])
+        similarities = np.matmul(target_vectors(batch), predictor_vectors[:, :, None])[:, :, 0]
+        result[batch] = np.argmax(similarities, axis=1)
+
+        # Recompute near-ties exactly
+        if num_targets > 1:
+            top_two = -np.partition(-similarities, 1, axis=1)[:, :2]
+            for row in np.flatnonzero(top_two[:, 0] - top_two[:, 1] < TIE_TOLERANCE) + start:
+                result[row] = predict(model=model, predictor=predictors[row], target_seq=target_seq(row))
+
+    return result.tolist()
+
+
+def predict_batch(model: 'Word2Vec', predictors: list, target_seqs: list[list],
+                  memory_budget: int = MEMORY_BUDGET) -> list[int]:
+    """
+    Predicts the best fitting target for many predictors at once and returns exactly what predict() returns
+    for every row. Instead of calling wv.similarity() once per pair, the vectors of a batch of rows are
+    gathered into a (rows, k, dim) array and all similarities are computed as one matrix product.
+
+    :param model:           trained model
+    :param predictors:      predictor of each row
+    :param target_seqs:     possible targets of each row (every row has the same number of targets)
+    :param memory_budget:   maximum number of bytes used for the target vectors of one batch
+    :return:                index of the target with maximum similarity, for each row
+    """
+
+    logger.trace('predict_batch(%s, %s, %s, %s)', model, len(predictors), len(target_seqs), memory_budget)
+
+    target_indices = lookup_indices(model=model, keys=np.asarray(target_seqs)) if target_seqs else None
+    return _argmax_similarity(model=model, predictors=predictors,
+                              num_targets=0 if target_indices is None else target_indices.shape[1],
+                              target_vectors=lambda batch: unit_vectors(model.wv.vectors[target_indices[batch]]),
+                              target_seq=lambda row: target_seqs[row], memory_budget=memory_budget)
+
+
+def predict_with_candidates(model: 'Word2Vec', predictors: list, items: list[str], candidates: CandidateTable,
+                            memory_budget: int = MEMORY_BUDGET) -> list[int]:
+    """
+    Predicts the best fitting candidate (e.g. rating) of an item for many predictors at once, using a precomputed
+    candidate table instead of looking up the extensions of every item. Returns exactly what predict() returns.
+
+    :param model:           trained model
+    :param predictors:      predictor of each row
+    :param items:           generated id of the item of each row (e.g. 'm_932')
+    :param candidates:      candidate table of the item's node type (see candidates.build_candidate_table())
+    :param memory_budget:   maximum number of bytes used for the target vectors of one batch
+    :return:                index of the candidate with maximum similarity, for each row
+    """
+
+    logger.trace('predict_with_candidates(%s, %s, %s, %s)', model, len(predictors), len(items), memory_budget)
+
+    rows = candidates.rows(item_keys=items)
+    return _argmax_similarity(model=model, predictors=predictors, num_targets=candidates.ids.shape[1],
+                              target_vectors=lambda batch: candidates.vectors[rows[batch]],
+                              target_seq=lambda row: candidates.ids[rows[row]].tolist(),
+                              memory_budget=memory_budget)
+
+
+@profiled('prediction')
+def predict_from_data(config: dict, df: pd.DataFrame, model: 'Word2Vec', node_dict: 'IdRegistry',
+                      predictor_variable: str, target_variable: str,
+                      candidates: dict[str, CandidateTable] = None) -> tuple[list[int], str, list[str]]:
     """
     Computes most similar node of the target (usually an extension) to the predictor node. Usually, the target
     is a rating which extends an item, meaning it is a numeric range encoded as node for each node representing an item.
@@ -50,14 +154,16 @@ def predict_from_data(config: dict, df: pd.DataFrame, model: Word2Vec, node_dict
 
     :param config:              dictionary containing graph configuration
     :param df:                  data frame containing columns of interest
-    :param model:               trained Word2Vec model
-    :param node_dict:           dictionary mapping original ids to unique ids
+    :param model:               trained Word2Vec model (or its exported vectors, see mapped_vectors.MappedVectors)
+    :param node_dict:           registry mapping original ids to unique ids
     :param predictor_variable:  node type whose similarity to each target should be predicted
     :param target_variable:     node type which forms the possible ratings
+    :param candidates:          precomputed candidate tables by target node type (see candidates.load_candidates())
     :return:                    predictions, transformed target values, suffix for extended target nodes
     """
 
-    logger.trace(f'predict_from_data({config}, {df}, {model}, {node_dict}, {predictor_variable}, {target_variable})')
+    logger.trace('predict_from_data(%s, %s, %s, %s, %s, %s, %s)', config, df, model, node_dict, predictor_variable,
+                 target_variable, None if candidates is None else list(candidates))
 
     # Parse user input to get node types and relevant columns for predictions
     predictor_columns_list, suffix, target_column, target_node_type, target_prefix = \
@@ -65,16 +171,21 @@ def predict_from_data(config: dict, df: pd.DataFrame, model: Word2Vec, node_dict
                                                          predictor_variable=predictor_variable,
                                                          target_variable=target_variable)
 
+    # With a candidate table, the extensions of each item are looked up in the table
+    if candidates is not None and target_node_type in candidates:
+        predictor_list, item_list = prediction_data_loader.create_x_and_items(config, node_dict,
+                                                                              predictor_columns_list, target_prefix)
+        y_prediction = predict_with_candidates(model=model, predictors=predictor_list, items=item_list,
+                                               candidates=candidates[target_node_type])
+        return y_prediction, target_column, suffix
+
     # Construct x and y for prediction
     # x... unique IDs of predictor variable
     # y... unique IDs of extended target variable
     predictor_list, target_list = prediction_data_loader.create_x_and_y(config, node_dict, predictor_columns_list,
                                                                         suffix, target_node_type, target_prefix)
 
-    # data_rows = [[target1_1, target1_2, target1_3, ...], [predictor1, predictor2, ...]]
-    data_rows = zip(target_list, predictor_list)
-    y_prediction = [predict(model=model,
-                            target_seq=target,
-                            predictor=predictor) for target, predictor in tqdm(data_rows)]
+    # Score all rows [predictor, [target1, target2, ...]] in batches
+    y_prediction = predict_batch(model=model, predictors=predictor_list, target_seqs=target_list)
 
     return y_prediction, target_column, suffix
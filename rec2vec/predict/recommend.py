@@ -0,0 +1,295 @@
+from typing import TYPE_CHECKING
+from rec2vec.predict.candidates import lookup_indices, unit_vectors
+from rec2vec.predict.prediction_data_loader import get_node_prefix
+from rec2vec import logger
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+    from rec2vec.util.id_registry import IdRegistry
+
+ASSIGN_BATCH_SIZE = 2 ** 14     # number of vectors assigned to their clusters at once (bounds memory while clustering)
+
+
+def _gather_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Returns the positions of several ranges as one array, e.g. starts [0, 10], lengths [2, 3] -> [0, 1, 10, 11, 12].
+
+    :param starts:  first position of each range
+    :param lengths: length of each range
+    :return:        concatenated positions
+    """
+
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+def _top_n(scores: np.ndarray, n: int) -> np.ndarray:
+    """
+    Returns the positions of the n highest scores, ordered by descending score (ties by position).
+
+    :param scores:  array of scores
+    :param n:       number of positions to be returned
+    :return:        positions of the highest scores
+    """
+
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if n < len(scores):
+        candidates = np.argpartition(-scores, n - 1)[:n]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+class VectorIndex:
+    """
+    A VectorIndex finds the vectors that are most similar (cosine similarity) to a query. It is an inverted file
+    (IVF) index: the vectors are clustered with (spherical) k-means and every cluster keeps a list of its members.
+    A search only compares the query to the clusters' centroids and the members of the num_probe closest clusters.
+    The candidates found this way are re-ranked with their exact similarity.
+    - vectors:      (n, dim) normalized vectors
+    - centroids:    (num_lists, dim) normalized centroids of the clusters
+    - offsets:      members of cluster c are members[offsets[c]:offsets[c + 1]]
+    - members:      positions of the vectors, grouped by cluster
+    """
+
+    ARRAYS = ('vectors', 'centroids', 'offsets', 'members')
+
+    def __init__(self, vectors: np.ndarray, centroids: np.ndarray, offsets: np.ndarray, members: np.ndarray):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.members = members
+
+    @property
+    def num_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, num_lists: int = None, iterations: int = 10, seed: int = 0) -> 'VectorIndex':
+        """
+        Clusters vectors with k-means and builds the index.
+
+        :param vectors:     (n, dim) vectors (normalized by the index)
+        :param num_lists:   number of clusters (by default: square root of n)
+        :param iterations:  number of k-means iterations
+        :param seed:        seed for the initial centroids
+        :return:            index
+        """
+
+        logger.trace('build(%s, %s, %s, %s)', vectors.shape, num_lists, iterations, seed)
+
+        vectors = unit_vectors(np.asarray(vectors, dtype=np.float32))
+        if num_lists is None:
+            num_lists = max(1, int(np.sqrt(len(vectors))))
+        num_lists = max(1, min(num_lists, len(vectors)))
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), size=num_lists, replace=False)] if len(vectors) else \
+            np.zeros((1, vectors.shape[1]), dtype=np.float32)
+
+        # Without vectors, the index has one empty cluster (searches return nothing)
+        for _ in range(iterations if len(vectors) else 0):
+            assignments = cls._assign(vectors=vectors, centroids=centroids)
+            order = np.argsort(assignments, kind='stable')
+            clusters, starts, counts = np.unique(assignments[order], return_index=True, return_counts=True)
+
+            # Move centroids to the (normalized) mean of their members, empty clusters restart at a random vector
+            sums = np.add.reduceat(vectors[order], starts, axis=0)
+            centroids[clusters] = unit_vectors(sums / counts[:, None])
+            empty = np.setdiff1d(np.arange(num_lists), clusters)
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty))]
+
+        assignments = cls._assign(vectors=vectors, centroids=centroids)
+        members = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=num_lists))))
+        return cls(vectors=vectors, centroids=centroids, offsets=offsets, members=members)
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """
+        Assigns every vector to its closest centroid.
+
+        :param vectors:     (n, dim) normalized vectors
+        :param centroids:   (num_lists, dim) normalized centroids
+        :return:            cluster of each vector
+        """
+
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+            batch = slice(start, start + ASSIGN_BATCH_SIZE)
+            assignments[batch] = np.argmax(vectors[batch] @ centroids.T, axis=1)
+        return assignments
+
+    def search(self, query: np.ndarray, n: int = 10, num_probe: int = 16,
+               exclude: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the (approximately) n most similar vectors to a query.
+
+        :param query:       query vector
+        :param n:           number of results
+        :param num_probe:   number of clusters searched (more clusters: higher recall, slower)
+        :param exclude:     positions of vectors that must not be returned
+        :return:            positions of the most similar vectors (descending similarity) and their similarity
+        """
+
+        query = unit_vectors(np.asarray(query, dtype=np.float32))
+        probe = _top_n(self.centroids @ query, min(num_probe, self.num_lists))
+        starts = self.offsets[probe]
+        candidates = self.members[_gather_ranges(starts=starts, lengths=self.offsets[probe + 1] - starts)]
+        return self._rank(query=query, candidates=candidates, n=n, exclude=exclude)
+
+    def search_exact(self, query: np.ndarray, n: int = 10, exclude: np.ndarray = None) \
+            -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the n most similar vectors to a query by comparing it to every vector (brute force).
+
+        :param query:   query vector
+        :param n:       number of results
+        :param exclude: positions of vectors that must not be returned
+        :return:        positions of the most similar vectors (descending similarity) and their similarity
+        """
+
+        query = unit_vectors(np.asarray(query, dtype=np.float32))
+        return self._rank(query=query, candidates=np.arange(len(self.vectors)), n=n, exclude=exclude)
+
+    def _rank(self, query: np.ndarray, candidates: np.ndarray, n: int,
+              exclude: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Ranks candidates by their exact similarity to a (normalized) query.
+
+        :param query:       normalized query vector
+        :param candidates:  positions of the candidates
+        :param n:           number of results
+        :param exclude:     positions of vectors that must not be returned
+        :return:            positions of the most similar candidates and their similarity
+        """
+
+        if exclude is not None and len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        scores = self.vectors[candidates] @ query
+        top = _top_n(scores, n)
+        return candidates[top], scores[top]
+
+
+class Recommender:
+    """
+    A Recommender returns the top-n items (e.g. movies) for a user. Only nodes of the item type are indexed,
+    so that other node types (directors, genres, rating extensions, ...) are never recommended. Users and
+    items are identified by their original ids (e.g. userID 75 and movieID 932, as in the data sources).
+    """
+
+    def __init__(self, index: VectorIndex, item_ids: np.ndarray, user_keys: dict[str, int],
+                 user_vectors: np.ndarray, item_prefix: str, user_prefix: str):
+        self.index = index
+        self.item_ids = item_ids            # original id of each indexed item, by position in the index
+        self.user_keys = user_keys          # generated id of each user -> position in user_vectors
+        self.user_vectors = user_vectors
+        self.item_prefix = item_prefix
+        self.user_prefix = user_prefix
+        self._item_positions = {item: i for i, item in enumerate(item_ids.tolist())}
+
+    @classmethod
+    def build(cls, config: dict, model: 'Word2Vec', node_dict: 'IdRegistry', item_type: str = 'movies',
+              user_type: str = 'users', num_lists: int = None, seed: int = 0) -> 'Recommender':
+        """
+        Builds a recommender from a trained model. Items and users that are unknown to the model are left out.
+
+        :param config:      configuration of the graph
+        :param model:       trained model
+        :param node_dict:   registry mapping original ids to unique ids
+        :param item_type:   node type of the items to be recommended
+        :param user_type:   node type of the users
+        :param num_lists:   number of clusters of the index (see VectorIndex.build())
+        :param seed:        seed for clustering
+        :return:            recommender
+        """
+
+        logger.trace('build(%s, %s, %s, %s, %s, %s)', config, model, item_type, user_type, num_lists, seed)
+
+        def known(node_type: str) -> tuple[list[str], np.ndarray]:
+            rows = lookup_indices(model=model, keys=node_dict.unique_ids(node_type=node_type), strict=False,
+                                  positional=False)
+            return node_dict.generated_ids(node_type=node_type)[rows >= 0].tolist(), rows[rows >= 0].astype(np.int64)
+
+        item_prefix = get_node_prefix(config=config, node_type=item_type)
+        user_prefix = get_node_prefix(config=config, node_type=user_type)
+        item_keys, item_rows = known(item_type)
+        user_keys, user_rows = known(user_type)
+
+        return cls(index=VectorIndex.build(vectors=model.wv.vectors[item_rows], num_lists=num_lists, seed=seed),
+                   item_ids=np.array([key[len(item_prefix):] for key in item_keys], dtype=str),
+                   user_keys={key: i for i, key in enumerate(user_keys)},
+                   user_vectors=unit_vectors(model.wv.vectors[user_rows]),
+                   item_prefix=item_prefix, user_prefix=user_prefix)
+
+    def user_vector(self, user_id) -> np.ndarray:
+        """
+        Returns the (normalized) vector of a user.
+
+        :param user_id: original id of the user
+        :return:        vector of the user
+        """
+
+        key = self.user_prefix + str(user_id)
+        if key not in self.user_keys:
+            raise KeyError(f'unknown user {user_id}')
+        return self.user_vectors[self.user_keys[key]]
+
+    def recommend(self, user_id, n: int = 10, num_probe: int = 16, exclude: list = None,
+                  exact: bool = False) -> list[tuple[str, float]]:
+        """
+        Returns the top-n items for a user.
+
+        :param user_id:     original id of the user
+        :param n:           number of items
+        :param num_probe:   number of clusters searched (see VectorIndex.search())
+        :param exclude:     original ids of items that must not be recommended (e.g. items rated already)
+        :param exact:       whether to compare the user to all items (brute force) instead of using the index
+        :return:            original ids of the items and their similarity, most similar first
+        """
+
+        logger.trace('recommend(%s, %s, %s, %s, %s)', user_id, n, num_probe, exclude, exact)
+
+        query = self.user_vector(user_id=user_id)
+        excluded = np.array([self._item_positions[str(item)] for item in exclude or []
+                             if str(item) in self._item_positions], dtype=np.int64)
+        if exact:
+            positions, scores = self.index.search_exact(query=query, n=n, exclude=excluded)
+        else:
+            positions, scores = self.index.search(query=query, n=n, num_probe=num_probe, exclude=excluded)
+        return list(zip(self.item_ids[positions].tolist(), scores.tolist()))
+
+    def save(self, path: str) -> None:
+        """
+        Stores the recommender in a .npz file.
+
+        :param path:    path to the file
+        :return:
+        """
+
+        logger.trace('save(%s)', path)
+
+        with open(path, 'wb') as f:
+            np.savez(f, item_ids=self.item_ids, user_keys=np.array(list(self.user_keys), dtype=str),
+                     user_vectors=self.user_vectors, prefixes=np.array([self.item_prefix, self.user_prefix], dtype=str),
+                     **{name: getattr(self.index, name) for name in VectorIndex.ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> 'Recommender':
+        """
+        Loads a recommender stored by save().
+
+        :param path:    path to the file
+        :return:        recommender
+        """
+
+        logger.trace('load(%s)', path)
+
+        with np.load(path) as arrays:
+            item_prefix, user_prefix = arrays['prefixes'].tolist()
+            return cls(index=VectorIndex(**{name: arrays[name] for name in VectorIndex.ARRAYS}),
+                       item_ids=arrays['item_ids'],
+                       user_keys={key: i for i, key in enumerate(arrays['user_keys'].tolist())},
+                       user_vectors=arrays['user_vectors'], item_prefix=item_prefix, user_prefix=user_prefix)
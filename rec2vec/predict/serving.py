@@ -0,0 +1,291 @@
+from typing import TYPE_CHECKING
+from rec2vec.predict.candidates import CandidateTable, lookup_indices
+from rec2vec.predict.prediction_data_loader import get_node_prefix
+from rec2vec.predict.prediction_util import predict_with_candidates
+from rec2vec.predict.recommend import Recommender
+from rec2vec import logger
+
+import asyncio
+import json
+import numpy as np
+
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+    from rec2vec.util.id_registry import IdRegistry
+
+MAX_BATCH_SIZE = 256    # maximum number of requests scored together
+MAX_WAIT = 0.002        # maximum number of seconds a request waits for other requests to join its batch
+
+
+class MicroBatcher:
+    """
+    A MicroBatcher coalesces concurrent requests into batches. The first request of a batch waits at most max_wait
+    seconds for other requests to arrive (or until max_batch_size requests are waiting), then the whole batch is
+    processed with one call. This way, vectorized scoring is used under load while a single request is delayed by
+    at most max_wait.
+    """
+
+    def __init__(self, process, max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = MAX_WAIT):
+        self._process = process     # function that maps a list of requests to a list of results (or exceptions)
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._queue = asyncio.Queue()
+
+    async def submit(self, request) -> object:
+        """
+        Queues a request and waits for its result.
+
+        :param request: request to be processed
+        :return:        result of the request
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((request, future))
+        return await future
+
+    async def run(self) -> None:
+        """
+        Processes batches of requests until cancelled.
+
+        :return:
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = self._process([request for request, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class PredictionService:
+    """
+    A PredictionService holds a trained model in memory and answers two kinds of requests:
+    - rating predictions: which extension (e.g. rating) of an item fits a user best (see predict_with_candidates())
+    - recommendations: the top-n items for a user (see Recommender)
+    Both process whole batches of requests at once. Requests identify users and items by their original ids.
+    """
+
+    def __init__(self, config: dict, model: 'Word2Vec', node_dict: 'IdRegistry', candidates: CandidateTable,
+                 recommender: Recommender, user_type: str = 'users', item_type: str = 'movies'):
+        self.model = model
+        self.node_dict = node_dict
+        self.candidates = candidates
+        self.recommender = recommender
+        self.user_type = user_type
+        self.user_prefix = get_node_prefix(config=config, node_type=user_type)
+        self.item_prefix = get_node_prefix(config=config, node_type=item_type)
+
+    def predict_ratings(self, requests: list[dict]) -> list:
+        """
+        Predicts the extension (e.g. rating) of an item for each request {'user': ..., 'item': ...}.
+        A malformed request only fails itself, not the other requests of the batch.
+
+        :param requests:    batch of requests
+        :return:            predicted extension or an exception (KeyError for unknown ids), for each request
+        """
+
+        logger.trace('predict_ratings(%s)', len(requests))
+
+        results, rows, user_keys, items = [None] * len(requests), [], [], []
+        for i, r in enumerate(requests):
+            try:
+                user_key, item = self.user_prefix + str(r['user']), self.item_prefix + str(r['item'])
+            except (KeyError, TypeError) as e:
+                results[i] = ValueError(f'invalid request: missing {e}')
+                continue
+            rows.append(i)
+            user_keys.append(user_key)
+            items.append(item)
+
+        users = self.node_dict.lookup(node_type=self.user_type, keys=user_keys) if rows else np.zeros(0, np.int64)
+        known_users = lookup_indices(model=self.model, keys=users, strict=False) >= 0
+        known_items = self.candidates.find(item_keys=items) >= 0 if rows else np.zeros(0, dtype=bool)
+        valid = np.flatnonzero(known_users & known_items)
+
+        predictions = predict_with_candidates(model=self.model, predictors=users[valid].tolist(),
+                                              items=[items[i] for i in valid], candidates=self.candidates) \
+            if len(valid) else []
+        for j, row in enumerate(rows):
+            results[row] = KeyError(f"unknown {'item' if known_users[j] else 'user'}")
+        for j, prediction in zip(valid.tolist(), predictions):
+            results[rows[j]] = int(self.candidates.suffix[prediction])
+        return results
+
+    def recommend(self, requests: list[dict]) -> list:
+        """
+        Returns the top-n items for each request {'user': ..., 'n': 10, 'exclude': [...]}.
+        A malformed request only fails itself, not the other requests of the batch.
+
+        :param requests:    batch of requests
+        :return:            list of (item, similarity) or an exception (KeyError for unknown ids), for each request
+        """
+
+        logger.trace('recommend(%s)', len(requests))
+
+        results = []
+        for r in requests:
+            try:
+                results.append(self.recommender.recommend(user_id=r['user'], n=int(r.get('n', 10)),
+                                                          exclude=r.get('exclude')))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class PredictionServer:
+    """
+    A PredictionServer answers HTTP requests (HTTP/1.1 with keep-alive, JSON bodies) over TCP or a Unix socket:
+    - POST /predict     {"user": 75, "item": 932}           -> {"rating": 4}
+    - POST /recommend   {"user": 75, "n": 10, "exclude": []} -> {"items": [["8865", 0.94], ...]}
+    - GET /health                                            -> {"status": "ok"}
+    Requests that arrive concurrently are coalesced into micro-batches (see MicroBatcher).
+    """
+
+    def __init__(self, service: PredictionService, max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = MAX_WAIT):
+        self.service = service
+        self._batchers = {'/predict': MicroBatcher(process=service.predict_ratings, max_batch_size=max_batch_size,
+                                                   max_wait=max_wait),
+                          '/recommend': MicroBatcher(process=service.recommend, max_batch_size=max_batch_size,
+                                                     max_wait=max_wait)}
+        self._responses = {'/predict': lambda rating: {'rating': rating},
+                           '/recommend': lambda items: {'items': items}}
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        """
+        Answers a request.
+
+        :param method:  HTTP method
+        :param path:    requested path
+        :param body:    body of the request
+        :return:        status code and (json serializable) response
+        """
+
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if path not in self._batchers:
+            return 404, {'error': f'unknown path {path}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+
+        try:
+            request = json.loads(body)
+            self._validate(path=path, request=request)
+        except ValueError as e:
+            return 400, {'error': f'invalid request: {e}'}
+
+        try:
+            return 200, self._responses[path](await self._batchers[path].submit(request))
+        except KeyError as e:
+            return 404, {'error': str(e.args[0]) if e.args else 'unknown id'}
+        except (ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            logger.error(f'{path} failed: {e!r}')
+            return 500, {'error': 'internal error'}
+
+    @staticmethod
+    def _validate(path: str, request) -> None:
+        """
+        Raises a ValueError if a request is malformed, before it joins a batch (see _route()).
+
+        :param path:    requested path
+        :param request: parsed body of the request
+        :return:
+        """
+
+        if not isinstance(request, dict) or 'user' not in request:
+            raise ValueError('missing user')
+        if path == '/predict' and 'item' not in request:
+            raise ValueError('missing item')
+        if path == '/recommend':
+            n = request.get('n', 10)
+            if not isinstance(n, int) or isinstance(n, bool) or n < 1:
+                raise ValueError('n has to be a positive integer')
+            if not isinstance(request.get('exclude', []), list):
+                raise ValueError('exclude has to be a list')
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answers the requests of one connection until it is closed.
+
+        :param reader:  stream of the connection
+        :param writer:  stream of the connection
+        :return:
+        """
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self._route(method=method, path=path, body=body)
+                payload = json.dumps(response).encode()
+                writer.write(f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode()
+                             + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080, unix_socket: str = None) -> None:
+        """
+        Serves requests until cancelled.
+
+        :param host:        host to listen on
+        :param port:        port to listen on
+        :param unix_socket: path to a Unix socket to listen on instead of host and port
+        :return:
+        """
+
+        logger.trace('serve(%s, %s, %s)', host, port, unix_socket)
+
+        workers = [asyncio.create_task(batcher.run()) for batcher in self._batchers.values()]
+        if unix_socket is None:
+            server = await asyncio.start_server(self._handle, host=host, port=port)
+        else:
+            server = await asyncio.start_unix_server(self._handle, path=unix_socket)
+        logger.info(f'serving on {unix_socket or f"{host}:{port}"}')
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
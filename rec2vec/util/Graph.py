@@ -1,40 +1,198 @@
+import copy
 import random
-from typing import List
+from typing import Iterator, List
 
 from tqdm import tqdm
-from rec2vec.util.graph_loader import load_edges, load_nodes
+from rec2vec.util.adjacency import CSRAdjacency
+from rec2vec.util.artifact_cache import is_valid, load_artifact, store_artifact, store_directory_artifact
+from rec2vec.util.binary_graph import load_binary_graph, save_binary_graph
+from rec2vec.util.graph_loader import count_ids, get_artifact_location, get_chunk_rows, get_memory_budget, \
+    graph_cache_key, is_weighted, iter_edge_chunks, load_edge_arrays, load_edges, load_nodes
+from rec2vec.util.id_registry import IdRegistry
 from rec2vec.util.load_config import load_config
+from rec2vec.util.profiling import profiled, span
+from rec2vec.util.walks import WalkCorpus, iter_walk_shards, walks_to_lists
 from rec2vec import logger
 
+import numpy as np
+
 
 class Graph:
     """
     A Graph stores two dictionaries.
     - connections: a graph combining vertices (ids) and their edges (neighbors) <id, [neighbor1.id, neighbor2.id, ...]>
-    - node_dict: a dictionary to transform ids used in the graph to the original ids (and vice-versa)
+    - node_dict: a registry to transform ids used in the graph to the original ids (and vice-versa, see IdRegistry)
+
+    Alternatively (backend='csr'), the connections are stored as a CSRAdjacency, i.e. as two integer arrays
+    indexed by the unique ids. This representation needs a fraction of the memory of the dictionary and is
+    constructed with vectorized operations.
+
+    The final (bidirectional) graph is stored in the output folder (final_graph or csr_graph) and reused as long as
+    neither the configuration nor the data sources change. The CSR backend stores the graph in a binary format
+    (see binary_graph.py) that is memory-mapped when the graph is opened.
 
     A graph allows to build a deepwalk corpus using the function build_deepwalk_corpus().
     It generates a set of random walks that are generated by randomly traversing the graph.
     These walks can then be used to feed the Word2Vec model.
     """
 
-    def __init__(self, config_path: str):
+    BACKENDS = ('dict', 'csr')
+    ENGINES = ('python', 'vectorized')
 
-        logger.debug(f'initializing graph from config {config_path}')
+    def __init__(self, config_path: str, backend: str = 'dict'):
+
+        logger.debug(f'initializing graph from config {config_path} (backend: {backend})')
+
+        if backend not in self.BACKENDS:
+            raise ValueError(f'unknown backend {backend}, expected one of {self.BACKENDS}')
 
         config = load_config(path=config_path)
-        self._node_dict = load_nodes(config=config)
-        self._connections = load_edges(config=config)
-        self._make_graph_bidirectional()
+        self._backend = backend
+        self._node_dict = None
+        self._connections = None
+        self._adjacency = None
+
+        if backend == 'csr':
+            self._load_adjacency(config=config)
+        else:
+            self._node_dict = load_nodes(config=config)
+            self._load_connections(config=config)
+
+    def _load_connections(self, config: dict) -> None:
+        """
+        Loads the final (bidirectional) graph from the output folder. If it does not exist or is stale,
+        the edges are loaded from the data sources, made bidirectional and stored.
+
+        :param config:  configuration of the graph
+        :return:
+        """
+
+        logger.trace('_load_connections(%s)', config)
+
+        location = get_artifact_location(config=config, name='final_graph')
+        key = graph_cache_key(config=config)
+
+        self._connections = load_artifact(path=location, key=key)
+        if self._connections is None:
+            self._connections = load_edges(config=config)
+            self._make_graph_bidirectional()
+            logger.info('storing graph...')
+            store_artifact(obj=self._connections, path=location, key=key)
+
+    def _load_adjacency(self, config: dict) -> None:
+        """
+        Opens the final graph in binary CSR format (memory-mapped) from the output folder. If it does not exist or
+        is stale, the edges are loaded from the data sources, converted to CSR format (which makes them
+        bidirectional) and stored.
+
+        The node registry is memory-mapped as well.
+
+        With a memory budget (data.memory_budget), the sources are read in chunks and the edges are sorted out of
+        core, directly into the output folder (see CSRAdjacency.from_edge_chunks()).
+
+        :param config:  configuration of the graph
+        :return:
+        """
+
+        logger.trace('_load_adjacency(%s)', config)
+
+        location = get_artifact_location(config=config, name='csr_graph')
+        key = graph_cache_key(config=config)
+        memory_budget = get_memory_budget(config=config)
+
+        if not is_valid(path=location, key=key) and memory_budget is not None:
+            node_dict = load_nodes(config=config)
+
+            def write(folder: str) -> None:
+                CSRAdjacency.from_edge_chunks(chunks=iter_edge_chunks(config=config, original_ids_dict=node_dict,
+                                                                      chunk_rows=get_chunk_rows(config=config)),
+                                              num_nodes=count_ids(node_dict=node_dict), folder=folder,
+                                              memory_budget=memory_budget, weighted=is_weighted(config=config))
+                node_dict.save(folder=folder)
 
-    def get_node_dict(self) -> dict[str, dict[str, str]]:
+            store_directory_artifact(path=location, key=key, write=write)
+
+        elif not is_valid(path=location, key=key):
+            node_dict = load_nodes(config=config)
+            v1_ids, v2_ids, weights = load_edge_arrays(config=config, original_ids_dict=node_dict)
+            with span('symmetrization'):
+                adjacency = CSRAdjacency.from_edges(src=v1_ids, dst=v2_ids, num_nodes=count_ids(node_dict=node_dict),
+                                                    weights=weights)
+            logger.info('storing graph...')
+            store_directory_artifact(path=location, key=key,
+                                     write=lambda folder: save_binary_graph(folder=folder, adjacency=adjacency,
+                                                                            node_dict=node_dict))
+
+        self._adjacency, self._node_dict = load_binary_graph(folder=location)
+
+    @classmethod
+    def from_binary(cls, folder: str) -> 'Graph':
+        """
+        Opens a graph stored in the binary format (see binary_graph.py) without a config.
+        All arrays are memory-mapped.
+
+        :param folder:  path to the folder of the binary graph
+        :return:        graph (CSR backend)
+        """
+
+        logger.trace('from_binary(%s)', folder)
+
+        g = cls.__new__(cls)
+        g._backend = 'csr'
+        g._connections = None
+        g._adjacency, g._node_dict = load_binary_graph(folder=folder)
+        return g
+
+    @classmethod
+    def from_adjacency(cls, adjacency: CSRAdjacency, node_dict: IdRegistry | dict = None,
+                       backend: str = 'csr') -> 'Graph':
         """
-        Returns node dict, mapping original ids to unique ids.
+        Creates a graph from an existing adjacency instead of loading it from a config.
+
+        :param adjacency:   graph in CSR format
+        :param node_dict:   registry (or dictionary) mapping original ids to unique ids (optional)
+        :param backend:     representation of the graph ('dict' or 'csr')
+        :return:            graph
+        """
+
+        logger.trace('from_adjacency(%s, %s)', adjacency, backend)
+
+        if backend not in cls.BACKENDS:
+            raise ValueError(f'unknown backend {backend}, expected one of {cls.BACKENDS}')
+
+        g = cls.__new__(cls)
+        g._backend = backend
+        g._node_dict = IdRegistry.from_dict(node_dict=node_dict or {}) if not isinstance(node_dict, IdRegistry) \
+            else node_dict
+        g._adjacency = adjacency
+        g._connections = adjacency.to_dict() if backend == 'dict' else None
+        return g
+
+    def get_node_dict(self) -> IdRegistry:
+        """
+        Returns node dict, mapping original ids to unique ids. It can be used like a dictionary
+        {type: {original id: unique id}}, but also offers vectorized lookups (see IdRegistry).
 
         :return: mapping from original to unique ids
         """
         return self._node_dict
 
+    def _get_adjacency(self) -> CSRAdjacency:
+        """
+        Returns the graph in CSR format. If the graph uses the dictionary backend, the adjacency
+        is constructed (once) from the connections.
+
+        :return:    adjacency in CSR format
+        """
+
+        logger.trace('_get_adjacency()')
+
+        if self._adjacency is None:
+            self._adjacency = CSRAdjacency.from_dict(graph=self._connections,
+                                                     num_nodes=count_ids(node_dict=self.get_node_dict(),
+                                                                          graph=self._connections))
+        return self._adjacency
+
     def _get_nodes(self):
         """
         Gets a graph's vertices (nodes).
@@ -42,8 +200,10 @@ class Graph:
         :return: ids of all nodes in the graph
         """
 
-        logger.trace(f'_get_nodes()')
+        logger.trace('_get_nodes()')
 
+        if self._backend == 'csr':
+            return self._adjacency.nodes.tolist()
         return self._connections.keys()
 
     def _get_neighbors(self, node: str) -> list[str]:
@@ -55,10 +215,41 @@ class Graph:
         :return:        list of ids of node's neighbors
         """
 
-        logger.trace(f'_get_neighbors({node})')
+        logger.trace('_get_neighbors(%s)', node)
 
+        if self._backend == 'csr':
+            return self._adjacency.neighbors(node=node).tolist()
         return self._connections[node]
 
+    def _get_neighbor_weights(self, node: str) -> list[float] | None:
+        """
+        Returns the weights of the edges between a node and its neighbors (in the order of _get_neighbors()).
+
+        :param node:    id of a vertex in the graph
+        :return:        list of weights, None if the graph is not weighted (only the csr backend stores weights)
+        """
+
+        logger.trace('_get_neighbor_weights(%s)', node)
+
+        if self._backend != 'csr' or not self._adjacency.is_weighted:
+            return None
+        return self._adjacency.weights[self._adjacency.indptr[node]:self._adjacency.indptr[node + 1]].tolist()
+
+    def get_neighborhood(self, nodes: list[int], hops: int = 0) -> list[int]:
+        """
+        Returns the nodes of the graph that can be reached from a set of nodes in at most a certain number of steps.
+
+        :param nodes:   unique ids of the nodes to start from
+        :param hops:    maximum number of steps (0 returns the nodes themselves)
+        :return:        sorted unique ids of the nodes and their neighborhood (only nodes that are part of the graph)
+        """
+
+        logger.trace('get_neighborhood(%s, %s)', len(nodes), hops)
+
+        adjacency = self._get_adjacency()
+        reached = adjacency.neighborhood(nodes=np.asarray(nodes, dtype=np.int64), hops=hops)
+        return np.intersect1d(reached, adjacency.nodes).tolist()
+
     def _set_neighbors(self, node: str, neighbors: list[str]) -> None:
         """
         Sets (and replaces) a node's neighbors.
@@ -68,10 +259,12 @@ class Graph:
         :return:
         """
 
-        logger.trace(f'_set_neighbors({node}, {neighbors})')
+        logger.trace('_set_neighbors(%s, %s)', node, neighbors)
 
         self._connections[node] = neighbors
+        self._adjacency = None
 
+    @profiled('symmetrization')
     def _make_graph_bidirectional(self) -> None:
         """
         The original graph could be unidirectional, meaning that relations
@@ -117,7 +310,8 @@ class Graph:
     def _random_walk(self, path_length: int, seed: int, alpha: float = 0, rand: random.Random = random.Random(),
                      start: str = None) -> list[str]:
         """
-        Records the path of a random walk over the graph.
+        Records the path of a random walk over the graph. In a weighted graph, neighbors are chosen
+        proportionally to the weights of their edges.
 
         :param path_length: number of steps taken in walk
         :param seed:        seed for random actions (not a fixed value, otherwise all walks are the same)
@@ -127,7 +321,7 @@ class Graph:
         :return:            random path over the graph as a list of visited vertices
         """
 
-        logger.trace(f'_random_walk({path_length}, {seed}, {alpha}, {rand}, {start})')
+        logger.trace('_random_walk(%s, %s, %s, %s, %s)', path_length, seed, alpha, rand, start)
 
         # Initialize seed
         rand.seed(a=seed)
@@ -141,7 +335,12 @@ class Graph:
             if len(self._get_neighbors(node=current_node)) > 0:
                 # Reset path with a chance of alpha, move to a neighbor otherwise
                 if rand.random() >= alpha:
-                    path.append(rand.choice(seq=list(self._get_neighbors(node=current_node))))
+                    weights = self._get_neighbor_weights(node=current_node)
+                    if weights is None:
+                        path.append(rand.choice(seq=list(self._get_neighbors(node=current_node))))
+                    else:
+                        path.append(rand.choices(population=self._get_neighbors(node=current_node),
+                                                 weights=weights)[0])
                 else:
                     path.append(path[0])
 
@@ -152,25 +351,175 @@ class Graph:
         return path
 
     def build_deepwalk_corpus(self, num_paths: int = 5, path_length: int = 10, alpha: float = 0,
-                              rand: random.Random = random.Random(0)) -> list[list[str]]:
+                              rand: random.Random = random.Random(0), engine: str = 'python',
+                              seed: int = None, workers: int = 1, start_nodes: list[int] = None, p: float = 1,
+                              q: float = 1) -> WalkCorpus:
         """
-        Records a series of random walks over the graph.
+        Records a series of random walks over the graph and stores them compactly (see walks.WalkCorpus).
+
+        Two engines are available:
+        - python:       takes one walk after another (see _random_walk())
+        - vectorized:   advances all walks of a round together, one step at a time (see walks.random_walks())
+
+        With p or q other than 1, the walks are biased like node2vec walks (vectorized engine only): after moving
+        from t to v, a walk returns to t with weight 1/p, moves to a common neighbor of t and v with weight 1 and
+        moves further away with weight 1/q (see alias.SecondOrderTables).
 
         :param num_paths:       number of paths to be recorded per node
         :param path_length:     number of steps taken in walk
         :param alpha:           possibility of being reset to the start
         :param rand:            object to make random choices (by default: seed=0)
-        :return:                list of random paths
+        :param engine:          engine that records the walks ('python' or 'vectorized')
+        :param seed:            seed of the vectorized engine (by default: drawn from rand)
+        :param workers:         number of processes recording walks (vectorized engine only)
+        :param start_nodes:     unique ids of the nodes walks start from (by default: all nodes of the graph)
+        :param p:               return parameter of node2vec (high values make walks less likely to go back)
+        :param q:               in-out parameter of node2vec (high values keep walks local, low values explore)
+        :return:                corpus of random paths
+        """
+
+        logger.trace('build_deepwalk_corpus(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)', num_paths, path_length, alpha,
+                     rand, engine, seed, workers, None if start_nodes is None else len(start_nodes), p, q)
+
+        self._check_walk_parameters(engine=engine, p=p, q=q)
+        if engine == 'vectorized':
+            # Shards are kept as matrices, walks are never converted to lists
+            adjacency = self._get_adjacency()
+            starts = adjacency.nodes if start_nodes is None else np.asarray(start_nodes, dtype=np.int64)
+            shards = iter_walk_shards(adjacency=adjacency, num_paths=num_paths, path_length=path_length, alpha=alpha,
+                                      seed=seed if seed is not None else rand.getrandbits(32), workers=workers,
+                                      starts=starts, p=p, q=q)
+            return WalkCorpus.from_shards(shards=shards, path_length=path_length, num_walks=num_paths * len(starts))
+        return WalkCorpus.from_lists(walks=self.iter_deepwalk_corpus(num_paths=num_paths, path_length=path_length,
+                                                                     alpha=alpha, rand=rand, engine=engine, seed=seed,
+                                                                     workers=workers, start_nodes=start_nodes,
+                                                                     p=p, q=q),
+                                     path_length=path_length)
+
+    def _check_walk_parameters(self, engine: str, p: float, q: float) -> None:
         """
+        Raises a ValueError if the walks cannot be recorded with these parameters (see build_deepwalk_corpus()).
 
-        logger.trace(f'build_deepwalk_corpus({num_paths}, {path_length}, {alpha}, {rand})')
+        :param engine:  engine that records the walks
+        :param p:       return parameter of node2vec
+        :param q:       in-out parameter of node2vec
+        :return:
+        """
 
-        walks = []
-        nodes = list(self._get_nodes())
+        logger.trace('_check_walk_parameters(%s, %s, %s)', engine, p, q)
+
+        if engine not in self.ENGINES:
+            raise ValueError(f'unknown engine {engine}, expected one of {self.ENGINES}')
+        if p <= 0 or q <= 0:
+            raise ValueError(f'p and q have to be positive, got p={p} and q={q}')
+        if engine != 'vectorized' and (p != 1 or q != 1):
+            raise ValueError('node2vec walks (p or q other than 1) require the vectorized engine')
+
+    def iter_deepwalk_corpus(self, num_paths: int = 5, path_length: int = 10, alpha: float = 0,
+                             rand: random.Random = random.Random(0), engine: str = 'python',
+                             seed: int = None, workers: int = 1, start_nodes: list[int] = None, p: float = 1,
+                             q: float = 1) -> Iterator[list[int]]:
+        """
+        Records a series of random walks over the graph and yields them one by one as they are recorded,
+        so that the corpus never has to be held in memory. See build_deepwalk_corpus() for the parameters.
+
+        :return:    iterator over random paths
+        """
+
+        logger.trace('iter_deepwalk_corpus(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)', num_paths, path_length, alpha,
+                     rand, engine, seed, workers, None if start_nodes is None else len(start_nodes), p, q)
+
+        self._check_walk_parameters(engine=engine, p=p, q=q)
+        if engine == 'vectorized':
+            yield from self._iter_vectorized_corpus(num_paths=num_paths, path_length=path_length, alpha=alpha,
+                                                    seed=seed if seed is not None else rand.getrandbits(32),
+                                                    workers=workers, start_nodes=start_nodes, p=p, q=q)
+            return
+
+        nodes = list(self._get_nodes()) if start_nodes is None else list(start_nodes)
 
         for i in tqdm(range(num_paths)):
             rand.shuffle(nodes)
             for node in nodes:
-                walks.append(self._random_walk(path_length=path_length, seed=i, rand=rand, alpha=alpha, start=node))
+                yield self._random_walk(path_length=path_length, seed=i, rand=rand, alpha=alpha, start=node)
+
+    def _iter_vectorized_corpus(self, num_paths: int, path_length: int, alpha: float, seed: int,
+                                workers: int = 1, start_nodes: list[int] = None, p: float = 1,
+                                q: float = 1) -> Iterator[list[int]]:
+        """
+        Records a series of random walks over the graph. In every round, one walk is started from each node
+        (in random order) and the walks of that round are advanced together (see walks.iter_walk_shards()).
+
+        :param num_paths:       number of paths to be recorded per node
+        :param path_length:     number of steps taken in walk
+        :param alpha:           possibility of being reset to the start
+        :param seed:            seed for random actions, the same seed always results in the same corpus
+        :param workers:         number of processes recording walks (does not change the result)
+        :param start_nodes:     unique ids of the nodes walks start from (by default: all nodes of the graph)
+        :param p:               return parameter of node2vec
+        :param q:               in-out parameter of node2vec
+        :return:                iterator over random paths
+        """
+
+        logger.trace('_iter_vectorized_corpus(%s, %s, %s, %s, %s, %s, %s, %s)', num_paths, path_length, alpha, seed,
+                     workers, None if start_nodes is None else len(start_nodes), p, q)
+
+        starts = None if start_nodes is None else np.asarray(start_nodes, dtype=np.int64)
+        for walks, lengths in iter_walk_shards(adjacency=self._get_adjacency(), num_paths=num_paths,
+                                               path_length=path_length, alpha=alpha, seed=seed, workers=workers,
+                                               starts=starts, p=p, q=q):
+            yield from walks_to_lists(walks=walks, lengths=lengths)
+
+    def write_deepwalk_corpus(self, path: str, num_paths: int = 5, path_length: int = 10, alpha: float = 0,
+                              rand: random.Random = random.Random(0), engine: str = 'python',
+                              seed: int = None, workers: int = 1, start_nodes: list[int] = None, p: float = 1,
+                              q: float = 1) -> int:
+        """
+        Records a series of random walks over the graph and writes them to a file while they are recorded.
+        Every line of the file contains one walk, vertices are separated by spaces (the format of gensim's
+        corpus_file). See build_deepwalk_corpus() for the remaining parameters.
+
+        :param path:    path to the corpus file
+        :return:        number of walks written
+        """
+
+        logger.trace('write_deepwalk_corpus(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)', path, num_paths, path_length,
+                     alpha, rand, engine, seed, workers, None if start_nodes is None else len(start_nodes), p, q)
+
+        count = 0
+        with open(file=path, mode='w') as f:
+            for walk in self.iter_deepwalk_corpus(num_paths=num_paths, path_length=path_length, alpha=alpha,
+                                                  rand=rand, engine=engine, seed=seed, workers=workers,
+                                                  start_nodes=start_nodes, p=p, q=q):
+                f.write(' '.join(map(str, walk)) + '\n')
+                count += 1
+        return count
+
+
+class DeepwalkCorpus:
+    """
+    A DeepwalkCorpus is a restartable, lazy iterable over the random walks of a graph. Walks are recorded while
+    iterating and are never stored. Every pass (e.g. every epoch of Word2Vec) starts from the same random state,
+    which means that every pass yields exactly the same walks.
+    """
 
-        return walks
+    def __init__(self, graph: Graph, num_paths: int = 5, path_length: int = 10, alpha: float = 0,
+                 rand: random.Random = random.Random(0), engine: str = 'python', seed: int = None,
+                 workers: int = 1, start_nodes: list[int] = None, p: float = 1, q: float = 1):
+        self._graph = graph
+        self._num_paths = num_paths
+        self._path_length = path_length
+        self._alpha = alpha
+        self._rand = copy.deepcopy(rand)  # state at creation, every pass starts from a copy
+        self._engine = engine
+        self._seed = seed
+        self._workers = workers
+        self._start_nodes = start_nodes
+        self._p = p
+        self._q = q
+
+    def __iter__(self) -> Iterator[list[int]]:
+        return self._graph.iter_deepwalk_corpus(num_paths=self._num_paths, path_length=self._path_length,
+                                                alpha=self._alpha, rand=copy.deepcopy(self._rand),
+                                                engine=self._engine, seed=self._seed, workers=self._workers,
+                                                start_nodes=self._start_nodes, p=self._p, q=self._q)
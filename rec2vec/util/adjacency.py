@@ -0,0 +1,411 @@
+from itertools import chain
+from os import makedirs
+from os.path import exists, join
+from tempfile import TemporaryDirectory
+from typing import Iterator
+from rec2vec import logger
+from rec2vec.util.alias import build_alias_tables
+from rec2vec.util.external_sort import MERGE_BYTES_PER_KEY, RUN_BYTES_PER_KEY, merge_runs, write_runs
+from rec2vec.util.profiling import span
+
+import numpy as np
+
+ALIAS_BYTES_PER_SLOT = 96   # memory per slot while alias tables are built (see alias.build_alias_tables())
+COPY_BLOCK = 2 ** 22        # number of elements copied at once from temporary files
+
+
+def _index_dtype(size: int) -> type:
+    """
+    Returns the smallest integer type (int32 or int64) that can index an array of a certain size.
+
+    :param size:    number of elements to be indexed
+    :return:        numpy integer type
+    """
+
+    return np.int32 if size < np.iinfo(np.int32).max else np.int64
+
+
+class CSRAdjacency:
+    """
+    A CSRAdjacency stores the neighbors of all vertices in compressed sparse row (CSR) format.
+    - indptr:   offsets of each vertex' neighbors, vertex v's neighbors are indices[indptr[v]:indptr[v + 1]]
+    - indices:  ids of neighbors, sorted in ascending order for each vertex
+    - nodes:    ids of all vertices that are part of the graph (i.e. that appear in at least one edge)
+
+    Arrays are indexed by the unique ids generated by load_nodes(), which means that every unique id
+    can be looked up in constant time. Compared to a dictionary of lists, no Python object is created per edge.
+
+    A weighted adjacency has three more arrays parallel to indices (None if the adjacency is not weighted):
+    - weights:      weight of each edge (float32, the same in both directions)
+    - prob, alias:  alias table of each vertex' neighbors (see alias.build_alias_tables()), so that a neighbor
+                    can be drawn proportionally to its weight in constant time
+    """
+
+    ARRAYS = ('indptr', 'indices', 'nodes')
+    WEIGHT_ARRAYS = ('weights', 'prob', 'alias')
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray, path: str = None,
+                 weights: np.ndarray = None, prob: np.ndarray = None, alias: np.ndarray = None):
+        self.indptr = indptr
+        self.indices = indices
+        self.nodes = nodes
+        self.path = path  # folder the arrays are memory-mapped from (None if they are held in memory)
+        self.weights = weights
+        self.prob = prob
+        self.alias = alias
+
+    @property
+    def num_nodes(self) -> int:
+        """
+        Number of unique ids that can be looked up (highest unique id + 1).
+
+        :return:    length of indptr - 1
+        """
+        return len(self.indptr) - 1
+
+    @property
+    def num_edges(self) -> int:
+        """
+        Number of (directed) edges stored. Every undirected edge is stored twice.
+
+        :return:    length of indices
+        """
+        return len(self.indices)
+
+    @property
+    def is_weighted(self) -> bool:
+        """
+        Whether the edges have weights.
+
+        :return:    True if weights are stored
+        """
+        return self.weights is not None
+
+    def degrees(self) -> np.ndarray:
+        """
+        Returns the degree of every unique id.
+
+        :return:    array containing the number of neighbors for each unique id
+        """
+        return np.diff(self.indptr)
+
+    def neighbors(self, node: int) -> np.ndarray:
+        """
+        Returns the neighbors of a node as a view of the indices array (no copy).
+
+        :param node:    unique id of a vertex
+        :return:        sorted ids of node's neighbors
+        """
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighborhood(self, nodes: np.ndarray, hops: int = 1) -> np.ndarray:
+        """
+        Returns all vertices that can be reached from a set of vertices in at most a certain number of steps.
+
+        :param nodes:   unique ids of the vertices to start from
+        :param hops:    maximum number of steps (0 returns the vertices themselves)
+        :return:        sorted unique ids of the vertices and their neighborhood
+        """
+
+        logger.trace('neighborhood(%s, %s)', len(nodes), hops)
+
+        reached = frontier = np.unique(np.asarray(nodes, dtype=np.int64))
+        for _ in range(hops):
+            frontier = frontier[frontier < self.num_nodes]
+            starts = self.indptr[frontier].astype(np.int64)
+            lengths = self.indptr[frontier + 1] - starts
+            if lengths.sum() == 0:
+                break
+
+            # Positions of all neighbors of the frontier in indices, i.e. the concatenated ranges of the frontier
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            frontier = np.setdiff1d(self.indices[positions].astype(np.int64), reached)
+            if len(frontier) == 0:
+                break
+            reached = np.union1d(reached, frontier)
+
+        return reached
+
+    def save(self, folder: str) -> None:
+        """
+        Stores the arrays of the adjacency as .npy files in a folder.
+
+        :param folder:  path to the folder (created if it does not exist)
+        :return:
+        """
+
+        logger.trace('save(%s)', folder)
+
+        makedirs(folder, exist_ok=True)
+        for name in self.ARRAYS + (self.WEIGHT_ARRAYS if self.is_weighted else ()):
+            np.save(join(folder, f'{name}.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode: str = 'r') -> 'CSRAdjacency':
+        """
+        Loads an adjacency stored by save(). By default, the arrays are memory-mapped, which means that
+        loading takes constant time and processes that load the same folder share the pages in memory.
+
+        :param folder:      path to the folder
+        :param mmap_mode:   mode for memory-mapping the files (None loads the arrays into memory)
+        :return:            adjacency in CSR format
+        """
+
+        logger.trace('load(%s, %s)', folder, mmap_mode)
+
+        names = cls.ARRAYS + (cls.WEIGHT_ARRAYS if exists(join(folder, 'weights.npy')) else ())
+        arrays = {name: np.load(join(folder, f'{name}.npy'), mmap_mode=mmap_mode) for name in names}
+        return cls(**arrays, path=folder if mmap_mode is not None else None)
+
+    def with_edges(self, src: np.ndarray, dst: np.ndarray, num_nodes: int = None,
+                   weights: np.ndarray = None) -> 'CSRAdjacency':
+        """
+        Returns a new adjacency that contains all edges of this adjacency and additional (unidirectional) edges.
+        The additional edges are made bidirectional, loops and duplicates are removed (see from_edges()).
+        If either this adjacency or the additional edges are weighted, the result is weighted: the weights of
+        edges that exist already are increased (missing weights count as 1).
+
+        :param src:         unique ids of the first vertex of each additional edge
+        :param dst:         unique ids of the second vertex of each additional edge
+        :param num_nodes:   number of unique ids (by default: the larger of this adjacency and the edges)
+        :param weights:     weight of each additional edge (optional)
+        :return:            adjacency in CSR format
+        """
+
+        logger.trace('with_edges(%s, %s, %s, %s)', len(src), len(dst), num_nodes, weights is not None)
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        nodes = np.union1d(self.nodes, np.concatenate((src, dst)))
+        if num_nodes is None:
+            num_nodes = max(self.num_nodes, int(np.max(nodes, initial=-1)) + 1)
+
+        existing_src = np.repeat(np.arange(self.num_nodes, dtype=np.int64), self.degrees())
+        existing_dst = np.asarray(self.indices, dtype=np.int64)
+        if not self.is_weighted and weights is None:
+            return CSRAdjacency.from_edges(src=np.concatenate((existing_src, src)),
+                                           dst=np.concatenate((existing_dst, dst)), num_nodes=num_nodes, nodes=nodes)
+
+        # Existing edges are stored in both directions, only one of them is passed on (or weights would double)
+        one_way = existing_src < existing_dst
+        existing_weights = self.weights[one_way] if self.is_weighted else np.ones(int(one_way.sum()))
+        return CSRAdjacency.from_edges(src=np.concatenate((existing_src[one_way], src)),
+                                       dst=np.concatenate((existing_dst[one_way], dst)), num_nodes=num_nodes,
+                                       nodes=nodes, weights=np.concatenate((existing_weights,
+                                                                            np.ones(len(src)) if weights is None
+                                                                            else weights)))
+
+    def to_dict(self) -> dict[int, list[int]]:
+        """
+        Converts the adjacency to the dictionary representation <id, [neighbor1.id, neighbor2.id, ...]>.
+
+        :return:    dictionary of neighbor lists
+        """
+
+        logger.trace('to_dict()')
+
+        indptr, indices = self.indptr.tolist(), self.indices.tolist()
+        return {n: indices[indptr[n]:indptr[n + 1]] for n in self.nodes.tolist()}
+
+    @classmethod
+    def from_edges(cls, src: np.ndarray, dst: np.ndarray, num_nodes: int = None,
+                   nodes: np.ndarray = None, weights: np.ndarray = None) -> 'CSRAdjacency':
+        """
+        Builds a bidirectional adjacency from (unidirectional) edge arrays. All operations are vectorized:
+        - every edge src -> dst is mirrored by an edge dst -> src
+        - loops (src == dst) are removed
+        - duplicate edges are removed and neighbors are sorted by their id
+        - with weights, the weights of duplicate edges are summed and the alias tables are built
+
+        :param src:         unique ids of the first vertex of each edge
+        :param dst:         unique ids of the second vertex of each edge
+        :param num_nodes:   number of unique ids (by default: highest id in the edges + 1)
+        :param nodes:       ids of vertices in the graph (by default: all vertices that appear in an edge)
+        :param weights:     weight of each edge (optional, non-negative)
+        :return:            adjacency in CSR format
+        """
+
+        logger.trace('from_edges(%s, %s, %s, %s)', len(src), len(dst), num_nodes, weights is not None)
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+
+        if nodes is None:
+            nodes = np.union1d(src, dst)
+        if num_nodes is None:
+            num_nodes = int(np.max(nodes, initial=-1)) + 1
+
+        # Mirror edges and remove loops: node1 -> [node1, node2] => node1 -> [node2]
+        no_loop = src != dst
+        mirrored_src = np.concatenate((src[no_loop], dst[no_loop]))
+        mirrored_dst = np.concatenate((dst[no_loop], src[no_loop]))
+
+        # Encode each edge as a single integer, sorting and deduplicating them orders neighbors by (src, dst)
+        if weights is None:
+            keys = np.unique(mirrored_src * num_nodes + mirrored_dst)
+        else:
+            weights = np.asarray(weights, dtype=np.float64)[no_loop]
+            keys, inverse = np.unique(mirrored_src * num_nodes + mirrored_dst, return_inverse=True)
+            weights = np.bincount(inverse.ravel(), weights=np.concatenate((weights, weights)), minlength=len(keys))
+        del mirrored_src, mirrored_dst
+
+        dtype = _index_dtype(max(len(keys), num_nodes))
+        indices = (keys % num_nodes).astype(dtype)
+        counts = np.bincount(keys // num_nodes, minlength=num_nodes)
+        indptr = np.zeros(num_nodes + 1, dtype=dtype)
+        np.cumsum(counts, out=indptr[1:])
+
+        adjacency = cls(indptr=indptr, indices=indices, nodes=np.asarray(nodes, dtype=_index_dtype(num_nodes)))
+        if weights is not None:
+            adjacency.weights = weights.astype(np.float32)
+            adjacency.prob, adjacency.alias = build_alias_tables(indptr=indptr, weights=weights)
+        return adjacency
+
+    @classmethod
+    def from_edge_chunks(cls, chunks: Iterator[tuple[np.ndarray, np.ndarray, np.ndarray | None, int]],
+                         num_nodes: int, folder: str, memory_budget: int, weighted: bool = False) -> 'CSRAdjacency':
+        """
+        Builds a bidirectional adjacency from chunks of (unidirectional) edges without holding all edges in memory,
+        with the same result as from_edges() on all edges (see graph_loader.load_edge_arrays() for the weights):
+        1. the edges of every chunk are mirrored and encoded as keys (see from_edges()), buffered and written to
+           disk as sorted runs (external sort)
+        2. the runs are merged block by block, which deduplicates the keys (and sums their weights), and the
+           neighbors are appended to a file while the degree of every vertex is counted
+        3. indptr, indices (and weights and alias tables) are written as .npy files to the folder
+
+        Apart from arrays with one entry per vertex, the memory used is bounded by memory_budget. Temporary files
+        are written to the folder, too.
+
+        :param chunks:          unique ids of the first and second vertex, weights (None if the edges of the chunk
+                                have no weights) and group (e.g. source) of each chunk
+        :param num_nodes:       number of unique ids
+        :param folder:          folder the adjacency is written to (created if it does not exist)
+        :param memory_budget:   maximum number of bytes used for buffers
+        :param weighted:        whether the adjacency is weighted
+        :return:                adjacency in CSR format (memory-mapped from the folder)
+        """
+
+        logger.trace('from_edge_chunks(%s, %s, %s, %s)', num_nodes, folder, memory_budget, weighted)
+
+        makedirs(folder, exist_ok=True)
+        seen = np.zeros(num_nodes, dtype=bool)
+
+        # Mirror edges and remove loops (see from_edges()), groups only matter for weighted adjacencies
+        def keys():
+            for src, dst, weights, group in chunks:
+                src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+                seen[src] = seen[dst] = True
+                no_loop = src != dst
+                src, dst = src[no_loop], dst[no_loop]
+                if weighted and weights is not None:
+                    weights = np.asarray(weights, dtype=np.float64)[no_loop]
+                    weights = np.concatenate((weights, weights))
+                else:
+                    weights = None
+                yield np.concatenate((src * num_nodes + dst, dst * num_nodes + src)), weights, \
+                    group if weighted else 0
+
+        with TemporaryDirectory(dir=folder) as tmp:
+            with span('load_edges', streaming=True):
+                runs = write_runs(chunks=keys(), folder=tmp, max_keys=max(memory_budget // RUN_BYTES_PER_KEY, 1))
+
+            with span('symmetrization', streaming=True, runs=len(runs)):
+                dtype = _index_dtype(max(sum(run.size for run in runs), num_nodes))
+                counts = np.zeros(num_nodes, dtype=np.int64)
+                num_edges = 0
+                blocks = merge_runs(runs=runs, block_keys=max(memory_budget // MERGE_BYTES_PER_KEY, 1),
+                                    weighted=weighted)
+                with open(join(tmp, 'indices.bin'), 'wb') as indices, open(join(tmp, 'weights.bin'), 'wb') as weights:
+                    for block, block_weights in blocks:
+                        counts += np.bincount(block // num_nodes, minlength=num_nodes)
+                        (block % num_nodes).astype(dtype).tofile(indices)
+                        if weighted:
+                            block_weights.astype(np.float32).tofile(weights)
+                        num_edges += len(block)
+
+                indptr = np.zeros(num_nodes + 1, dtype=dtype)
+                np.cumsum(counts, out=indptr[1:])
+                del counts
+                np.save(join(folder, 'indptr.npy'), indptr)
+                np.save(join(folder, 'nodes.npy'), np.flatnonzero(seen).astype(_index_dtype(num_nodes)))
+                _copy_to_npy(source=join(tmp, 'indices.bin'), path=join(folder, 'indices.npy'), dtype=dtype,
+                             size=num_edges)
+                if weighted:
+                    _copy_to_npy(source=join(tmp, 'weights.bin'), path=join(folder, 'weights.npy'),
+                                 dtype=np.float32, size=num_edges)
+
+        if weighted:
+            _write_alias_tables(folder=folder, indptr=indptr, max_slots=max(memory_budget // ALIAS_BYTES_PER_SLOT, 1))
+
+        logger.debug(f'built adjacency with {num_edges} edges from {len(runs)} runs')
+        return cls.load(folder=folder)
+
+    @classmethod
+    def from_dict(cls, graph: dict, num_nodes: int = None) -> 'CSRAdjacency':
+        """
+        Builds a bidirectional adjacency from a dictionary <id, [neighbor1.id, neighbor2.id, ...]>
+        (as returned by load_edges()).
+
+        :param graph:       dictionary of neighbor lists
+        :param num_nodes:   number of unique ids (by default: highest id in the graph + 1)
+        :return:            adjacency in CSR format
+        """
+
+        logger.trace('from_dict(%s, %s)', len(graph), num_nodes)
+
+        lengths = np.fromiter(map(len, graph.values()), dtype=np.int64, count=len(graph))
+        nodes = np.fromiter(graph.keys(), dtype=np.int64, count=len(graph))
+        src = np.repeat(nodes, lengths)
+        dst = np.fromiter(chain.from_iterable(graph.values()), dtype=np.int64, count=int(lengths.sum()))
+        return cls.from_edges(src=src, dst=dst, num_nodes=num_nodes, nodes=np.sort(nodes))
+
+
+def _copy_to_npy(source: str, path: str, dtype: type, size: int) -> None:
+    """
+    Copies a raw binary file to a .npy file, block by block.
+
+    :param source:  path to the raw file
+    :param path:    path to the .npy file
+    :param dtype:   type of the elements
+    :param size:    number of elements
+    :return:
+    """
+
+    target = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(size,))
+    if size:
+        raw = np.memmap(source, dtype=dtype, mode='r', shape=(size,))
+        for start in range(0, size, COPY_BLOCK):
+            target[start:start + COPY_BLOCK] = raw[start:start + COPY_BLOCK]
+        del raw
+    target.flush()
+    del target
+
+
+def _write_alias_tables(folder: str, indptr: np.ndarray, max_slots: int) -> None:
+    """
+    Builds the alias tables of a weighted adjacency stored in a folder (see alias.build_alias_tables()) for
+    ranges of vertices with at most max_slots neighbors (or a single vertex, if it has more).
+
+    :param folder:      folder containing the weights (see CSRAdjacency.save())
+    :param indptr:      offsets of each vertex' neighbors
+    :param max_slots:   maximum number of neighbors whose tables are built at once
+    :return:
+    """
+
+    logger.trace('_write_alias_tables(%s, %s)', folder, max_slots)
+
+    weights = np.load(join(folder, 'weights.npy'), mmap_mode='r')
+    prob = np.lib.format.open_memmap(join(folder, 'prob.npy'), mode='w+', dtype=np.float32, shape=(len(weights),))
+    alias = np.lib.format.open_memmap(join(folder, 'alias.npy'), mode='w+', dtype=np.int32, shape=(len(weights),))
+
+    first, num_nodes = 0, len(indptr) - 1
+    while first < num_nodes:
+        last = max(int(np.searchsorted(indptr, indptr[first] + max_slots, side='right')) - 1, first + 1)
+        start, end = int(indptr[first]), int(indptr[last])
+        if end > start:
+            prob[start:end], alias[start:end] = build_alias_tables(indptr=indptr[first:last + 1] - start,
+                                                                   weights=np.asarray(weights[start:end]))
+        first = last
+
+    prob.flush()
+    alias.flush()
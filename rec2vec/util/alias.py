@@ -0,0 +1,359 @@
+from os import makedirs
+from os.path import join
+from typing import TYPE_CHECKING
+from rec2vec import logger
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from rec2vec.util.adjacency import CSRAdjacency
+
+MEMORY_BUDGET = 0           # default bytes of second order alias tables (building them costs more than they save)
+CHUNK_SIZE = 2 ** 22        # maximum number of table entries built at once (bounds the temporary memory)
+SCALAR_DISTRIBUTIONS = 8    # remaining distributions that are finished one by one when building alias tables
+
+
+def _gather_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Returns the positions of several ranges as one array, e.g. starts [0, 10], lengths [2, 3] -> [0, 1, 10, 11, 12].
+
+    :param starts:  first position of each range
+    :param lengths: length of each range
+    :return:        concatenated positions
+    """
+
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+def _lookup(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """
+    Returns the insertion positions of keys in sorted_keys (like np.searchsorted()). The keys are sorted first:
+    consecutive lookups then touch nearby memory, which is several times faster for large, random batches.
+
+    :param sorted_keys: sorted array searched in
+    :param keys:        keys to look up
+    :return:            position of each key
+    """
+
+    order = np.argsort(keys)
+    positions = np.empty(len(keys), dtype=np.int64)
+    positions[order] = np.searchsorted(sorted_keys, keys[order])
+    return positions
+
+
+def _fill_scalar(value: np.ndarray, prob: np.ndarray, alias: np.ndarray, bucket: int, donor: int, end: int) -> None:
+    """
+    Fills the remaining slots of one distribution (see build_alias_tables()), slot by slot.
+
+    :param value:   remaining weight of each slot (in sorted order)
+    :param prob:    chance of keeping each slot (filled in place)
+    :param alias:   alias of each slot (filled in place)
+    :param bucket:  next slot to be filled
+    :param donor:   current donor
+    :param end:     end of the distribution
+    :return:
+    """
+
+    start = bucket
+    values = value[start:end].tolist()
+    probs = prob[start:end].tolist()
+    aliases = alias[start:end].tolist()
+    d = donor - start
+    for b in range(bucket - start, end - start):
+        if values[b] >= 1 or d >= end - start:
+            continue
+        probs[b] = values[b]
+        aliases[b] = d + start
+        values[d] -= 1 - values[b]
+        if values[d] < 1:
+            d += 1
+    prob[start:end] = probs
+    alias[start:end] = aliases
+
+
+def build_alias_tables(indptr: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Builds the alias tables (Vose's method) of many discrete distributions at once. Distribution i is given by
+    the (non-negative) weights[indptr[i]:indptr[i + 1]]. Sampling from a table takes constant time: pick a slot
+    k uniformly, keep it with a chance of prob[k], otherwise take alias[k] (see sample_alias()).
+
+    All distributions are processed together: they are sorted so that the slots below the average come first,
+    then one slot of every distribution is filled per iteration (from the current donor, i.e. the first slot above
+    the average that still has weight to give). Each iteration is vectorized over all distributions that are not
+    done yet; the few largest distributions (e.g. of hubs) are finished one by one.
+
+    :param indptr:  offsets of the distributions in weights
+    :param weights: weights of all distributions, concatenated
+    :return:        chance of keeping each slot and its alias (position within its distribution)
+    """
+
+    logger.trace('build_alias_tables(%s, %s)', len(indptr) - 1, len(weights))
+
+    indptr = np.asarray(indptr, dtype=np.int64)
+    sizes = np.diff(indptr)
+    segment = np.repeat(np.arange(len(sizes)), sizes)
+    sums = np.bincount(segment, weights=weights, minlength=len(sizes))
+
+    # Scale weights to an average of 1 per distribution (distributions without weight become uniform)
+    scaled = np.ones(len(weights), dtype=np.float64)
+    positive = sums[segment] > 0
+    scaled[positive] = weights[positive] * sizes[segment[positive]] / sums[segment[positive]]
+
+    # Within every distribution, slots below the average come first
+    is_large = scaled >= 1
+    order = np.lexsort((is_large, segment))
+    value = scaled[order]
+    prob = np.ones(len(weights), dtype=np.float64)
+    alias = np.arange(len(weights), dtype=np.int64)     # positions in order, converted at the end
+
+    bucket = indptr[:-1].copy()
+    end = indptr[1:]
+    donor = bucket + np.bincount(segment, weights=~is_large, minlength=len(sizes)).astype(np.int64)
+    active = np.flatnonzero(bucket < end)
+    while len(active) > SCALAR_DISTRIBUTIONS:
+        b, d = bucket[active], donor[active]
+
+        # A slot at or above the average (or without donor left) is kept, all remaining slots are (about) 1
+        fill = (value[b] < 1) & (d < end[active])
+        prob[b[fill]] = value[b[fill]]
+        alias[b[fill]] = d[fill]
+        value[d[fill]] -= 1 - value[b[fill]]     # every distribution has its own donor
+
+        # A donor that fell below the average becomes a slot to be filled, the next large slot donates
+        exhausted = fill & (value[np.minimum(d, len(value) - 1)] < 1)
+        donor[active[exhausted]] += 1
+        bucket[active] += 1
+        active = active[bucket[active] < end[active]]
+
+    # The last (largest) distributions are finished one by one, without the overhead of array operations per slot
+    for i in active.tolist():
+        _fill_scalar(value=value, prob=prob, alias=alias, bucket=int(bucket[i]), donor=int(donor[i]), end=int(end[i]))
+
+    # Positions in order -> positions within the distribution
+    local = np.arange(len(weights)) - indptr[:-1][segment]
+    result_prob = np.empty(len(weights), dtype=np.float32)
+    result_alias = np.empty(len(weights), dtype=np.int32)
+    result_prob[order] = prob
+    result_alias[order] = local[order[alias]]
+    return result_prob, result_alias
+
+
+def sample_alias(prob: np.ndarray, alias: np.ndarray, offsets: np.ndarray, sizes: np.ndarray,
+                 rng: np.random.Generator) -> np.ndarray:
+    """
+    Draws one sample from each of several alias tables (see build_alias_tables()).
+
+    :param prob:    chance of keeping each slot
+    :param alias:   alias of each slot
+    :param offsets: position of the first slot of each table
+    :param sizes:   number of slots of each table (> 0)
+    :param rng:     random generator
+    :return:        drawn position within each table
+    """
+
+    # One random number per sample: its integer part picks the slot, its fractional part decides about the alias
+    scaled = rng.random(len(offsets)) * sizes
+    slot = np.minimum(scaled.astype(np.int64), sizes - 1)
+    positions = offsets + slot
+    return np.where(scaled - slot < prob[positions], slot, alias[positions])
+
+
+class SecondOrderTables:
+    """
+    SecondOrderTables sample the steps of node2vec walks: a walk that moved from t to v continues to a neighbor x
+    of v with a weight of 1/p if x == t (return), 1 if x is a neighbor of t as well and 1/q otherwise (in-out).
+
+    The distribution depends on the edge t -> v, so there is one alias table per edge (t, v), with one slot per
+    neighbor of v. These tables need degree(v)^2 slots per vertex v, which is prohibitive for vertices with a high
+    degree. Therefore, tables are only precomputed for vertices with the lowest degrees, as long as all tables fit
+    into the memory budget. Steps from any other vertex use rejection sampling instead: a neighbor is proposed
+    uniformly and accepted with a chance of its weight / max(1, 1/q), which needs no memory and a few proposals
+    on average (at most max(q, 1/q)). A high return weight 1/p is handled separately (outlier folding), so that
+    it does not lower the acceptance rate of all other neighbors. In weighted graphs, the node2vec weights are
+    multiplied by the edge weights.
+
+    Walks carry the CSR position of the edge they arrived by, so the table of a step is found by indexing
+    (table_ptr[edge]) and a step with a table takes constant time.
+
+    - edge_keys:    key (source * num_nodes + target) of every edge of the adjacency, sorted (for edge lookups)
+    - reverse_edge: CSR position of the reverse of every edge (the adjacency is bidirectional)
+    - table_ptr:    position of the table of every edge t -> v (used after walking from t to v), -1 if v has no tables
+    - prob, alias:  all tables, concatenated (see build_alias_tables())
+    """
+
+    ARRAYS = ('edge_keys', 'reverse_edge', 'table_ptr', 'prob', 'alias')
+
+    def __init__(self, p: float, q: float, edge_keys: np.ndarray, reverse_edge: np.ndarray, table_ptr: np.ndarray,
+                 prob: np.ndarray, alias: np.ndarray):
+        self.p = p
+        self.q = q
+        self.edge_keys = edge_keys
+        self.reverse_edge = reverse_edge
+        self.table_ptr = table_ptr
+        self.prob = prob
+        self.alias = alias
+
+    @classmethod
+    def build(cls, adjacency: 'CSRAdjacency', p: float = 1, q: float = 1,
+              memory_budget: int = MEMORY_BUDGET) -> 'SecondOrderTables':
+        """
+        Precomputes the tables of the vertices with the lowest degrees within the memory budget.
+
+        :param adjacency:       graph in CSR format
+        :param p:               return parameter (high values make walks less likely to go back)
+        :param q:               in-out parameter (high values keep walks local, low values let them explore)
+        :param memory_budget:   maximum number of bytes used by the tables
+        :return:                tables
+        """
+
+        logger.trace('build(%s, %s, %s, %s)', adjacency, p, q, memory_budget)
+
+        indptr = np.asarray(adjacency.indptr, dtype=np.int64)
+        indices = np.asarray(adjacency.indices, dtype=np.int64)
+        degrees = np.diff(indptr)
+        sources = np.repeat(np.arange(adjacency.num_nodes, dtype=np.int64), degrees)
+        edge_keys = sources * adjacency.num_nodes + indices     # sorted, since indices are sorted per vertex
+        reverse_edge = _lookup(edge_keys, indices * adjacency.num_nodes + sources)
+
+        # Vertices with the lowest degrees get tables, until the budget (8 bytes per slot) is used up
+        by_degree = np.argsort(degrees, kind='stable')
+        slots = np.cumsum(degrees[by_degree] ** 2)
+        tabled = np.zeros(adjacency.num_nodes, dtype=bool)
+        tabled[by_degree[:np.searchsorted(slots, memory_budget // 8, side='right')]] = True
+        tabled &= degrees > 0
+
+        # Table of edge t -> v has degree(v) slots
+        table_edges = np.flatnonzero(tabled[indices])
+        table_sizes = degrees[indices[table_edges]]
+        table_ptr = np.full(len(indices), -1, dtype=np.int64)
+        table_ptr[table_edges] = np.cumsum(table_sizes) - table_sizes
+        prob = np.empty(int(table_sizes.sum()), dtype=np.float32)
+        alias = np.empty(int(table_sizes.sum()), dtype=np.int32)
+
+        # Tables are built in chunks of edges, so that the temporary arrays stay small
+        ends = np.cumsum(table_sizes)
+        first = 0
+        while first < len(table_edges):
+            last = max(int(np.searchsorted(ends, ends[first] - table_sizes[first] + CHUNK_SIZE, side='right')),
+                       first + 1)
+            edges = table_edges[first:last]
+            t, v = sources[edges], indices[edges]
+            positions = _gather_ranges(indptr[v], degrees[v])
+            weights = cls._weights(edge_keys=edge_keys, num_nodes=adjacency.num_nodes, p=p, q=q,
+                                   previous=np.repeat(t, degrees[v]), candidates=indices[positions])
+            if adjacency.is_weighted:
+                weights *= adjacency.weights[positions]
+            chunk_prob, chunk_alias = build_alias_tables(indptr=np.concatenate(([0], np.cumsum(degrees[v]))),
+                                                         weights=weights)
+            start = table_ptr[edges[0]]
+            prob[start:start + len(weights)] = chunk_prob
+            alias[start:start + len(weights)] = chunk_alias
+            first = last
+
+        logger.debug(f'built second order alias tables for {tabled.sum()} of {len(adjacency.nodes)} vertices '
+                     f'({len(prob)} slots)')
+        return cls(p=p, q=q, edge_keys=edge_keys, reverse_edge=reverse_edge, table_ptr=table_ptr, prob=prob,
+                   alias=alias)
+
+    @staticmethod
+    def _weights(edge_keys: np.ndarray, num_nodes: int, p: float, q: float, previous: np.ndarray,
+                 candidates: np.ndarray) -> np.ndarray:
+        """
+        Returns the (unnormalized) weight of moving to each candidate, given the previous vertex of the walk.
+
+        :param edge_keys:   sorted keys of all edges
+        :param num_nodes:   number of unique ids
+        :param p:           return parameter
+        :param q:           in-out parameter
+        :param previous:    previous vertex of each walk
+        :param candidates:  candidate of each walk (a neighbor of the current vertex)
+        :return:            1/p for returns, 1 for neighbors of the previous vertex, 1/q otherwise
+        """
+
+        keys = previous * num_nodes + candidates
+        positions = np.minimum(_lookup(edge_keys, keys), len(edge_keys) - 1)
+        weights = np.where(edge_keys[positions] == keys, 1.0, 1 / q)
+        weights[candidates == previous] = 1 / p
+        return weights
+
+    def next_steps(self, adjacency: 'CSRAdjacency', previous: np.ndarray, current: np.ndarray, edges: np.ndarray,
+                   rng: np.random.Generator) -> np.ndarray:
+        """
+        Samples the next step of walks that moved from previous to current (current has at least one neighbor).
+
+        :param adjacency:   graph in CSR format (the one the tables have been built for)
+        :param previous:    previous vertex of each walk
+        :param current:     current vertex of each walk
+        :param edges:       CSR position of the edge previous -> current of each walk
+        :param rng:         random generator
+        :return:            CSR position of the next edge of each walk (its target is the next vertex)
+        """
+
+        indptr, indices = adjacency.indptr, adjacency.indices
+        offsets = indptr[current].astype(np.int64)
+        degrees = indptr[current + 1] - offsets
+        following = np.empty(len(current), dtype=np.int64)
+
+        # Vertices with tables: the table of the edge the walk arrived by
+        tables = self.table_ptr[edges]
+        tabled = np.flatnonzero(tables >= 0)
+        choice = sample_alias(prob=self.prob, alias=self.alias, offsets=tables[tabled], sizes=degrees[tabled], rng=rng)
+        following[tabled] = offsets[tabled] + choice
+
+        # Other vertices: propose uniformly below an envelope of height max(1, 1/q), accept with a chance of
+        # weight / height. A return weight 1/p above the envelope is folded into an extra area that always returns.
+        # In weighted graphs, neighbors are proposed by their edge weight and accepted by their node2vec weight.
+        weighted = adjacency.is_weighted
+        height = max(1 / self.p, 1, 1 / self.q) if weighted else max(1, 1 / self.q)
+        outlier = 0 if weighted else max(1 / self.p - height, 0)
+        pending = np.flatnonzero(tables < 0)
+        while len(pending):
+            if weighted:
+                returns = np.zeros(len(pending), dtype=bool)
+                proposal = sample_alias(prob=adjacency.prob, alias=adjacency.alias, offsets=offsets[pending],
+                                        sizes=degrees[pending], rng=rng)
+            else:
+                area = rng.random(len(pending)) * (degrees[pending] * height + outlier)
+                returns = area >= degrees[pending] * height
+                following[pending[returns]] = self.reverse_edge[edges[pending[returns]]]
+                proposal = np.minimum((area / height).astype(np.int64), degrees[pending] - 1)
+
+            candidates = indices[offsets[pending] + proposal].astype(np.int64)
+            weights = self._weights(edge_keys=self.edge_keys, num_nodes=len(indptr) - 1, p=self.p, q=self.q,
+                                    previous=previous[pending], candidates=candidates)
+            accepted = ~returns & (rng.random(len(pending)) * height < weights)
+            following[pending[accepted]] = offsets[pending[accepted]] + proposal[accepted]
+            pending = pending[~returns & ~accepted]
+
+        return following
+
+    def save(self, folder: str) -> None:
+        """
+        Stores the tables as .npy files in a folder.
+
+        :param folder:  path to the folder (created if it does not exist)
+        :return:
+        """
+
+        logger.trace('save(%s)', folder)
+
+        makedirs(folder, exist_ok=True)
+        np.save(join(folder, 'node2vec.npy'), np.array([self.p, self.q]))
+        for name in self.ARRAYS:
+            np.save(join(folder, f'{name}.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode: str = 'r') -> 'SecondOrderTables':
+        """
+        Loads tables stored by save() (memory-mapped by default).
+
+        :param folder:      path to the folder
+        :param mmap_mode:   mode for memory-mapping the files (None loads the arrays into memory)
+        :return:            tables
+        """
+
+        logger.trace('load(%s, %s)', folder, mmap_mode)
+
+        p, q = np.load(join(folder, 'node2vec.npy')).tolist()
+        arrays = {name: np.load(join(folder, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(p=p, q=q, **arrays)
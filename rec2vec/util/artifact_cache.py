@@ -0,0 +1,230 @@
+from hashlib import sha256
+from os import chmod, fsync, remove, rename, replace, stat, umask
+from os.path import basename, dirname, exists
+from pickle import load, dump
+from shutil import rmtree
+from tempfile import NamedTemporaryFile, mkdtemp
+from rec2vec import logger
+
+import json
+
+FORMAT_VERSION = 3          # version of stored artifacts, increase whenever their content changes
+HASH_CHUNK_SIZE = 2 ** 20   # number of bytes hashed at once
+
+
+def fingerprint_file(path: str, content_hash: bool = False) -> dict:
+    """
+    Returns a fingerprint of a file that changes whenever the file changes.
+
+    :param path:            path to the file
+    :param content_hash:    whether to include a hash of the content (reads the whole file)
+    :return:                size, modification time and (optionally) sha256 hash of the file
+    """
+
+    logger.trace('fingerprint_file(%s, %s)', path, content_hash)
+
+    file_stat = stat(path)
+    fingerprint = {'path': path, 'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns}
+
+    if content_hash:
+        file_hash = sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        fingerprint['sha256'] = file_hash.hexdigest()
+
+    return fingerprint
+
+
+def artifact_key(section: dict, sources: list[str], content_hash: bool = False, parent: str = '') -> str:
+    """
+    Computes the key of an artifact. The key changes whenever the configuration the artifact was built from,
+    any of its source files or the format version changes.
+
+    :param section:         relevant part of the configuration
+    :param sources:         paths to the source files
+    :param content_hash:    whether to hash the content of the source files
+    :param parent:          key of an artifact this artifact depends on (if any)
+    :return:                hex digest identifying the artifact
+    """
+
+    logger.trace('artifact_key(%s, %s, %s, %s)', section, sources, content_hash, parent)
+
+    description = {'format_version': FORMAT_VERSION,
+                   'parent': parent,
+                   'section': section,
+                   'sources': [fingerprint_file(path=s, content_hash=content_hash) for s in sorted(set(sources))]}
+    return sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _meta_path(path: str) -> str:
+    return path + '.meta.json'
+
+
+def _default_mode(mode: int) -> int:
+    """
+    Returns the permissions a file or directory created with open() or mkdir() would get, i.e. mode without the
+    bits of the umask. Temporary files (0600) and directories (0700) are only accessible by their owner.
+
+    :param mode:    requested permissions (0o666 for files, 0o777 for directories)
+    :return:        permissions after applying the umask
+    """
+
+    mask = umask(0)
+    umask(mask)
+    return mode & ~mask
+
+
+def atomic_write(path: str, write) -> None:
+    """
+    Writes a file atomically: the content is written to a temporary file which then replaces the file.
+    Readers either see the old or the new file, never a partially written one.
+
+    :param path:    path to the file
+    :param write:   function that writes the content to a (binary) file object
+    :return:
+    """
+
+    with NamedTemporaryFile(mode='wb', dir=dirname(path) or '.', delete=False) as f:
+        try:
+            write(f)
+            f.flush()
+            fsync(f.fileno())
+            chmod(f.name, _default_mode(0o666))
+        except BaseException:
+            remove(f.name)
+            raise
+    replace(f.name, path)
+
+
+def read_meta(path: str) -> dict | None:
+    """
+    Returns the metadata of a stored artifact.
+
+    :param path:    path to the artifact
+    :return:        metadata (format version, key, ...) or None if no metadata exists
+    """
+
+    logger.trace('read_meta(%s)', path)
+
+    if not exists(_meta_path(path)):
+        return None
+    with open(_meta_path(path)) as f:
+        return json.load(f)
+
+
+def is_valid(path: str, key: str) -> bool:
+    """
+    Checks whether a stored artifact exists and has been built with the current format and the given key.
+
+    :param path:    path to the artifact
+    :param key:     expected key (see artifact_key())
+    :return:        True if the artifact can be used
+    """
+
+    meta = read_meta(path)
+    return meta is not None and exists(path) and \
+        meta.get('format_version') == FORMAT_VERSION and meta.get('key') == key
+
+
+def load_artifact(path: str, key: str) -> object | None:
+    """
+    Returns a stored (pickled) artifact if it is up-to-date.
+
+    :param path:    path to the artifact
+    :param key:     expected key (see artifact_key())
+    :return:        stored object or None if it does not exist or is stale
+    """
+
+    logger.trace('load_artifact(%s, %s)', path, key)
+
+    if not is_valid(path=path, key=key):
+        logger.debug(f'no up-to-date artifact found at {path}')
+        return None
+
+    logger.debug(f'returning stored object from {path}')
+    with open(path, 'rb') as f:
+        return load(f)
+
+
+def write_meta(path: str, key: str, **extra) -> None:
+    """
+    Writes the metadata of an artifact (atomically).
+
+    :param path:    path to the artifact
+    :param key:     key of the artifact (see artifact_key())
+    :param extra:   additional (json serializable) metadata
+    :return:
+    """
+
+    logger.trace('write_meta(%s, %s, %s)', path, key, extra)
+
+    meta = {'format_version': FORMAT_VERSION, 'key': key, **extra}
+    atomic_write(path=_meta_path(path), write=lambda f: f.write(json.dumps(meta, indent=2).encode()))
+
+
+def invalidate(path: str) -> None:
+    """
+    Removes the metadata of an artifact, so that it is considered stale until new metadata is written.
+
+    :param path:    path to the artifact
+    :return:
+    """
+
+    if exists(_meta_path(path)):
+        remove(_meta_path(path))
+
+
+def store_artifact(obj: object, path: str, key: str, **extra) -> object:
+    """
+    Stores (pickles) and returns an artifact. The artifact and its metadata are written atomically.
+    The old metadata is removed first, which means that an interrupted write leaves a stale artifact
+    behind, never an artifact with wrong metadata.
+
+    :param obj:     object to be stored
+    :param path:    path to the artifact
+    :param key:     key of the artifact (see artifact_key())
+    :param extra:   additional (json serializable) metadata
+    :return:        the stored object
+    """
+
+    logger.trace('store_artifact(%s, %s, %s)', type(obj), path, key)
+
+    invalidate(path=path)
+    atomic_write(path=path, write=lambda f: dump(obj=obj, file=f))
+    write_meta(path, key, **extra)
+    return obj
+
+
+def store_directory_artifact(path: str, key: str, write, **extra) -> None:
+    """
+    Stores an artifact that consists of several files in a directory. The files are written to a temporary
+    directory which then takes the place of the old directory. Processes that still have files of the old
+    directory opened (e.g. memory-mapped) can continue using them.
+
+    :param path:    path to the directory
+    :param key:     key of the artifact (see artifact_key())
+    :param write:   function that writes the files to a (given) directory
+    :param extra:   additional (json serializable) metadata
+    :return:
+    """
+
+    logger.trace('store_directory_artifact(%s, %s)', path, key)
+
+    invalidate(path=path)
+    tmp = mkdtemp(dir=dirname(path.rstrip('/')) or '.', prefix=basename(path.rstrip('/')) + '.')
+    try:
+        write(tmp)
+        chmod(tmp, _default_mode(0o777))
+    except BaseException:
+        rmtree(tmp)
+        raise
+
+    if exists(path):
+        old = tmp + '.old'
+        rename(path, old)
+        rename(tmp, path)
+        rmtree(old)
+    else:
+        rename(tmp, path)
+    write_meta(path, key, **extra)
@@ -0,0 +1,77 @@
+from os import makedirs
+from pickle import load, dump
+from rec2vec import logger
+from rec2vec.util.adjacency import CSRAdjacency
+from rec2vec.util.id_registry import IdRegistry, load_id_registry
+
+
+def save_binary_graph(folder: str, adjacency: CSRAdjacency, node_dict: IdRegistry) -> None:
+    """
+    Stores a graph in the binary format: a folder of .npy files containing the CSR arrays and the node registry.
+
+    :param folder:      path to the folder (created if it does not exist)
+    :param adjacency:   graph in CSR format
+    :param node_dict:   node registry of the graph
+    :return:
+    """
+
+    logger.trace('save_binary_graph(%s)', folder)
+
+    makedirs(folder, exist_ok=True)
+    adjacency.save(folder=folder)
+    node_dict.save(folder=folder)
+
+
+def load_binary_graph(folder: str, mmap_mode: str = 'r') -> tuple[CSRAdjacency, IdRegistry]:
+    """
+    Opens a graph stored in the binary format. By default, all arrays are memory-mapped, which takes
+    (nearly) constant time, and processes that open the same folder share the pages in memory.
+
+    :param folder:      path to the folder
+    :param mmap_mode:   mode for memory-mapping the files (None loads the arrays into memory)
+    :return:            graph in CSR format and its node registry
+    """
+
+    logger.trace('load_binary_graph(%s, %s)', folder, mmap_mode)
+
+    return CSRAdjacency.load(folder=folder, mmap_mode=mmap_mode), IdRegistry.load(folder=folder, mmap_mode=mmap_mode)
+
+
+def import_pickle(graph_path: str, node_dict_path: str, folder: str) -> None:
+    """
+    Converts a pickled graph (dictionary of neighbor lists) and node dictionary to the binary format.
+
+    :param graph_path:      path to the pickled graph
+    :param node_dict_path:  path to the pickled node dictionary
+    :param folder:          path to the folder of the binary graph
+    :return:
+    """
+
+    logger.trace('import_pickle(%s, %s, %s)', graph_path, node_dict_path, folder)
+
+    node_dict = load_id_registry(path=node_dict_path)
+    with open(graph_path, 'rb') as f:
+        graph = load(f)
+
+    num_nodes = max(node_dict.num_ids, max(graph.keys(), default=-1) + 1)
+    save_binary_graph(folder=folder, adjacency=CSRAdjacency.from_dict(graph=graph, num_nodes=num_nodes),
+                      node_dict=node_dict)
+
+
+def export_pickle(folder: str, graph_path: str, node_dict_path: str) -> None:
+    """
+    Converts a graph in the binary format to a pickled graph (dictionary of neighbor lists) and node dictionary.
+
+    :param folder:          path to the folder of the binary graph
+    :param graph_path:      path to the pickled graph
+    :param node_dict_path:  path to the pickled node dictionary
+    :return:
+    """
+
+    logger.trace('export_pickle(%s, %s, %s)', folder, graph_path, node_dict_path)
+
+    adjacency, node_dict = load_binary_graph(folder=folder)
+    with open(graph_path, 'wb') as f:
+        dump(obj=adjacency.to_dict(), file=f)
+    with open(node_dict_path, 'wb') as f:
+        dump(obj=node_dict, file=f)
@@ -1,16 +1,70 @@
 from rec2vec import logger
-from chardet import detect
+from chardet.universaldetector import UniversalDetector
+from os import stat
+from os.path import abspath
 
+DETECTION_BUDGET = 2 ** 20  # maximum number of bytes read to detect an encoding
+CHUNK_SIZE = 2 ** 16        # number of bytes fed to the detector at once
 
-def get_encoding(file: str) -> str:
+_detected_encodings = {}  # detected encodings by (path, size, modification time)
+
+
+def get_encoding(file: str, encoding: str = None, budget: int = DETECTION_BUDGET) -> str:
     """
     Returns the (automatically detected) encoding of a file.
 
-    :param file:    path to a file
-    :return:        encoding of that file
+    The file is read in chunks until the detector is confident or the budget is used up. Results are cached
+    by path, size and modification time, so that every file is only read once as long as it does not change.
+
+    :param file:        path to a file
+    :param encoding:    encoding of the file, if known (skips the detection)
+    :param budget:      maximum number of bytes to be read
+    :return:            encoding of that file
     """
 
-    logger.trace(f'get_encoding({file})')
+    logger.trace('get_encoding(%s, %s, %s)', file, encoding, budget)
+
+    if encoding is not None:
+        return encoding
 
+    file_stat = stat(file)
+    key = (abspath(file), file_stat.st_size, file_stat.st_mtime_ns)
+    if key in _detected_encodings:
+        return _detected_encodings[key]
+
+    detector = UniversalDetector()
+    bytes_read = 0
     with open(file, 'rb') as f:
-        return detect(f.read())['encoding']
+        while not detector.done and bytes_read < budget:
+            chunk = f.read(min(CHUNK_SIZE, budget - bytes_read))
+            if not chunk:
+                break
+            detector.feed(chunk)
+            bytes_read += len(chunk)
+    detected = detector.close()['encoding']
+
+    # Only the beginning of the file has been read, the rest might contain non-ascii characters
+    if detected == 'ascii' and bytes_read < file_stat.st_size:
+        detected = 'utf-8'
+
+    logger.debug(f'detected encoding {detected} for {file} ({bytes_read} bytes read)')
+
+    _detected_encodings[key] = detected
+    return detected
+
+
+def get_source_encoding(file: str, config: dict, source: dict = None) -> str:
+    """
+    Returns the encoding of a data source. The encoding can be configured for each source (e.g. nodes.movies)
+    or for all sources (data.encoding). If no encoding is configured, it is detected automatically.
+
+    :param file:    path to the data source
+    :param config:  configuration of the graph
+    :param source:  configuration of the source (node or edge), if any
+    :return:        encoding of the data source
+    """
+
+    logger.trace('get_source_encoding(%s, %s)', file, source)
+
+    encoding = (source or {}).get('encoding', config['data'].get('encoding'))
+    return get_encoding(file=file, encoding=encoding)
@@ -0,0 +1,143 @@
+from os.path import join
+from typing import Iterator, NamedTuple
+from rec2vec import logger
+
+import numpy as np
+
+RUN_BYTES_PER_KEY = 40      # memory per key while a run is sorted (key, weight, sort order and temporary copies)
+MERGE_BYTES_PER_KEY = 64    # memory per key while runs are merged (blocks of all runs, concatenation and sorting)
+
+
+class Run(NamedTuple):
+    """
+    A sorted run of edge keys (key = source * num_nodes + target) spilled to disk (see write_runs()).
+    """
+    keys: str               # path to the sorted, unique keys (.npy)
+    weights: str | None     # path to the summed weight of each key (.npy), None if the keys are not weighted
+    group: int              # group (e.g. edge source) the keys belong to, unweighted keys count once per group
+    size: int               # number of keys
+
+
+def dedupe(keys: np.ndarray, weights: np.ndarray = None) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Sorts keys and removes duplicates. The weights of duplicate keys are summed.
+
+    :param keys:    keys (e.g. of edges)
+    :param weights: weight of each key (optional)
+    :return:        sorted unique keys and their summed weights (None without weights)
+    """
+
+    if weights is None:
+        return np.unique(keys), None
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+
+
+def write_runs(chunks: Iterator[tuple[np.ndarray, np.ndarray | None, int]], folder: str,
+               max_keys: int) -> list[Run]:
+    """
+    Collects chunks of keys in a buffer of at most max_keys keys (or a chunk, if it is larger) and writes each
+    full buffer as a sorted run without duplicates. A run only contains chunks with the same group and with or
+    without weights alike, i.e. a new run starts when either changes.
+
+    :param chunks:      keys, weights (or None) and group of each chunk
+    :param folder:      folder the runs are written to
+    :param max_keys:    maximum number of keys buffered in memory
+    :return:            runs in the order they were written
+    """
+
+    logger.trace('write_runs(%s, %s)', folder, max_keys)
+
+    runs = []
+    buffer, kind, buffered = [], None, 0
+
+    def flush():
+        if not buffer:
+            return
+        keys, weights = dedupe(keys=np.concatenate([k for k, _ in buffer]),
+                               weights=None if kind[0] else np.concatenate([w for _, w in buffer]))
+        path = join(folder, f'run_{len(runs):06d}')
+        np.save(path + '.keys.npy', keys)
+        if weights is not None:
+            np.save(path + '.weights.npy', weights)
+        runs.append(Run(keys=path + '.keys.npy', weights=None if weights is None else path + '.weights.npy',
+                        group=kind[1], size=len(keys)))
+        buffer.clear()
+
+    for keys, weights, group in chunks:
+        if (weights is None, group) != kind or buffered + len(keys) > max_keys:
+            flush()
+            kind, buffered = (weights is None, group), 0
+        buffer.append((keys, weights))
+        buffered += len(keys)
+    flush()
+
+    logger.debug(f'wrote {len(runs)} runs of {sum(run.size for run in runs)} keys')
+    return runs
+
+
+def merge_runs(runs: list[Run], block_keys: int, weighted: bool = False) \
+        -> Iterator[tuple[np.ndarray, np.ndarray | None]]:
+    """
+    Merges sorted runs into one sorted sequence of unique keys, block by block (k-way merge). Every step reads a
+    block of every run (memory-mapped) and emits all keys up to the smallest last key of these blocks: all copies
+    of these keys have been read by then, so they can be deduplicated completely.
+
+    With weighted=True, the weights of a key are summed over all runs. Keys of runs without weights count 1 per
+    group, no matter how often they appear in the runs of that group.
+
+    :param runs:        runs to be merged (see write_runs())
+    :param block_keys:  maximum number of keys read at once (of all runs together)
+    :param weighted:    whether to sum weights (otherwise keys are only deduplicated)
+    :return:            sorted unique keys and their weights (None if not weighted), block by block
+    """
+
+    logger.trace('merge_runs(%s, %s, %s)', len(runs), block_keys, weighted)
+
+    runs = [run for run in runs if run.size > 0]
+    keys = [np.load(run.keys, mmap_mode='r') for run in runs]
+    weights = [None if run.weights is None else np.load(run.weights, mmap_mode='r') for run in runs]
+    positions = [0] * len(runs)
+    step = max(block_keys // max(len(runs), 1), 1)
+
+    while True:
+        active = [i for i in range(len(runs)) if positions[i] < runs[i].size]
+        if not active:
+            return
+
+        # Keys up to the smallest last key of all blocks are complete (exhausted runs do not limit them)
+        blocks = {i: keys[i][positions[i]:positions[i] + step] for i in active}
+        limited = [blocks[i][-1] for i in active if positions[i] + step < runs[i].size]
+        bound = min(limited) if limited else None
+
+        taken_keys, taken_weights, groups = [], [], []
+        for i in active:
+            end = len(blocks[i]) if bound is None else int(np.searchsorted(blocks[i], bound, side='right'))
+            taken_keys.append(np.asarray(blocks[i][:end], dtype=np.int64))
+            if weighted:
+                if weights[i] is None:
+                    taken_weights.append(None)
+                    groups.append(np.full(end, runs[i].group, dtype=np.int64))
+                else:
+                    taken_weights.append(np.asarray(weights[i][positions[i]:positions[i] + end], dtype=np.float64))
+                    groups.append(None)
+            positions[i] += end
+
+        if not weighted:
+            yield dedupe(keys=np.concatenate(taken_keys))
+            continue
+
+        # Unweighted keys count once per group, weighted keys with their weight
+        distinct = [k for k, w in zip(taken_keys, taken_weights) if w is None]
+        summed = [(k, w) for k, w in zip(taken_keys, taken_weights) if w is not None]
+        parts_keys, parts_weights = [k for k, _ in summed], [w for _, w in summed]
+        if distinct:
+            distinct_keys = np.concatenate(distinct)
+            distinct_groups = np.concatenate([g for g in groups if g is not None])
+            order = np.lexsort((distinct_groups, distinct_keys))
+            distinct_keys, distinct_groups = distinct_keys[order], distinct_groups[order]
+            first = np.ones(len(distinct_keys), dtype=bool)
+            first[1:] = (distinct_keys[1:] != distinct_keys[:-1]) | (distinct_groups[1:] != distinct_groups[:-1])
+            parts_keys.append(distinct_keys[first])
+            parts_weights.append(np.ones(int(first.sum())))
+        yield dedupe(keys=np.concatenate(parts_keys), weights=np.concatenate(parts_weights))
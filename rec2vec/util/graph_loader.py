@@ -1,133 +1,343 @@
 from rec2vec.util.load_config import load_config
-from os.path import exists
-from pickle import load, dump
 from tqdm import tqdm
 from rec2vec import logger
-from rec2vec.util.encoding_detector import get_encoding
-
+from rec2vec.util.artifact_cache import artifact_key, load_artifact, store_artifact
+from rec2vec.util.encoding_detector import get_source_encoding
+from rec2vec.util.id_registry import IdRegistry
+from rec2vec.util.profiling import profiled
+from os import listdir
+from os.path import isdir
+from typing import IO, Iterator, NamedTuple
+
+import numpy as np
 import pandas as pd
 
+INCREMENTS_FOLDER = 'increments/'   # folder (within the output folder) containing increments
+INCREMENT_ENCODING = 'utf-8'        # encoding of increments
+BYTES_PER_ROW = 512                 # estimated memory per row while a chunk of a source is parsed and mapped to ids
+
 
-def _extend_id(original_id: str, extension_range: str) -> list[str]:
+class NodePlan(NamedTuple):
+    """
+    Compiled configuration of a node type (see _compile_node_plan()).
     """
-    Returns the extended id for nodes that extend a node type.
-    E.g. rating extends movie:
-    m_932 -> [m_932_1, m_932_2, m_932_3, m_932_4, m_932_5]
+    column: str                 # column containing the original ids
+    prefix: str                 # prefix of generated ids (e.g. 'm_'), empty string if no prefix is configured
+    extended_by: str | None     # node type that extends this node type (e.g. ratings), None if not extended
+    suffixes: list[str]         # suffixes of extending nodes (e.g. ['0', '1', ..., '5']), empty if not extended
+
+
+class VertexPlan(NamedTuple):
+    """
+    Compiled configuration of one vertex of an edge (see _compile_vertex_plan()).
+    """
+    column: str                 # column containing the original ids
+    type: str                   # node type of the vertex
+    prefix: str                 # prefix of generated ids (e.g. 'm_'), empty string if no prefix is configured
+    extend_with: str | None     # column containing the extension (e.g. rating), None if the vertex is not extending
+    extending: str | None       # node type the vertex extends (e.g. movies), None if the vertex is not extending
+
+
+def _extension_suffixes(extension_range: str) -> list[str]:
+    """
+    Returns the suffixes of the ids of nodes that extend a node type.
+    E.g. rating extends movie with range 1-5:
+    ['1', '2', '3', '4', '5'] (m_932 -> [m_932_1, m_932_2, m_932_3, m_932_4, m_932_5])
 
-    :param original_id:         id of extended node
     :param extension_range:     range of extension (e.g. 1-5)
-    :return:                    returns list of generated ids
+    :return:                    list of suffixes
     """
 
-    logger.trace(f'_extend_id({original_id}, {extension_range})')
+    logger.trace('_extension_suffixes(%s)', extension_range)
 
     lower_bound = int(extension_range.split('-')[0])
     upper_bound = int(extension_range.split('-')[1]) + 1  # range(x, y) -> y is exclusive
-    return [f'{original_id}_{str(i)}' for i in range(lower_bound, upper_bound)]
+    return [str(i) for i in range(lower_bound, upper_bound)]
 
 
-def _return_dict_if_exists(path: str) -> dict | None:
+def get_artifact_location(config: dict, name: str) -> str:
     """
-    Returns a stored object if it exists.
+    Returns the location of a stored artifact (e.g. node_dict or final_graph) as configured in data.objects.
 
-    :param path:    path to the (potentially stored) object (= file)
-    :return:        stored object or None if that object could not be found
+    :param config:  configuration of the graph
+    :param name:    name of the artifact in data.objects
+    :return:        path to the artifact
     """
 
-    logger.trace(f'_return_dict_if_exists({path})')
+    return config['data']['output_folder'] + config['data']['objects'][name]
+
+
+def _data_section(config: dict) -> dict:
+    """
+    Returns the settings of the data section that change how sources are parsed.
+
+    :param config:  configuration of the graph
+    :return:        folder, separator and encoding of the data sources
+    """
+
+    return {k: config['data'].get(k) for k in ('folder', 'separator', 'encoding')}
+
+
+def node_dict_cache_key(config: dict) -> str:
+    """
+    Computes the key of the node dictionary. It changes whenever the node configuration or one of
+    the node sources changes.
+
+    :param config:  configuration of the graph
+    :return:        key of the node dictionary
+    """
+
+    logger.trace('node_dict_cache_key(%s)', config)
+
+    sources = [config['data']['folder'] + node['source'] for node in config['nodes'].values()] + \
+        [path for path, _ in list_increments(config=config)]
+    return artifact_key(section={'data': _data_section(config), 'nodes': config['nodes']}, sources=sources,
+                        content_hash=config['data'].get('content_hash', False))
+
+
+def graph_cache_key(config: dict) -> str:
+    """
+    Computes the key of the graph. It changes whenever the node dictionary (see node_dict_cache_key()),
+    the edge configuration or one of the edge sources changes.
+
+    :param config:  configuration of the graph
+    :return:        key of the graph
+    """
+
+    logger.trace('graph_cache_key(%s)', config)
+
+    sources = [config['data']['folder'] + edge['source'] for edge in config['edges'].values()]
+    return artifact_key(section={'data': _data_section(config), 'edges': config['edges']}, sources=sources,
+                        content_hash=config['data'].get('content_hash', False), parent=node_dict_cache_key(config))
+
+
+def get_increments_folder(config: dict) -> str:
+    """
+    Returns the folder containing the increments, i.e. edge rows that have been added after the graph
+    was constructed (see incremental.ingest_edges()).
+
+    :param config:  configuration of the graph
+    :return:        path to the folder
+    """
+
+    return config['data']['output_folder'] + INCREMENTS_FOLDER
+
+
+def list_increments(config: dict) -> list[tuple[str, str]]:
+    """
+    Returns all increments in the order they were added. Increments are named <sequence number>.<edge>.csv
+
+    :param config:  configuration of the graph
+    :return:        path to each increment and the name of the edge its rows belong to
+    """
+
+    folder = get_increments_folder(config=config)
+    if not isdir(folder):
+        return []
+    return [(folder + name, name.split('.')[1]) for name in sorted(listdir(folder)) if name.endswith('.csv')]
 
-    if exists(path):
-        filehandler = open(file=path, mode='rb')
-        stored_object = load(filehandler)
-        filehandler.close()
-        return stored_object
-    return None
+
+def get_memory_budget(config: dict) -> int | None:
+    """
+    Returns the memory budget of the graph construction (data.memory_budget, in bytes). With a budget, sources
+    are read in chunks and the edges are sorted out of core (see Graph and CSRAdjacency.from_edge_chunks()).
+
+    :param config:  configuration of the graph
+    :return:        budget in bytes, None if sources are read at once
+    """
+
+    budget = config['data'].get('memory_budget')
+    return None if budget is None else int(float(budget))
+
+
+def get_chunk_rows(config: dict) -> int | None:
+    """
+    Returns the number of rows read at once from a source: a quarter of the memory budget is used for parsing.
+
+    :param config:  configuration of the graph
+    :return:        number of rows per chunk, None if sources are read at once
+    """
+
+    budget = get_memory_budget(config=config)
+    return None if budget is None else max(budget // 4 // BYTES_PER_ROW, 1)
 
 
-def _store_and_return_dict(obj: dict, path: str) -> dict:
+def _read_csv(path: str, separator: str, encoding: str, usecols: list[str] = None,
+              chunk_rows: int = None) -> Iterator[pd.DataFrame]:
     """
-    Stores and returns object.
+    Reads a csv file at once or in chunks, restricted to the columns that are needed.
+
+    :param path:        path to the csv file
+    :param separator:   separator of the columns
+    :param encoding:    encoding of the file
+    :param usecols:     columns to be read (by default: all columns)
+    :param chunk_rows:  number of rows per chunk (by default: all rows in one chunk)
+    :return:            iterator over data frames
+    """
+
+    logger.trace('_read_csv(%s, %s, %s)', path, usecols, chunk_rows)
+
+    if chunk_rows is None:
+        yield pd.read_csv(filepath_or_buffer=path, sep=separator, encoding=encoding, usecols=usecols)
+        return
+    with pd.read_csv(filepath_or_buffer=path, sep=separator, encoding=encoding, usecols=usecols,
+                     chunksize=chunk_rows) as reader:
+        yield from reader
 
-    :param obj:     dictionary to be stored
-    :param path:    path to the place where the dictionary should be stored
-    :return:        dictionary
+
+def _edge_columns(edge: dict) -> list[str]:
     """
+    Returns the columns of an edge source that are needed to construct the edge (including its weight column).
 
-    logger.trace(f'_store_and_return_dict({obj}, {path})')
+    :param edge:    configuration of the edge
+    :return:        names of the columns
+    """
 
-    filehandler = open(file=path, mode='wb')
-    dump(obj=obj, file=filehandler)
-    filehandler.close()
-    return obj
+    columns = []
+    for vertex in ('vertex1', 'vertex2'):
+        for key in ('column', 'extend_with'):
+            if key in edge[vertex] and edge[vertex][key] not in columns:
+                columns.append(edge[vertex][key])
+    if isinstance(edge.get('weight'), str) and edge['weight'] not in columns:
+        columns.append(edge['weight'])
+    return columns
 
 
-def _remove_zero_decimal_place(s: str) -> str:
+def _read_increment(path: str | IO[bytes], config: dict) -> pd.DataFrame:
     """
-    Removes the last two characters if string ends with sequence '.0'.
+    Reads the rows of an increment.
+
+    :param path:    path to the increment (or a binary buffer containing it)
+    :param config:  configuration of the graph
+    :return:        data frame containing the rows
+    """
+
+    logger.trace('_read_increment(%s)', path)
+
+    return pd.read_csv(filepath_or_buffer=path, sep=config['data']['separator'], encoding=INCREMENT_ENCODING)
+
+
+def _remove_zero_decimal_places(values: pd.Series) -> pd.Series:
+    """
+    Removes the last two characters of every string that ends with sequence '.0'.
     E.g. '75.0' -> '75'
 
-    :param s:   any string (usually a numeric ID)
-    :return:    string without '.0' at the end
+    :param values:  strings (usually numeric IDs)
+    :return:        strings without '.0' at the end
     """
 
-    logger.trace(f'_remove_zero_decimal_place({s})')
+    logger.trace('_remove_zero_decimal_places(%s)', len(values))
 
-    return s[:-2] if s.endswith('.0') else s
+    return values.str.replace(r'\.0\Z', '', regex=True)
 
 
-def _generate_id(value: str, node: dict) -> str:
+def _generate_ids(values: pd.Series, prefix: str) -> pd.Series:
     """
-    Generates an ID for the node dictionary. If configured, a prefix is added to the
-    original ID to distinguish nodes of different types from each other.
+    Generates IDs for the node dictionary. If configured, a prefix is added to the
+    original IDs to distinguish nodes of different types from each other.
     E.g. movie node 932 -> m_932
 
-    If no prefix is configured, the ID stays the same.
+    If no prefix is configured, the IDs stay the same.
 
-    :param value:   original ID
-    :param node:    corresponding node in configuration (e.g. nodes.movies)
-    :return:        generated ID
+    :param values:  original IDs (column of a data frame)
+    :param prefix:  prefix including the underscore (e.g. 'm_') or empty string
+    :return:        generated IDs
     """
 
-    logger.trace(f'_generate_id({value}, {node})')
+    logger.trace('_generate_ids(%s, %s)', len(values), prefix)
+
+    return prefix + _remove_zero_decimal_places(values.astype(str))
 
-    v = _remove_zero_decimal_place(value)
-    return f'{node["id_prefix"]}_{v}' if 'id_prefix' in node else v
 
+def _compile_node_plan(node: dict) -> NodePlan:
+    """
+    Extracts everything that is needed to generate the IDs of a node type from its configuration,
+    so that the configuration does not have to be looked up for each row.
 
-def load_nodes(config: dict = None) -> dict[str, dict[str, str]]:
+    :param node:    node in configuration (e.g. nodes.movies)
+    :return:        compiled configuration
+    """
+
+    logger.trace('_compile_node_plan(%s)', node)
+
+    return NodePlan(column=node['column'],
+                    prefix=f'{node["id_prefix"]}_' if 'id_prefix' in node else '',
+                    extended_by=node['extended']['by'] if 'extended' in node else None,
+                    suffixes=_extension_suffixes(node['extended']['range']) if 'extended' in node else [])
+
+
+def _add_nodes(original_ids_dict: IdRegistry, node_name: str, plan: NodePlan, generated_ids: pd.Series,
+               id_counter: int) -> int:
+    """
+    Adds nodes to the node registry. Every node uses one unique ID, plus one for each extending node
+    (if a node is extended by another node). IDs are assigned in the order of the generated IDs.
+    The IDs of the extending nodes (E.g. [m_932_1, m_932_2, m_932_3, m_932_4, m_932_5]) are not stored,
+    the registry computes them (see IdRegistry).
+
+    :param original_ids_dict:   registry mapping generated IDs to unique IDs (updated)
+    :param node_name:           node type of the nodes
+    :param plan:                compiled configuration of the node type
+    :param generated_ids:       generated IDs of the nodes (see _generate_ids())
+    :param id_counter:          next unique ID
+    :return:                    next unique ID after adding the nodes
+    """
+
+    logger.trace('_add_nodes(%s, %s, %s, %s)', node_name, plan, len(generated_ids), id_counter)
+
+    return original_ids_dict.add(node_type=node_name, keys=generated_ids.to_numpy(dtype=str), first_id=id_counter,
+                                 extended_by=plan.extended_by, suffixes=plan.suffixes)
+
+
+def count_ids(node_dict: IdRegistry, graph: dict = None) -> int:
+    """
+    Returns the number of unique ids (highest unique id + 1) in a node registry and (optionally) a graph.
+    This is also the next unique id that load_nodes() would assign.
+
+    :param node_dict:   registry mapping original ids to unique ids
+    :param graph:       dictionary of neighbor lists
+    :return:            number of unique ids
+    """
+
+    num_ids = node_dict.num_ids
+    if graph is not None:
+        num_ids = max(num_ids, max(graph.keys(), default=-1) + 1)
+    return num_ids
+
+
+@profiled('load_nodes')
+def load_nodes(config: dict = None) -> IdRegistry:
     """
     Loads all nodes from csv files. Node types, data sources and target columns
     have to be specified in the corresponding graph_config.yaml file.
 
-    The final dictionary maps generated IDs to a unique ID.
-    original_ids_dict = { 'm_932': 1, 'm_1238': 2 }
+    The final registry maps generated IDs to a unique ID, by node type.
+    original_ids_dict['movies'] = { 'm_932': 1, 'm_1238': 2 }
 
     This way, the original (but potentially processed) IDs (that are needed for
     constructing the graph) point to a unique ID that identifies a certain node.
     This is helpful because the rest of the application can use unique IDs.
+    The registry stores arrays instead of a dictionary (see IdRegistry).
 
     :param config:
     :return:
     """
 
-    logger.trace(f'load_nodes({config})')
+    logger.trace('load_nodes(%s)', config)
 
     if config is None:
         config = load_config()
 
     logger.debug(f'load_nodes({config})')
 
-    output_folder = config['data']['output_folder']
-    node_dict_location = output_folder + config['data']['objects']['node_dict']
+    node_dict_location = get_artifact_location(config=config, name='node_dict')
+    key = node_dict_cache_key(config=config)
 
-    # If graph has been constructed once already, just load stored graph
-    stored_object = _return_dict_if_exists(node_dict_location)
+    # If the nodes have been extracted once already (and nothing changed since), just load stored nodes
+    stored_object = load_artifact(path=node_dict_location, key=key)
     if stored_object is not None:
-        logger.debug(f'returning stored object from {node_dict_location}')
         return stored_object
-    logger.debug(f'no object found at {node_dict_location}')
 
-    original_ids_dict = {}
+    original_ids_dict = IdRegistry()
     id_counter = 0  # counter for to ensure uniqueness of IDs
 
     logger.info('extracting nodes...')
@@ -135,38 +345,28 @@ def load_nodes(config: dict = None) -> dict[str, dict[str, str]]:
     # For every configured node...
     for node in tqdm(config['nodes']):
         node_name = node
-        node = config['nodes'][node]
-
-        # Add an entry to the dictionary
-        original_ids_dict[node_name] = {}
-
-        # Read the data source which contains the data of that node type line by line...
-        filepath = config['data']['folder'] + node['source']
-        df = pd.read_csv(filepath_or_buffer=filepath,
-                         sep=config['data']['separator'],
-                         encoding=get_encoding(file=filepath))
-        for _, row in df.iterrows():
-            # Generate an ID that contains the prefix of a node and add it to the dictionary
-            # <prefix_id, [unique_id]> | <m_932, 1>
-            generated_id = _generate_id(value=str(row[node['column']]), node=node)
-            original_ids_dict[node_name][generated_id] = id_counter
+        plan = _compile_node_plan(node=config['nodes'][node])
 
-            # If a node is extended by another node...
-            if 'extended' in node:
+        # Read the data source which contains the data of that node type (in chunks, if there is a memory budget)
+        filepath = config['data']['folder'] + config['nodes'][node]['source']
+        for df in _read_csv(path=filepath, separator=config['data']['separator'],
+                            encoding=get_source_encoding(file=filepath, config=config, source=config['nodes'][node]),
+                            usecols=[plan.column], chunk_rows=get_chunk_rows(config=config)):
 
-                # Add the extending node type to the dictionary if it does not already exist
-                if node['extended']['by'] not in original_ids_dict:
-                    original_ids_dict[node['extended']['by']] = {}
+            # Generate IDs that contain the prefix of a node and add them to the dictionary
+            # <prefix_id, [unique_id]> | <m_932, 1>
+            generated_ids = _generate_ids(values=df[plan.column], prefix=plan.prefix)
+            id_counter = _add_nodes(original_ids_dict=original_ids_dict, node_name=node_name, plan=plan,
+                                    generated_ids=generated_ids, id_counter=id_counter)
 
-                # Generate a list of ids for the extending node type and store nodes in dictionary
-                # E.g. [m_932_1, m_932_2, m_932_3, m_932_4, m_932_5]
-                for extended_id in _extend_id(original_id=generated_id, extension_range=node['extended']['range']):
-                    id_counter += 1
-                    original_ids_dict[node['extended']['by']][extended_id] = id_counter
-            id_counter += 1
+    # Add nodes that only appear in increments (see incremental.ingest_edges()), after all other nodes
+    for path, edge_name in list_increments(config=config):
+        id_counter = _add_increment_nodes(config=config, edge=config['edges'][edge_name],
+                                          df=_read_increment(path=path, config=config),
+                                          original_ids_dict=original_ids_dict, id_counter=id_counter)
 
     logger.info('storing extracted nodes...')
-    return _store_and_return_dict(obj=original_ids_dict, path=node_dict_location)
+    return store_artifact(obj=original_ids_dict, path=node_dict_location, key=key)
 
 
 def _get_prefix(edge: dict, vertex: str, config: dict) -> str:
@@ -179,7 +379,7 @@ def _get_prefix(edge: dict, vertex: str, config: dict) -> str:
     :return:        id prefix for a vertex type (E.g. 'm_') or empty string if no prefix defined
     """
 
-    logger.trace(f'_get_prefix({edge}, {vertex}, {config})')
+    logger.trace('_get_prefix(%s, %s, %s)', edge, vertex, config)
 
     # If the node is extending another node, use the id_prefix of the extended node type
     # E.g. a rating has id_prefix m_ because it extends movies
@@ -196,61 +396,194 @@ def _get_prefix(edge: dict, vertex: str, config: dict) -> str:
         return ''
 
 
-def _get_vertex_value_and_type(edge: dict, config: dict, row: pd.Series, vertex: str) -> tuple[str, str]:
+def _compile_vertex_plan(edge: dict, vertex: str, config: dict) -> VertexPlan:
     """
-    Returns the generated ID and the type of node referenced in the row.
+    Extracts everything that is needed to generate the IDs of a vertex in an edge from the configuration,
+    so that the configuration does not have to be looked up for each row.
 
     :param edge:    an edge that connects vertices
-    :param config:  configuration that stores columns of interest
-    :param row:     row containing columns of interest
     :param vertex:  a string specifying which vertex is under observation (depending on configuration)
-    :return:        ID and type of vertex referenced in a row
+    :param config:  configuration that specifies prefixes
+    :return:        compiled configuration
+    """
+
+    logger.trace('_compile_vertex_plan(%s, %s, %s)', edge, vertex, config)
+
+    return VertexPlan(column=edge[f'vertex{vertex}']['column'],
+                      type=edge[f'vertex{vertex}']['type'],
+                      prefix=_get_prefix(edge=edge, vertex=vertex, config=config),
+                      extend_with=edge[f'vertex{vertex}'].get('extend_with'),
+                      extending=edge[f'vertex{vertex}'].get('extending'))
+
+
+def _get_extensions(plan: VertexPlan, df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the extensions of the vertices referenced in a data frame (one per row).
+    Extensions are truncated to integers, E.g. rating 4.5 -> 4 (m_932_4)
+
+    :param plan:    compiled configuration of the (extending) vertex
+    :param df:      data frame containing columns of interest
+    :return:        extensions
+    """
+
+    logger.trace('_get_extensions(%s, %s)', plan, len(df))
+
+    extensions = df[plan.extend_with]
+    extensions = extensions.astype(np.int64) if pd.api.types.is_numeric_dtype(extensions) else extensions.map(int)
+    return extensions.to_numpy(dtype=np.int64)
+
+
+def _lookup_unique_ids(plan: VertexPlan, df: pd.DataFrame, original_ids_dict: IdRegistry) -> np.ndarray:
     """
+    Looks up the unique IDs of the vertices referenced in a data frame (one per row). Extending vertices
+    (E.g. m_932_4) are looked up by the node they extend and their extension, their IDs are not generated.
 
-    logger.trace(f'_get_vertex_value_and_type({edge}, {config}, {row}, {vertex})')
+    :param plan:                compiled configuration of the vertex
+    :param df:                  data frame containing columns of interest
+    :param original_ids_dict:   registry mapping generated IDs to unique IDs (see load_nodes())
+    :return:                    unique IDs
+    """
+
+    logger.trace('_lookup_unique_ids(%s, %s)', plan, len(df))
 
-    if 'extend_with' not in edge[f'vertex{vertex}']:
-        value = _remove_zero_decimal_place(str(row[edge[f'vertex{vertex}']['column']]))
-        return _get_prefix(edge=edge, vertex=vertex, config=config) + value,  \
-            edge[f'vertex{vertex}']['type']
+    values = _generate_ids(values=df[plan.column], prefix=plan.prefix)
+    extensions = None if plan.extend_with is None else _get_extensions(plan=plan, df=df)
+    if extensions is None:
+        unique_ids = original_ids_dict.lookup(node_type=plan.type, keys=values)
+    elif plan.extending is not None:
+        unique_ids = original_ids_dict.lookup_extension(node_type=plan.extending, keys=values, suffixes=extensions)
     else:
-        extension = _remove_zero_decimal_place(str(round(int(row[edge[f'vertex{vertex}']['extend_with']]))))
-        value = _remove_zero_decimal_place(str(row[edge[f'vertex{vertex}']['column']]))
-        return _get_prefix(edge=edge, vertex=vertex, config=config) + value + f'_{extension}', \
-            edge[f'vertex{vertex}']['type']
+        unique_ids = original_ids_dict.lookup(node_type=plan.type, keys=values + '_' + extensions.astype(str))
+
+    missing = unique_ids < 0
+    if missing.any():
+        row = int(np.argmax(missing))
+        if plan.extending is not None and \
+                original_ids_dict.extension_offsets(node_type=plan.extending, suffixes=extensions[row:row + 1])[0] < 0:
+            # The extended node may exist, but the extension is out of range (E.g. rating 7 of m_932)
+            raise KeyError(f'{values.iloc[row]}_{extensions[row]} ({extensions[row]} is not one of the extensions '
+                           f'{original_ids_dict.extensions[plan.extending][1]} of {plan.extending})')
+        raise KeyError(values.iloc[row] + ('' if extensions is None else f'_{extensions[row]}'))
+    return unique_ids
+
+
+def _get_edge_arrays(config: dict, edge: dict, df: pd.DataFrame, original_ids_dict: IdRegistry) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the unique IDs of the vertices connected by the rows of a data frame.
 
+    :param config:              configuration that defines edges between vertices
+    :param edge:                configuration of the edge
+    :param df:                  data frame containing the rows of the edge source
+    :param original_ids_dict:   registry mapping generated IDs to unique IDs (see load_nodes())
+    :return:                    unique IDs of the first and the second vertex of every row
+    """
 
-def load_edges(config: dict = None) -> dict[str, list[str]]:
+    logger.trace('_get_edge_arrays(%s, %s)', edge, len(df))
+
+    v1_plan = _compile_vertex_plan(edge=edge, vertex='1', config=config)
+    v2_plan = _compile_vertex_plan(edge=edge, vertex='2', config=config)
+
+    # Look up unique IDs using the generated IDs
+    return _lookup_unique_ids(plan=v1_plan, df=df, original_ids_dict=original_ids_dict), \
+        _lookup_unique_ids(plan=v2_plan, df=df, original_ids_dict=original_ids_dict)
+
+
+def is_weighted(config: dict) -> bool:
     """
-    Loads edges, meaning it connects vertices that are created from the function load_nodes().
-    The combination of edges and vertices form a unidirectional graph.
+    Returns whether the graph of a configuration has edge weights, i.e. whether at least one edge has a weight.
 
-    :param config:  configuration that defines edges between vertices
-    :return:        dictionary <id, [neighbor1.id, neighbor2.id, ...]
+    :param config:  configuration of the graph
+    :return:        True if any edge is weighted
     """
 
-    logger.trace(f'load_edges({config})')
+    return any('weight' in edge for edge in config['edges'].values())
 
-    if config is None:
-        config = load_config()
 
-    logger.debug(f'load_edges({config})')
+def _get_edge_weights(edge: dict, df: pd.DataFrame, v1_ids: np.ndarray, v2_ids: np.ndarray) -> np.ndarray:
+    """
+    Returns the weight of every row of a data frame. The weight of an edge is either a column of its source
+    (e.g. weight: rating) or a number every row contributes (e.g. weight: 1, so that duplicate rows are counted).
+    Rows of an edge without weight contribute 1 per pair of vertices (duplicates collapse, as in unweighted graphs).
+
+    :param edge:    configuration of the edge
+    :param df:      data frame containing the rows of the edge source
+    :param v1_ids:  unique IDs of the first vertex of every row
+    :param v2_ids:  unique IDs of the second vertex of every row
+    :return:        weight of every row (the weights of duplicate rows are summed later on)
+    """
+
+    logger.trace('_get_edge_weights(%s, %s)', edge, len(df))
+
+    weight = edge.get('weight')
+    if isinstance(weight, str):
+        return df[weight].to_numpy(dtype=np.float64)
+    if weight is not None:
+        return np.full(len(df), float(weight))
+
+    # Only the first row of every pair of vertices (in any direction) counts
+    pairs = np.column_stack((np.minimum(v1_ids, v2_ids), np.maximum(v1_ids, v2_ids)))
+    weights = np.zeros(len(df))
+    weights[np.unique(pairs, axis=0, return_index=True)[1]] = 1
+    return weights
+
+
+def _add_increment_nodes(config: dict, edge: dict, df: pd.DataFrame, original_ids_dict: IdRegistry,
+                         id_counter: int) -> int:
+    """
+    Adds the nodes referenced in the rows of an increment that are not part of the node dictionary yet.
+    New nodes get unique IDs starting at id_counter. If a node type is extended (E.g. movies by ratings),
+    the extending nodes are added as well (E.g. a rating of a new movie adds the movie and all its ratings).
+
+    :param config:              configuration of the graph
+    :param edge:                configuration of the edge the rows belong to
+    :param df:                  rows of the increment
+    :param original_ids_dict:   registry mapping generated IDs to unique IDs (updated)
+    :param id_counter:          next unique ID
+    :return:                    next unique ID after adding the nodes
+    """
+
+    logger.trace('_add_increment_nodes(%s, %s, %s)', edge, len(df), id_counter)
+
+    for vertex in ('1', '2'):
+        plan = _compile_vertex_plan(edge=edge, vertex=vertex, config=config)
+
+        # Extending nodes are added together with the node they extend (E.g. m_932_4 -> m_932)
+        node_type = edge[f'vertex{vertex}'].get('extending', plan.type) if plan.extend_with else plan.type
+        values = _generate_ids(values=df[plan.column], prefix=plan.prefix)
+
+        unknown = original_ids_dict.lookup(node_type=node_type, keys=values) < 0
+        new_ids = pd.Series(pd.unique(values[unknown]), dtype=object)
+        node_plan = _compile_node_plan(node=config['nodes'][node_type]) if node_type in config['nodes'] \
+            else NodePlan(column=plan.column, prefix=plan.prefix, extended_by=None, suffixes=[])
+        id_counter = _add_nodes(original_ids_dict=original_ids_dict, node_name=node_type, plan=node_plan,
+                                generated_ids=new_ids, id_counter=id_counter)
+
+    return id_counter
+
+
+@profiled('load_edges')
+def load_edge_arrays(config: dict, original_ids_dict: IdRegistry) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """
+    Loads the edges of all configured edge sources (followed by all increments) as two arrays of unique IDs
+    (in the order of the rows). The combination of edges and vertices form a unidirectional graph: v1[i] -> v2[i]
+
+    If at least one edge has a weight (see is_weighted()), the weight of every row is loaded as well
+    (see _get_edge_weights()).
+
+    :param config:              configuration that defines edges between vertices
+    :param original_ids_dict:   registry mapping generated IDs to unique IDs (see load_nodes())
+    :return:                    unique IDs of the first and the second vertex of every edge and the weight of every
+                                edge (None if the graph is not weighted)
+    """
+
+    logger.trace('load_edge_arrays(%s)', config)
 
-    graph = {}
-    original_ids_dict = load_nodes(config=config)
     data_folder = config['data']['folder']
-    output_folder = config['data']['output_folder']
     separator = config['data']['separator']
-    graph_filename = config['data']['objects']['final_graph']
-    graph_location = output_folder + graph_filename
+    weighted = is_weighted(config=config)
+    v1_ids, v2_ids, weights = [], [], []
 
-    # If graph has been constructed once already, just load stored graph
-    stored_object = _return_dict_if_exists(graph_location)
-    if stored_object is not None:
-        logger.debug(f'returning stored object from {graph_location}')
-        return stored_object
-
-    logger.debug(f'no object found at {graph_location}')
     logger.info('extracting edges...')
 
     # For every edge...
@@ -258,24 +591,105 @@ def load_edges(config: dict = None) -> dict[str, list[str]]:
         edge = config['edges'][edge]
         filepath = str(data_folder) + str(edge['source'])
 
-        # Read the source file that contains rows that connect vertices line by line...
-        df = pd.read_csv(filepath_or_buffer=filepath, sep=separator, encoding=get_encoding(file=filepath))
-        for _, row in df.iterrows():
-            v1_value, v1_type = _get_vertex_value_and_type(edge=edge, config=config, row=row, vertex='1')
-            v2_value, v2_type = _get_vertex_value_and_type(edge=edge, config=config, row=row, vertex='2')
+        # Read the source file that contains rows that connect vertices
+        df = next(_read_csv(path=filepath, separator=separator, usecols=_edge_columns(edge=edge),
+                            encoding=get_source_encoding(file=filepath, config=config, source=edge)))
+        v1, v2 = _get_edge_arrays(config=config, edge=edge, df=df, original_ids_dict=original_ids_dict)
+        v1_ids.append(v1)
+        v2_ids.append(v2)
+        if weighted:
+            weights.append(_get_edge_weights(edge=edge, df=df, v1_ids=v1, v2_ids=v2))
+
+    # Rows that have been added later on (see incremental.ingest_edges())
+    for path, edge_name in list_increments(config=config):
+        df = _read_increment(path=path, config=config)
+        v1, v2 = _get_edge_arrays(config=config, edge=config['edges'][edge_name], df=df,
+                                  original_ids_dict=original_ids_dict)
+        v1_ids.append(v1)
+        v2_ids.append(v2)
+        if weighted:
+            weights.append(_get_edge_weights(edge=config['edges'][edge_name], df=df, v1_ids=v1, v2_ids=v2))
+
+    if not v1_ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0) if weighted else None
+    return np.concatenate(v1_ids), np.concatenate(v2_ids), np.concatenate(weights) if weighted else None
+
+
+def iter_edge_chunks(config: dict, original_ids_dict: IdRegistry, chunk_rows: int) \
+        -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray | None, int]]:
+    """
+    Loads the edges of all configured edge sources (followed by all increments) chunk by chunk, so that no source
+    has to fit into memory (see CSRAdjacency.from_edge_chunks()). Only the configured columns are read.
+
+    :param config:              configuration that defines edges between vertices
+    :param original_ids_dict:   registry mapping generated IDs to unique IDs (see load_nodes())
+    :param chunk_rows:          number of rows read at once
+    :return:                    unique IDs of the first and the second vertex of every edge of a chunk, the weight of
+                                every edge (None for edges without weight) and the index of the source
+    """
+
+    logger.trace('iter_edge_chunks(%s, %s)', config, chunk_rows)
+
+    sources = [(str(config['data']['folder']) + str(edge['source']), edge,
+                get_source_encoding(file=str(config['data']['folder']) + str(edge['source']), config=config,
+                                    source=edge)) for edge in config['edges'].values()]
+    sources += [(path, config['edges'][edge_name], INCREMENT_ENCODING)
+                for path, edge_name in list_increments(config=config)]
+
+    logger.info(f'extracting edges (in chunks of {chunk_rows} rows)...')
+
+    for group, (path, edge, encoding) in enumerate(tqdm(sources)):
+        for df in _read_csv(path=path, separator=config['data']['separator'], encoding=encoding,
+                            usecols=_edge_columns(edge=edge), chunk_rows=chunk_rows):
+            v1, v2 = _get_edge_arrays(config=config, edge=edge, df=df, original_ids_dict=original_ids_dict)
+            weights = _get_edge_weights(edge=edge, df=df, v1_ids=v1, v2_ids=v2) if 'weight' in edge else None
+            yield v1, v2, weights, group
+
+
+def _edge_arrays_to_dict(v1_ids: np.ndarray, v2_ids: np.ndarray) -> dict[int, list[int]]:
+    """
+    Converts edge arrays to a dictionary <id, [neighbor1.id, neighbor2.id, ...]>. Vertices are inserted in the
+    order of their first occurrence, neighbors are stored in the order of the rows (unidirectional!).
+
+    :param v1_ids:  unique IDs of the first vertex of every edge
+    :param v2_ids:  unique IDs of the second vertex of every edge
+    :return:        dictionary of neighbor lists
+    """
+
+    logger.trace('_edge_arrays_to_dict(%s, %s)', len(v1_ids), len(v2_ids))
 
-            # look up unique ID using the generated IDs
-            unique_v1_value = original_ids_dict[v1_type][v1_value]
-            unique_v2_value = original_ids_dict[v2_type][v2_value]
+    # Init neighbor lists, in the order in which vertices appear in the rows (v1, v2, v1, v2, ...)
+    graph = {node: [] for node in pd.unique(np.column_stack((v1_ids, v2_ids)).ravel()).tolist()}
 
-            # Init neighbor lists in case a node does not yet exist in the graph
-            if unique_v1_value not in graph:
-                graph[unique_v1_value] = []
-            if unique_v2_value not in graph:
-                graph[unique_v2_value] = []
+    # Add unique IDs of v2 to the neighbors of v1, grouped by v1 (stable sort keeps the order of the rows)
+    order = np.argsort(v1_ids, kind='stable')
+    sources, starts = np.unique(v1_ids[order], return_index=True)
+    for source, neighbors in zip(sources.tolist(), np.split(v2_ids[order], starts[1:])):
+        graph[source].extend(neighbors.tolist())
 
-            # Add unique ID of v2 to the neighbors of v1 (unidirectional!)
-            graph[unique_v1_value].append(unique_v2_value)
+    return graph
 
-    logger.info('storing edges...')
-    return _store_and_return_dict(obj=graph, path=graph_location)
+
+def load_edges(config: dict = None) -> dict[str, list[str]]:
+    """
+    Loads edges, meaning it connects vertices that are created from the function load_nodes().
+    The combination of edges and vertices form a unidirectional graph.
+
+    The result is not stored, the Graph stores the final (bidirectional) graph instead.
+
+    :param config:  configuration that defines edges between vertices
+    :return:        dictionary <id, [neighbor1.id, neighbor2.id, ...]
+    """
+
+    logger.trace('load_edges(%s)', config)
+
+    if config is None:
+        config = load_config()
+
+    logger.debug(f'load_edges({config})')
+
+    original_ids_dict = load_nodes(config=config)
+    v1_ids, v2_ids, weights = load_edge_arrays(config=config, original_ids_dict=original_ids_dict)
+    if weights is not None:
+        logger.warning('edge weights are ignored by the dictionary of lists, use the csr backend for weighted walks')
+    return _edge_arrays_to_dict(v1_ids=v1_ids, v2_ids=v2_ids)
@@ -0,0 +1,484 @@
+from collections.abc import Mapping
+from os.path import exists, join
+from pickle import load
+from typing import Iterator
+from rec2vec import logger
+
+import json
+import numpy as np
+
+NODE_TYPES_FILE = 'node_types.json'
+
+
+class NodeIds(Mapping):
+    """
+    Read-only view of the nodes of one type in an IdRegistry, with the interface of the former node dictionary
+    (generated id -> unique id), e.g. node_dict['movies']['m_932'] or node_dict['ratings'].get('m_932_4', -1).
+    """
+
+    def __init__(self, registry: 'IdRegistry', node_type: str):
+        self.registry = registry
+        self.node_type = node_type
+
+    def __getitem__(self, key: str) -> int:
+        unique_id = int(self.registry.lookup(node_type=self.node_type, keys=[key])[0])
+        if unique_id < 0:
+            raise KeyError(key)
+        return unique_id
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.registry.generated_ids(node_type=self.node_type).tolist())
+
+    def __len__(self) -> int:
+        return self.registry.count(node_type=self.node_type)
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self.registry.lookup(node_type=self.node_type, keys=[key])[0] >= 0
+
+    def values(self) -> list[int]:
+        return self.registry.unique_ids(node_type=self.node_type).tolist()
+
+    def items(self) -> list[tuple[str, int]]:
+        return list(zip(self.registry.generated_ids(node_type=self.node_type).tolist(), self.values()))
+
+    def lookup(self, keys) -> np.ndarray:
+        """
+        Looks up the unique ids of generated ids of this node type (see IdRegistry.lookup()).
+
+        :param keys:    generated ids
+        :return:        unique ids (-1 for unknown ids)
+        """
+
+        return self.registry.lookup(node_type=self.node_type, keys=keys)
+
+
+class IdRegistry(Mapping):
+    """
+    An IdRegistry is the compact form of the node dictionary (see graph_loader.load_nodes()). It maps the generated
+    ids of the nodes (e.g. 'm_932') to unique ids, but only stores two parallel arrays per node type: the generated
+    ids (in the order of insertion) and their unique ids.
+
+    Nodes of an extending type (e.g. ratings, extending movies by m_932_1 ... m_932_5) are not stored at all.
+    Every extended node reserves one unique id for itself and one for each suffix, so the id of an extending node
+    is the id of the extended node + 1 + the position of its suffix.
+
+    Lookups are vectorized (binary search on the sorted generated ids). The registry also maps unique ids back to
+    node types and generated ids (see reverse_lookup()). For compatibility, it is a mapping of node types to
+    read-only views (see NodeIds), so it can be used like the nested dictionary {type: {generated id: unique id}}.
+    """
+
+    def __init__(self):
+        self.keys = {}          # generated ids of the stored nodes, by node type (in the order of insertion)
+        self.ids = {}           # unique ids of the stored nodes, by node type
+        self.extensions = {}    # extending node type and suffixes, by extended node type (e.g. movies)
+        self._types = []        # all node types (stored and extending), in the order they were added
+        self._pending = {}      # chunks added since the arrays were concatenated, by node type
+        self._sorted = {}       # sorted generated ids and their positions, by node type (built on first lookup)
+        self._reverse = None    # sorted unique ids of the stored nodes, their types and positions (see reverse_lookup)
+
+    def __getstate__(self) -> dict:
+        self._flush()
+        return {'keys': self.keys, 'ids': self.ids, 'extensions': self.extensions, 'types': self._types}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+        self.keys, self.ids, self.extensions, self._types = \
+            state['keys'], state['ids'], state['extensions'], state['types']
+
+    def __getitem__(self, node_type: str) -> NodeIds:
+        if node_type not in self._types:
+            raise KeyError(node_type)
+        return NodeIds(registry=self, node_type=node_type)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._types))
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def __repr__(self) -> str:
+        return f'IdRegistry({", ".join(f"{t}: {self.count(node_type=t)}" for t in self._types)})'
+
+    def _flush(self) -> None:
+        """
+        Concatenates the chunks that have been added since the last call to the arrays of their node types.
+
+        :return:
+        """
+
+        for node_type, chunks in self._pending.items():
+            self.keys[node_type] = np.concatenate([self.keys[node_type]] + [k for k, _ in chunks])
+            self.ids[node_type] = np.concatenate([self.ids[node_type]] + [i for _, i in chunks])
+        self._pending.clear()
+
+    def add(self, node_type: str, keys: np.ndarray, first_id: int, extended_by: str = None,
+            suffixes: list[str] = None) -> int:
+        """
+        Adds nodes of one type. Unique ids are assigned in the order of the keys, starting at first_id. If the node
+        type is extended, every node reserves one unique id for itself plus one for each suffix.
+
+        :param node_type:   node type of the nodes (e.g. movies)
+        :param keys:        generated ids of the nodes (e.g. m_932)
+        :param first_id:    next unique id
+        :param extended_by: node type that extends the nodes (e.g. ratings), None if not extended
+        :param suffixes:    suffixes of the extending nodes (e.g. ['1', ..., '5'])
+        :return:            next unique id after adding the nodes
+        """
+
+        logger.trace('add(%s, %s, %s, %s, %s)', node_type, len(keys), first_id, extended_by, suffixes)
+
+        suffixes = list(suffixes or []) if extended_by is not None else []
+        # The ids of a node type have to be spaced evenly, otherwise extensions could not be computed
+        extension = self.extensions.get(node_type, (None, []) if node_type in self.keys else (extended_by, suffixes))
+        if extension != (extended_by, suffixes):
+            raise ValueError(f'node type {node_type} has been added with extension {extension} already')
+
+        for name in (node_type, extended_by):
+            if name is not None and name not in self._types:
+                self._types.append(name)
+        if extended_by is not None:
+            self.extensions[node_type] = (extended_by, suffixes)
+
+        keys = np.asarray(keys, dtype=str)
+        ids = first_id + np.arange(len(keys), dtype=np.int64) * (len(suffixes) + 1)
+        if node_type not in self.keys:
+            self.keys[node_type], self.ids[node_type] = np.zeros(0, dtype=str), np.zeros(0, dtype=np.int64)
+        if len(keys) == 0:
+            return first_id
+
+        # Like updating a dictionary, a duplicate keeps the position of its first occurrence and the id of its last
+        distinct, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        last = np.zeros(len(distinct), dtype=np.int64)
+        np.maximum.at(last, inverse.ravel(), np.arange(len(keys)))
+        kept = np.argsort(first)
+        keys, new_ids = distinct[kept], ids[last[kept]]
+
+        positions = self._positions(node_type=node_type, keys=keys)
+        known = positions >= 0
+        if known.any():
+            self.ids[node_type] = np.array(self.ids[node_type])
+            self.ids[node_type][positions[known]] = new_ids[known]
+        if not known.all():
+            self._pending.setdefault(node_type, []).append((keys[~known], new_ids[~known]))
+            self._sorted.pop(node_type, None)
+        self._reverse = None
+
+        return first_id + len(ids) * (len(suffixes) + 1)
+
+    def _extended_types(self, node_type: str) -> list[str]:
+        """
+        Returns the node types that are extended by a node type (e.g. ratings -> [movies]).
+
+        :param node_type:   (extending) node type
+        :return:            extended node types
+        """
+
+        return [base for base, (extending, _) in self.extensions.items() if extending == node_type]
+
+    def count(self, node_type: str) -> int:
+        """
+        Returns the number of nodes of a type (stored and extending nodes).
+
+        :param node_type:   node type
+        :return:            number of nodes
+        """
+
+        self._flush()
+        return len(self.keys.get(node_type, ())) + \
+            sum(len(self.keys[base]) * len(self.extensions[base][1]) for base in self._extended_types(node_type))
+
+    @property
+    def num_ids(self) -> int:
+        """
+        Returns the number of unique ids (highest unique id + 1), i.e. the next unique id that would be assigned.
+
+        :return:    number of unique ids
+        """
+
+        self._flush()
+        last_ids = [int(ids.max()) + len(self.extensions.get(t, (None, []))[1])
+                    for t, ids in self.ids.items() if len(ids)]
+        return max(last_ids, default=-1) + 1
+
+    def generated_ids(self, node_type: str) -> np.ndarray:
+        """
+        Returns the generated ids of all nodes of a type, in the order of insertion (extending nodes are generated:
+        every extended node followed by all its suffixes, e.g. m_932_1, ..., m_932_5).
+
+        :param node_type:   node type
+        :return:            generated ids
+        """
+
+        self._flush()
+        parts = [self.keys[node_type]] if node_type in self.keys else []
+        for base in self._extended_types(node_type):
+            suffixes = np.array(['_' + s for s in self.extensions[base][1]], dtype=str)
+            parts.append(np.char.add(np.repeat(self.keys[base], len(suffixes)),
+                                     np.tile(suffixes, len(self.keys[base]))))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=str)
+
+    def unique_ids(self, node_type: str) -> np.ndarray:
+        """
+        Returns the unique ids of all nodes of a type, in the same order as generated_ids().
+
+        :param node_type:   node type
+        :return:            unique ids
+        """
+
+        self._flush()
+        parts = [self.ids[node_type]] if node_type in self.ids else []
+        for base in self._extended_types(node_type):
+            offsets = np.arange(1, len(self.extensions[base][1]) + 1, dtype=np.int64)
+            parts.append((self.ids[base][:, None] + offsets).ravel())
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def _positions(self, node_type: str, keys: np.ndarray) -> np.ndarray:
+        """
+        Finds generated ids among the stored nodes of a type (binary search on the sorted generated ids).
+
+        :param node_type:   node type
+        :param keys:        generated ids
+        :return:            position of each generated id in the arrays of the node type (-1 for unknown ids)
+        """
+
+        self._flush()
+        result = np.full(len(keys), -1, dtype=np.int64)
+        if len(self.keys.get(node_type, ())) == 0 or len(keys) == 0:
+            return result
+
+        if node_type not in self._sorted:
+            order = np.argsort(self.keys[node_type], kind='stable')
+            self._sorted[node_type] = (self.keys[node_type][order], order)
+        sorted_keys, order = self._sorted[node_type]
+
+        positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        found = sorted_keys[positions] == keys
+        result[found] = order[positions[found]]
+        return result
+
+    def _lookup_stored(self, node_type: str, keys: np.ndarray) -> np.ndarray:
+        """
+        Looks up generated ids among the stored nodes of a type.
+
+        :param node_type:   node type
+        :param keys:        generated ids
+        :return:            unique ids (-1 for unknown ids)
+        """
+
+        positions = self._positions(node_type=node_type, keys=keys)
+        if not (positions >= 0).any():
+            return positions
+        return np.where(positions >= 0, self.ids[node_type][np.maximum(positions, 0)], -1)
+
+    def extension_offsets(self, node_type: str, suffixes) -> np.ndarray:
+        """
+        Returns the offset of the unique id of an extending node from the unique id of the node it extends
+        (1 for the first suffix, 2 for the second, ...).
+
+        :param node_type:   extended node type (e.g. movies)
+        :param suffixes:    suffixes (e.g. ratings, as strings or integers)
+        :return:            offset of each suffix (-1 for unknown suffixes or if the node type is not extended)
+        """
+
+        suffixes = np.asarray(suffixes)
+        if node_type not in self.extensions or len(suffixes) == 0:
+            return np.full(len(suffixes), -1, dtype=np.int64)
+
+        # Suffixes repeat a lot (e.g. 6 ratings), so only their distinct values are looked up
+        positions = {s: i + 1 for i, s in enumerate(self.extensions[node_type][1])}
+        distinct, inverse = np.unique(suffixes, return_inverse=True)
+        offsets = np.array([positions.get(str(s), -1) for s in distinct.tolist()], dtype=np.int64)
+        return offsets[inverse.ravel()]
+
+    def lookup_extension(self, node_type: str, keys, suffixes) -> np.ndarray:
+        """
+        Looks up the unique ids of extending nodes by the generated ids of the nodes they extend and their suffixes,
+        e.g. ('movies', ['m_932'], [4]) -> unique id of m_932_4. No generated ids of extending nodes are created.
+
+        :param node_type:   extended node type (e.g. movies)
+        :param keys:        generated ids of the extended nodes (e.g. m_932)
+        :param suffixes:    suffix of each extending node (e.g. 4)
+        :return:            unique ids (-1 for unknown ids)
+        """
+
+        logger.trace('lookup_extension(%s, %s)', node_type, len(keys))
+
+        base_ids = self._lookup_stored(node_type=node_type, keys=np.asarray(keys, dtype=str))
+        offsets = self.extension_offsets(node_type=node_type, suffixes=suffixes)
+        return np.where((base_ids >= 0) & (offsets >= 0), base_ids + offsets, -1)
+
+    def lookup(self, node_type: str, keys) -> np.ndarray:
+        """
+        Looks up the unique ids of generated ids of one node type (vectorized). Generated ids of extending nodes
+        (e.g. m_932_4) are split at their last underscore and looked up by the node they extend, prefer
+        lookup_extension() if the parts are available anyway.
+
+        :param node_type:   node type
+        :param keys:        generated ids
+        :return:            unique ids (-1 for unknown ids)
+        """
+
+        logger.trace('lookup(%s, %s)', node_type, len(keys))
+
+        keys = np.asarray(keys, dtype=str)
+        result = self._lookup_stored(node_type=node_type, keys=keys)
+        for base in self._extended_types(node_type):
+            unknown = np.flatnonzero(result < 0)
+            if len(unknown) == 0:
+                break
+            parts = np.char.rpartition(keys[unknown], '_')
+            ids = self.lookup_extension(node_type=base, keys=parts[:, 0], suffixes=parts[:, 2])
+            result[unknown] = np.where(parts[:, 1] == '_', ids, -1)
+        return result
+
+    def reverse_lookup(self, unique_ids) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Maps unique ids back to their node types and generated ids (vectorized).
+
+        :param unique_ids:  unique ids
+        :return:            node type and generated id of each unique id
+        """
+
+        logger.trace('reverse_lookup(%s)', len(unique_ids))
+
+        self._flush()
+        if self._reverse is None:
+            stored = [t for t in self._types if len(self.ids.get(t, ()))]
+            all_ids = np.concatenate([np.zeros(0, dtype=np.int64)] + [self.ids[t] for t in stored])
+            types = np.repeat(np.arange(len(stored)), [len(self.ids[t]) for t in stored])
+            positions = np.concatenate([np.zeros(0, dtype=np.int64)] + [np.arange(len(self.ids[t])) for t in stored])
+            order = np.argsort(all_ids, kind='stable')
+            self._reverse = (stored, all_ids[order], types[order], positions[order])
+        stored, sorted_ids, types, positions = self._reverse
+
+        # Every unique id belongs to the stored node with the next lower (or equal) id, or to one of its extensions
+        unique_ids = np.asarray(unique_ids, dtype=np.int64)
+        rows = np.searchsorted(sorted_ids, unique_ids, side='right') - 1
+        offsets = unique_ids - sorted_ids[np.maximum(rows, 0)] if len(sorted_ids) else unique_ids
+        type_rows = types[np.maximum(rows, 0)] if len(sorted_ids) else rows
+        max_offsets = np.array([len(self.extensions.get(t, (None, []))[1]) for t in stored] + [-1])[type_rows]
+        unknown = (rows < 0) | (offsets > max_offsets)
+        if unknown.any():
+            raise KeyError(int(unique_ids[unknown][0]))
+
+        node_types, keys = np.empty(len(unique_ids), dtype=object), np.empty(len(unique_ids), dtype=object)
+        for i, node_type in enumerate(stored):
+            selected = np.flatnonzero(type_rows == i)
+            base_keys = self.keys[node_type][positions[rows[selected]]]
+            extending = offsets[selected] > 0
+            node_types[selected] = node_type
+            keys[selected] = base_keys
+            if extending.any():
+                extending_type, suffixes = self.extensions[node_type]
+                suffixes = np.array(['_' + s for s in suffixes], dtype=str)
+                node_types[selected[extending]] = extending_type
+                keys[selected[extending]] = np.char.add(base_keys[extending],
+                                                        suffixes[offsets[selected[extending]] - 1])
+        return node_types, keys
+
+    def to_dict(self, first_id: int = 0) -> dict[str, dict[str, int]]:
+        """
+        Converts the registry to a (nested) node dictionary {type: {generated id: unique id}}.
+
+        :param first_id:    only nodes with this or a higher unique id are included (e.g. to list new nodes)
+        :return:            dictionary mapping generated ids to unique ids, by node type
+        """
+
+        logger.trace('to_dict(%s)', first_id)
+
+        result = {}
+        for node_type in self._types:
+            ids = self.unique_ids(node_type=node_type)
+            new = ids >= first_id
+            result[node_type] = dict(zip(self.generated_ids(node_type=node_type)[new].tolist(), ids[new].tolist()))
+        return result
+
+    @classmethod
+    def from_dict(cls, node_dict: dict[str, dict[str, int]]) -> 'IdRegistry':
+        """
+        Creates a registry from a (nested) node dictionary, e.g. a pickled node dictionary of an older version.
+        All nodes are stored, since the extensions can not be told apart from other nodes.
+
+        :param node_dict:   dictionary mapping generated ids to unique ids, by node type
+        :return:            id registry
+        """
+
+        logger.trace('from_dict(%s)', len(node_dict))
+
+        registry = cls()
+        for node_type, ids in node_dict.items():
+            registry._types.append(node_type)
+            registry.keys[node_type] = np.array(list(ids.keys()), dtype=str)
+            registry.ids[node_type] = np.fromiter(ids.values(), dtype=np.int64, count=len(ids))
+        return registry
+
+    def save(self, folder: str) -> None:
+        """
+        Stores the registry as .npy files in a folder (plus the node types and extensions as json).
+        The sorted generated ids of every node type are stored as well, so that lookups do not sort after loading.
+
+        :param folder:  path to the folder
+        :return:
+        """
+
+        logger.trace('save(%s)', folder)
+
+        self._flush()
+        node_types = [{'name': t, 'stored': t in self.keys, 'extended_by': self.extensions.get(t, (None, []))[0],
+                       'suffixes': self.extensions.get(t, (None, []))[1]} for t in self._types]
+        with open(join(folder, NODE_TYPES_FILE), 'w') as f:
+            json.dump(node_types, f)
+        for i, node_type in enumerate(self._types):
+            if node_type in self.keys:
+                np.save(join(folder, f'node_keys_{i}.npy'), self.keys[node_type])
+                np.save(join(folder, f'node_ids_{i}.npy'), self.ids[node_type])
+                order = np.argsort(self.keys[node_type], kind='stable')
+                np.save(join(folder, f'node_sorted_{i}.npy'), self.keys[node_type][order])
+                np.save(join(folder, f'node_order_{i}.npy'), order)
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode: str = 'r') -> 'IdRegistry':
+        """
+        Loads a registry stored by save() (or a node table of an older version, whose node types are all stored).
+
+        :param folder:      path to the folder
+        :param mmap_mode:   mode for memory-mapping the files (None loads the arrays into memory)
+        :return:            id registry
+        """
+
+        logger.trace('load(%s, %s)', folder, mmap_mode)
+
+        with open(join(folder, NODE_TYPES_FILE)) as f:
+            node_types = [{'name': t, 'stored': True, 'extended_by': None} if isinstance(t, str) else t
+                          for t in json.load(f)]
+
+        registry = cls()
+        for i, node_type in enumerate(node_types):
+            name = node_type['name']
+            registry._types.append(name)
+            if node_type['extended_by'] is not None:
+                registry.extensions[name] = (node_type['extended_by'], node_type['suffixes'])
+            if not node_type['stored']:
+                continue
+            registry.keys[name] = np.load(join(folder, f'node_keys_{i}.npy'), mmap_mode=mmap_mode)
+            registry.ids[name] = np.load(join(folder, f'node_ids_{i}.npy'), mmap_mode=mmap_mode)
+            if exists(join(folder, f'node_order_{i}.npy')):
+                registry._sorted[name] = (np.load(join(folder, f'node_sorted_{i}.npy'), mmap_mode=mmap_mode),
+                                          np.load(join(folder, f'node_order_{i}.npy'), mmap_mode=mmap_mode))
+        return registry
+
+
+def load_id_registry(path: str) -> IdRegistry:
+    """
+    Loads a pickled node dictionary (see graph_loader.load_nodes()). Node dictionaries of older versions
+    (nested dictionaries) are converted to a registry.
+
+    :param path:    path to the pickled node dictionary
+    :return:        id registry
+    """
+
+    logger.trace('load_id_registry(%s)', path)
+
+    with open(path, 'rb') as f:
+        node_dict = load(f)
+    return node_dict if isinstance(node_dict, IdRegistry) else IdRegistry.from_dict(node_dict=node_dict)
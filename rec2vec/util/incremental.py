@@ -0,0 +1,134 @@
+from copy import deepcopy
+from io import BytesIO
+from os import makedirs
+from typing import NamedTuple
+from rec2vec import logger
+from rec2vec.util.artifact_cache import atomic_write, is_valid, load_artifact, store_artifact, store_directory_artifact
+from rec2vec.util.binary_graph import load_binary_graph, save_binary_graph
+from rec2vec.util.encoding_detector import get_source_encoding
+from rec2vec.util.graph_loader import count_ids, get_artifact_location, get_increments_folder, graph_cache_key, \
+    is_weighted, list_increments, load_nodes, node_dict_cache_key, _add_increment_nodes, _edge_columns, \
+    _get_edge_arrays, _get_edge_weights, _read_increment
+
+import numpy as np
+import pandas as pd
+
+
+class IngestResult(NamedTuple):
+    """
+    Result of an incremental ingestion (see ingest_edges()).
+    """
+    new_nodes: dict[str, dict[str, int]]    # nodes that have been added, by node type (generated id -> unique id)
+    v1_ids: np.ndarray                      # unique ids of the first vertex of each new edge
+    v2_ids: np.ndarray                      # unique ids of the second vertex of each new edge
+    touched: np.ndarray                     # unique ids of all vertices of the new edges (sorted)
+
+
+def merge_into_dict(graph: dict[int, list[int]], v1_ids: np.ndarray, v2_ids: np.ndarray) -> dict[int, list[int]]:
+    """
+    Merges edges into a bidirectional graph <id, [neighbor1.id, neighbor2.id, ...]>. The result is the same as if the
+    edges had been part of the graph when it was made bidirectional: new vertices are appended in the order of their
+    first occurrence, neighbors are sorted and neither contain loops nor duplicates.
+
+    :param graph:   bidirectional graph (updated)
+    :param v1_ids:  unique ids of the first vertex of each new edge
+    :param v2_ids:  unique ids of the second vertex of each new edge
+    :return:        the updated graph
+    """
+
+    logger.trace('merge_into_dict(%s, %s, %s)', len(graph), len(v1_ids), len(v2_ids))
+
+    for node in pd.unique(np.column_stack((v1_ids, v2_ids)).ravel()).tolist():
+        graph.setdefault(node, [])
+
+    no_loop = v1_ids != v2_ids
+    src = np.concatenate((v1_ids[no_loop], v2_ids[no_loop]))
+    dst = np.concatenate((v2_ids[no_loop], v1_ids[no_loop]))
+    order = np.argsort(src, kind='stable')
+    sources, starts = np.unique(src[order], return_index=True)
+    for source, neighbors in zip(sources.tolist(), np.split(dst[order], starts[1:])):
+        graph[source] = sorted(set(graph[source]).union(neighbors.tolist()))
+
+    return graph
+
+
+def ingest_edges(config: dict, edge_name: str, rows: pd.DataFrame | str) -> IngestResult:
+    """
+    Adds rows to an existing edge (e.g. new ratings) without reconstructing the graph.
+
+    - All rows are mapped to unique ids before anything is stored: a row referencing an unknown node (E.g. a rating
+      out of range) raises a KeyError and leaves the output folder unchanged.
+    - The rows are stored as an increment in the output folder, so that reconstructing the graph from scratch
+      (e.g. after the configuration changed) leads to the same result.
+    - Nodes that are not part of the node dictionary yet get new unique ids, continuing after the highest unique id.
+      Existing ids do not change, which means that trained models stay valid.
+    - The new edges are merged into the stored (bidirectional, deduplicated) graphs. Stored graphs that are stale
+      already are not updated, they will be reconstructed (including all increments) the next time they are used.
+
+    :param config:      configuration of the graph
+    :param edge_name:   name of the edge in the configuration (e.g. users_ratings)
+    :param rows:        data frame containing the new rows or path to a csv file (with the same columns as the source)
+    :return:            new nodes, new edges and the vertices touched by the new edges
+    """
+
+    logger.trace('ingest_edges(%s, %s, %s)', config, edge_name, type(rows))
+
+    if edge_name not in config['edges']:
+        raise KeyError(f'edge {edge_name} is not configured')
+    edge = config['edges'][edge_name]
+
+    if isinstance(rows, str):
+        rows = pd.read_csv(filepath_or_buffer=rows, sep=config['data']['separator'],
+                           encoding=get_source_encoding(file=rows, config=config, source=edge))
+    rows = rows[_edge_columns(edge=edge)]
+
+    # Make sure that the stored objects are up-to-date before they are changed
+    node_dict = load_nodes(config=config)
+    old_graph_key = graph_cache_key(config=config)
+    dict_location = get_artifact_location(config=config, name='final_graph')
+    csr_location = get_artifact_location(config=config, name='csr_graph')
+    dict_valid = is_valid(path=dict_location, key=old_graph_key)
+    csr_valid = is_valid(path=csr_location, key=old_graph_key)
+
+    # Parse the rows exactly like the stored increment will be parsed in a reconstruction
+    content = rows.to_csv(sep=config['data']['separator'], index=False).encode('utf-8')
+    rows = _read_increment(path=BytesIO(content), config=config)
+
+    # Add new nodes and map all rows on a copy, nothing is stored unless every row is valid
+    registry = deepcopy(node_dict)
+    first_id = count_ids(node_dict=registry)
+    _add_increment_nodes(config=config, edge=edge, df=rows, original_ids_dict=registry, id_counter=first_id)
+    v1_ids, v2_ids = _get_edge_arrays(config=config, edge=edge, df=rows, original_ids_dict=registry)
+    weights = _get_edge_weights(edge=edge, df=rows, v1_ids=v1_ids, v2_ids=v2_ids) \
+        if csr_valid and is_weighted(config=config) else None
+    node_dict = registry
+    new_nodes = node_dict.to_dict(first_id=first_id)
+
+    # Store the rows as increment and the updated node dictionary
+    folder = get_increments_folder(config=config)
+    makedirs(folder, exist_ok=True)
+    path = folder + f'{len(list_increments(config=config)):06d}.{edge_name}.csv'
+    atomic_write(path=path, write=lambda f: f.write(content))
+    logger.info(f'stored {len(rows)} rows at {path}')
+    store_artifact(obj=node_dict, path=get_artifact_location(config=config, name='node_dict'),
+                   key=node_dict_cache_key(config=config))
+    logger.info(f'added {sum(len(ids) for ids in new_nodes.values())} nodes')
+
+    # Merge new edges into the stored graphs
+    new_graph_key = graph_cache_key(config=config)
+
+    if dict_valid:
+        graph = merge_into_dict(graph=load_artifact(path=dict_location, key=old_graph_key),
+                                v1_ids=v1_ids, v2_ids=v2_ids)
+        store_artifact(obj=graph, path=dict_location, key=new_graph_key)
+
+    if csr_valid:
+        adjacency, _ = load_binary_graph(folder=csr_location)
+        adjacency = adjacency.with_edges(src=v1_ids, dst=v2_ids, num_nodes=count_ids(node_dict=node_dict),
+                                         weights=weights)
+        store_directory_artifact(path=csr_location, key=new_graph_key,
+                                 write=lambda f: save_binary_graph(folder=f, adjacency=adjacency,
+                                                                   node_dict=node_dict))
+
+    return IngestResult(new_nodes=new_nodes, v1_ids=v1_ids, v2_ids=v2_ids,
+                        touched=np.union1d(v1_ids, v2_ids))
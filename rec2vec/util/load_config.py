@@ -1,9 +1,9 @@
-from rec2vec import logger
+from rec2vec import GRAPH_CONFIG_PATH, logger
 
 import yaml
 
 
-def load_config(path: str = './rec2vec/configs/graph_config.yaml') -> dict:
+def load_config(path: str = GRAPH_CONFIG_PATH) -> dict:
     """
     Loads a yaml config and returns dictionary containing the configuration.
 
@@ -0,0 +1,231 @@
+from collections.abc import Mapping
+from os import makedirs
+from os.path import isdir, join
+from pickle import load
+from typing import TYPE_CHECKING, Iterator
+from rec2vec.util.id_registry import IdRegistry, load_id_registry
+from rec2vec import logger
+
+import numpy as np
+
+# gensim takes seconds to import, exported vectors are opened without it
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+
+
+class KeyIndex(Mapping):
+    """
+    Read-only mapping of keys (unique ids) to their row in the vectors, with the interface of KeyedVectors.key_to_index.
+    Only the keys sorted and their rows are stored, lookups are binary searches.
+    """
+
+    def __init__(self, keys: np.ndarray, sorted_keys: np.ndarray, order: np.ndarray):
+        self.keys = keys                    # key of each row
+        self.sorted_keys = sorted_keys      # keys in ascending order
+        self.order = order                  # row of each sorted key
+
+    def __getitem__(self, key) -> int:
+        row = int(self.lookup(keys=[key])[0])
+        if row < 0:
+            raise KeyError(key)
+        return row
+
+    def __iter__(self) -> Iterator:
+        return iter(self.keys.tolist())
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key) -> bool:
+        return self.lookup(keys=[key])[0] >= 0
+
+    def lookup(self, keys) -> np.ndarray:
+        """
+        Looks up the rows of keys.
+
+        :param keys:    keys (unique ids)
+        :return:        rows (-1 for unknown keys)
+        """
+
+        keys = np.asarray(keys)
+        if len(self.sorted_keys) == 0 or \
+                np.issubdtype(keys.dtype, np.integer) != np.issubdtype(self.sorted_keys.dtype, np.integer):
+            return np.full(keys.shape, -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self.sorted_keys) - 1)
+        return np.where(self.sorted_keys[positions] == keys, self.order[positions], -1)
+
+
+class MappedVectors:
+    """
+    MappedVectors are the exported vectors of a trained model: only the vectors and the key (unique id) of each row,
+    without vocabulary counts, training weights or any other training state of Word2Vec.
+
+    They are stored as .npy files (see save()) that are memory-mapped when they are opened, so opening takes
+    constant time and all processes that open the same folder share one copy of the vectors in the page cache.
+    The key index (KeyIndex) is stored sorted as well, nothing has to be built after loading.
+
+    MappedVectors offer the part of the KeyedVectors interface used for predictions (vectors, index_to_key,
+    key_to_index, get_index(), similarity()). Their wv attribute is the object itself, so that they can be passed
+    wherever a model is expected (model.wv).
+    """
+
+    ARRAYS = ('vectors', 'keys', 'sorted_keys', 'order')
+
+    def __init__(self, vectors: np.ndarray, keys: np.ndarray, sorted_keys: np.ndarray = None,
+                 order: np.ndarray = None):
+        if order is None:
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+        self.vectors = vectors
+        self.index_to_key = keys
+        self.key_to_index = KeyIndex(keys=keys, sorted_keys=sorted_keys, order=order)
+
+    @property
+    def wv(self) -> 'MappedVectors':
+        return self
+
+    @property
+    def vector_size(self) -> int:
+        return self.vectors.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.index_to_key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.key_to_index
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.get_vector(key=key)
+
+    def get_index(self, key) -> int:
+        """
+        Returns the row of a key. Like KeyedVectors.get_index(), integers that are not a key are used as the row
+        itself (if they are in range).
+
+        :param key: key (unique id)
+        :return:    row of the key
+        """
+
+        row = int(self.key_to_index.lookup(keys=[key])[0])
+        if row >= 0:
+            return row
+        if isinstance(key, (int, np.integer)) and 0 <= key < len(self):
+            return int(key)
+        raise KeyError(f"Key '{key}' not present")
+
+    def get_vector(self, key, norm: bool = False) -> np.ndarray:
+        """
+        :param key:     key (unique id)
+        :param norm:    whether to return the vector scaled to unit length
+        :return:        vector of the key
+        """
+
+        vector = np.asarray(self.vectors[self.get_index(key=key)])
+        return vector / np.linalg.norm(vector) if norm else vector
+
+    def similarity(self, key1, key2) -> float:
+        """
+        :param key1:    key (unique id)
+        :param key2:    key (unique id)
+        :return:        cosine similarity of the vectors of both keys (as KeyedVectors.similarity())
+        """
+
+        return np.dot(self.get_vector(key=key1, norm=True), self.get_vector(key=key2, norm=True))
+
+    @classmethod
+    def from_model(cls, model: 'Word2Vec') -> 'MappedVectors':
+        """
+        :param model:   trained model (or its KeyedVectors)
+        :return:        vectors and keys of the model
+        """
+
+        logger.trace('from_model(%s)', model)
+
+        return cls(vectors=model.wv.vectors, keys=np.asarray(model.wv.index_to_key))
+
+    def save(self, folder: str) -> None:
+        """
+        Stores the vectors, their keys and the sorted key index as .npy files in a folder.
+
+        :param folder:  path to the folder (created if it does not exist)
+        :return:
+        """
+
+        logger.trace('save(%s)', folder)
+
+        makedirs(folder, exist_ok=True)
+        arrays = (self.vectors, self.index_to_key, self.key_to_index.sorted_keys, self.key_to_index.order)
+        for name, array in zip(self.ARRAYS, arrays):
+            np.save(join(folder, f'{name}.npy'), array)
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode: str = 'r') -> 'MappedVectors':
+        """
+        Loads vectors stored by save(). By default, the arrays are memory-mapped.
+
+        :param folder:      path to the folder
+        :param mmap_mode:   mode for memory-mapping the files (None loads the arrays into memory)
+        :return:            vectors
+        """
+
+        logger.trace('load(%s, %s)', folder, mmap_mode)
+
+        return cls(**{name: np.load(join(folder, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS})
+
+
+def export_model(model: 'Word2Vec', folder: str, node_dict: IdRegistry = None) -> MappedVectors:
+    """
+    Exports the vectors of a trained model to a folder (see MappedVectors), e.g. for test.py or serve.py.
+    The node dictionary is stored in the same folder (see IdRegistry.save()), so that it is memory-mapped as well
+    (see load_node_dict()). The pickled model is still needed to continue training (train.py --update-rows).
+
+    :param model:       trained model
+    :param folder:      path to the folder
+    :param node_dict:   node dictionary of the graph the model has been trained on (None: vectors only)
+    :return:            exported vectors
+    """
+
+    logger.trace('export_model(%s, %s, %s)', model, folder, node_dict)
+
+    vectors = MappedVectors.from_model(model=model)
+    vectors.save(folder=folder)
+    if node_dict is not None:
+        node_dict.save(folder=folder)
+    logger.debug(f'exported {len(vectors)} vectors of size {vectors.vector_size} to {folder}')
+    return vectors
+
+
+def load_model(path: str, mmap_mode: str = 'r') -> 'Word2Vec | MappedVectors':
+    """
+    Loads a model for predictions: a folder of exported vectors is memory-mapped (see export_model()),
+    any other path is unpickled.
+
+    :param path:        path to the exported vectors or to the pickled model
+    :param mmap_mode:   mode for memory-mapping exported vectors (None loads the arrays into memory)
+    :return:            model (or its exported vectors)
+    """
+
+    logger.trace('load_model(%s, %s)', path, mmap_mode)
+
+    if isdir(path):
+        return MappedVectors.load(folder=path, mmap_mode=mmap_mode)
+    with open(path, 'rb') as f:
+        return load(f)
+
+
+def load_node_dict(model_path: str, node_dict_path: str, mmap_mode: str = 'r') -> IdRegistry:
+    """
+    Loads the node dictionary of a model for predictions: if the model is a folder of exported vectors, the node
+    dictionary exported with them is memory-mapped (see export_model()), otherwise the pickled one is loaded.
+
+    :param model_path:      path to the exported vectors or to the pickled model
+    :param node_dict_path:  path to the pickled node dictionary
+    :param mmap_mode:       mode for memory-mapping an exported node dictionary (None loads it into memory)
+    :return:                id registry
+    """
+
+    logger.trace('load_node_dict(%s, %s, %s)', model_path, node_dict_path, mmap_mode)
+
+    if isdir(model_path):
+        return IdRegistry.load(folder=model_path, mmap_mode=mmap_mode)
+    return load_id_registry(path=node_dict_path)
@@ -0,0 +1,208 @@
+from contextlib import contextmanager
+from functools import wraps
+from rec2vec import logger
+
+import json
+import os
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _peak_rss_mb() -> float | None:
+    """
+    Returns the peak resident set size of the process so far.
+
+    :return:    peak memory in MiB (None if it cannot be measured on this platform)
+    """
+
+    if resource is None:
+        return None
+    # ru_maxrss is measured in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _current_rss_mb() -> float | None:
+    """
+    Returns the current resident set size of the process.
+
+    :return:    memory in MiB (None if it cannot be measured on this platform)
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _high_water_mark_mb() -> float | None:
+    """
+    Returns the peak resident set size of the process since the high-water mark was reset (VmHWM).
+
+    :return:    peak memory in MiB (None if it cannot be measured on this platform)
+    """
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _reset_high_water_mark() -> bool:
+    """
+    Resets the peak resident set size of the process (VmHWM) to the current resident set size (Linux only).
+
+    :return:    whether the high-water mark could be reset
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Profiler:
+    """
+    A Profiler records spans: named, possibly nested, stages of a run (e.g. load_nodes, walks or training).
+    For every span, it records the wall-clock time and memory samples of the process: the resident set size at the
+    start and at the end of the span and the peak resident set size during the span.
+
+    The peak of a span is measured with the high-water mark of the process (VmHWM), which is reset whenever a span
+    starts or ends, after its value has been added to the peaks of all open spans. Where it cannot be reset (other
+    than Linux), the peak of a span is None. While disabled, spans cost (nearly) nothing.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.spans = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        self._process_peak = None   # peak resident set size before the last reset of the high-water mark
+
+    def enable(self) -> None:
+        """
+        Starts recording spans (previously recorded spans are discarded).
+
+        :return:
+        """
+
+        self.enabled = True
+        self.spans = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        self._process_peak = None
+
+    def _checkpoint(self) -> float | None:
+        """
+        Adds the high-water mark to the peaks of all open spans and resets it, so that the next span starts
+        measuring from the current resident set size.
+
+        :return:    resident set size after the reset in MiB (None if the high-water mark cannot be reset)
+        """
+
+        peak = _high_water_mark_mb()
+        if peak is None or not _reset_high_water_mark():
+            return None
+        self._process_peak = max(self._process_peak or 0, peak)
+        for record in self._stack:
+            record['peak_rss_mb'] = max(record['peak_rss_mb'], peak)
+        return _high_water_mark_mb()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Records the code executed within the context as a span.
+
+        :param name:        name of the stage
+        :param attributes:  additional (json serializable) information, e.g. the number of nodes
+        :return:
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        record = {'name': name, 'parent': self._stack[-1]['name'] if self._stack else None,
+                  'depth': len(self._stack), **attributes,
+                  'start': time.perf_counter() - self._origin, 'rss_start_mb': _current_rss_mb(),
+                  'peak_rss_mb': self._checkpoint()}
+        self._stack.append(record)
+        try:
+            yield
+        finally:
+            if record['peak_rss_mb'] is not None:
+                self._checkpoint()
+            self._stack.pop()
+            record['seconds'] = time.perf_counter() - self._origin - record['start']
+            record['rss_end_mb'] = _current_rss_mb()
+            self.spans.append(record)
+            logger.debug('span %s took %.3fs', name, record['seconds'])
+
+    def to_dict(self) -> dict:
+        """
+        Returns all recorded spans (ordered by their start).
+
+        :return:    dictionary containing the spans and the peak memory of the process
+        """
+
+        peak = _peak_rss_mb()
+        if self._process_peak is not None:
+            # Resetting the high-water mark also resets ru_maxrss, the peaks before the resets are kept separately
+            peak = max(self._process_peak, _high_water_mark_mb() or 0)
+        return {'spans': sorted(self.spans, key=lambda record: record['start']), 'peak_rss_mb': peak}
+
+    def export(self, path: str) -> None:
+        """
+        Writes all recorded spans to a JSON file.
+
+        :param path:    path to the file
+        :return:
+        """
+
+        logger.trace('export(%s)', path)
+
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+profiler = Profiler()  # profiler of the process, enabled by --profile
+
+
+def span(name: str, **attributes):
+    """
+    Records a span with the profiler of the process (see Profiler.span()).
+
+    :param name:        name of the stage
+    :param attributes:  additional (json serializable) information
+    :return:            context manager
+    """
+
+    return profiler.span(name, **attributes)
+
+
+def profiled(name: str):
+    """
+    Decorator that records every call of a function as a span.
+
+    :param name:    name of the stage
+    :return:        decorator
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with profiler.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,407 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from os import makedirs
+from os.path import join
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Iterable, Iterator
+from tqdm import tqdm
+from rec2vec import logger
+from rec2vec.util.adjacency import CSRAdjacency
+from rec2vec.util.alias import MEMORY_BUDGET, SecondOrderTables, sample_alias
+
+import numpy as np
+import pandas as pd
+
+# gensim takes seconds to import, it is imported when a model is trained
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+
+SHARD_SIZE = 2 ** 16  # number of walks that are recorded by one job
+
+_worker_adjacency = None  # adjacency of a worker process, memory-mapped by _init_worker()
+_worker_tables = None     # second order tables of a worker process (node2vec walks), memory-mapped by _init_worker()
+
+
+def random_walks(adjacency: CSRAdjacency, starts: np.ndarray, path_length: int, alpha: float = 0,
+                 rng: np.random.Generator = None, tables: SecondOrderTables = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Records random walks for a batch of starting nodes. Instead of taking one walk after another, all walks
+    advance by one step at a time, so that each step is a handful of vectorized array operations.
+
+    A walk stops once it reaches a vertex without neighbors. With a chance of alpha, a walk is reset to its
+    start instead of moving to a neighbor. Without tables, every step chooses a neighbor uniformly (DeepWalk),
+    or proportionally to the weight of its edge if the adjacency is weighted (from the alias tables of the
+    adjacency, in constant time). With tables, every step but the first (and the first after a reset) depends on
+    the previous vertex (node2vec).
+
+    :param adjacency:   graph in CSR format
+    :param starts:      unique ids of the starting nodes (one walk per entry)
+    :param path_length: number of vertices in a (complete) walk
+    :param alpha:       possibility of being reset to the start
+    :param rng:         random generator (by default: seed=0)
+    :param tables:      second order tables of the adjacency (see alias.SecondOrderTables), None for uniform steps
+    :return:            matrix of walks (one walk per row, padded with -1) and the length of each walk
+    """
+
+    logger.trace('random_walks(%s, %s, %s, %s, %s, %s)', adjacency, len(starts), path_length, alpha, rng, tables)
+
+    if rng is None:
+        rng = np.random.default_rng(0)
+
+    indptr, indices = adjacency.indptr, adjacency.indices
+    walks = np.full((len(starts), path_length), -1, dtype=indices.dtype)
+    lengths = np.zeros(len(starts), dtype=np.int32)
+    if path_length < 1 or len(starts) == 0:
+        return walks, lengths
+
+    walks[:, 0] = starts
+    lengths[:] = 1
+    active = np.arange(len(starts))
+    current = walks[:, 0].astype(np.int64)
+    previous = np.full(len(starts), -1, dtype=np.int64)    # previous vertex of each walk (-1: none)
+    edges = np.full(len(starts), -1, dtype=np.int64)       # CSR position of the last edge of each walk (-1: none)
+
+    for step in range(1, path_length):
+        offsets = indptr[current]
+        degrees = indptr[current + 1] - offsets
+
+        # Stop walks, vertex has no neighbors
+        alive = degrees > 0
+        if not alive.all():
+            active, current, offsets, degrees = active[alive], current[alive], offsets[alive], degrees[alive]
+            previous, edges = previous[alive], edges[alive]
+        if len(active) == 0:
+            break
+
+        # Move to a (uniformly or weighted chosen) neighbor, or to a neighbor chosen by the second order tables
+        if adjacency.is_weighted:
+            choice = sample_alias(prob=adjacency.prob, alias=adjacency.alias, offsets=offsets, sizes=degrees, rng=rng)
+        else:
+            choice = (rng.random(len(active)) * degrees).astype(np.int64)
+        positions = offsets + choice
+        if tables is not None:
+            biased = previous >= 0
+            positions[biased] = tables.next_steps(adjacency=adjacency, previous=previous[biased],
+                                                  current=current[biased], edges=edges[biased], rng=rng)
+        previous, current, edges = current, indices[positions].astype(np.int64), positions
+
+        # Reset walks with a chance of alpha
+        if alpha > 0:
+            reset = rng.random(len(active)) < alpha
+            current[reset] = walks[active[reset], 0]
+            previous[reset] = -1
+
+        walks[active, step] = current
+        lengths[active] += 1
+
+    return walks, lengths
+
+
+def walks_to_lists(walks: np.ndarray, lengths: np.ndarray) -> list[list[int]]:
+    """
+    Converts a matrix of walks (as returned by random_walks()) to a list of walks.
+
+    :param walks:   matrix of walks, one walk per row
+    :param lengths: length of each walk
+    :return:        list of walks, each walk is a list of unique ids
+    """
+
+    logger.trace('walks_to_lists(%s, %s)', walks.shape, len(lengths))
+
+    return [walk[:length] for walk, length in zip(walks.tolist(), lengths.tolist())]
+
+
+def _init_worker(folder: str, tables_folder: str = None) -> None:
+    """
+    Initializes a worker process by memory-mapping the adjacency (and the second order tables) stored in a folder.
+
+    :param folder:          folder containing the adjacency (see CSRAdjacency.save())
+    :param tables_folder:   folder containing the second order tables (see SecondOrderTables.save()), if any
+    :return:
+    """
+
+    global _worker_adjacency, _worker_tables
+    _worker_adjacency = CSRAdjacency.load(folder=folder, mmap_mode='r')
+    _worker_tables = None if tables_folder is None else SecondOrderTables.load(folder=tables_folder, mmap_mode='r')
+
+
+def _walk_shard(job: tuple[np.ndarray, int, float, tuple[int, int, int], CSRAdjacency, SecondOrderTables]) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Records the walks of one shard. Every shard uses its own random generator that is derived from the seed,
+    the round and the index of the shard. This way, the result does not depend on which process records it.
+
+    :param job: starting nodes, path length, alpha, (seed, round, shard), adjacency and second order tables
+                (adjacency and tables are None in worker processes)
+    :return:    matrix of walks and the length of each walk
+    """
+
+    starts, path_length, alpha, entropy, adjacency, tables = job
+    if adjacency is None:
+        adjacency, tables = _worker_adjacency, _worker_tables
+    return random_walks(adjacency=adjacency, starts=starts, path_length=path_length, alpha=alpha,
+                        rng=np.random.default_rng(entropy), tables=tables)
+
+
+def iter_walk_shards(adjacency: CSRAdjacency, num_paths: int, path_length: int, alpha: float = 0, seed: int = 0,
+                     workers: int = 1, shard_size: int = SHARD_SIZE, starts: np.ndarray = None, p: float = 1,
+                     q: float = 1, memory_budget: int = MEMORY_BUDGET) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Records num_paths walks per node of the graph and yields them shard by shard. In every round, each node
+    (or each of the given starting nodes) is the start of one walk (in random order). The walks of a round are
+    split into shards of shard_size walks, which are recorded by a pool of worker processes.
+
+    The adjacency is not sent to the workers. Instead, it is stored as .npy files (unless it is memory-mapped
+    already) and every worker memory-maps these files, so that all processes share the same pages.
+
+    Since every shard has its own seed (derived from seed, round and shard index), the corpus is the same
+    for any number of workers.
+
+    With p or q other than 1, the walks are node2vec walks. Their second order tables are built once (within
+    the memory budget) and shared with the workers the same way as the adjacency.
+
+    :param adjacency:   graph in CSR format
+    :param num_paths:   number of paths to be recorded per node
+    :param path_length: number of vertices in a (complete) walk
+    :param alpha:       possibility of being reset to the start
+    :param seed:        seed for random actions, the same seed always results in the same corpus
+    :param workers:     number of processes recording walks
+    :param shard_size:  number of walks per job
+    :param starts:      unique ids of the nodes walks start from (by default: all nodes of the graph)
+    :param p:           return parameter of node2vec (1: uniform)
+    :param q:           in-out parameter of node2vec (1: uniform)
+    :param memory_budget: maximum number of bytes used by the second order tables (see alias.SecondOrderTables)
+    :return:            matrix of walks (one walk per row, padded with -1) and the length of each walk, per shard
+    """
+
+    logger.trace('iter_walk_shards(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)', adjacency, num_paths, path_length,
+                 alpha, seed, workers, shard_size, None if starts is None else len(starts), p, q, memory_budget)
+
+    if starts is None:
+        starts = adjacency.nodes
+    tables = None if p == 1 and q == 1 else \
+        SecondOrderTables.build(adjacency=adjacency, p=p, q=q, memory_budget=memory_budget)
+
+    def jobs(shared_adjacency: CSRAdjacency | None, shared_tables: SecondOrderTables | None):
+        for i in range(num_paths):
+            permutation = np.random.default_rng((seed, i)).permutation(starts)
+            for shard, offset in enumerate(range(0, len(permutation), shard_size)):
+                yield permutation[offset:offset + shard_size], path_length, alpha, (seed, i, shard), \
+                    shared_adjacency, shared_tables
+
+    num_shards = num_paths * -(-len(starts) // shard_size)
+
+    if workers <= 1:
+        yield from map(_walk_shard, tqdm(jobs(adjacency, tables), total=num_shards))
+    else:
+        with TemporaryDirectory() as tmp:
+            folder = adjacency.path
+            if folder is None:
+                folder = tmp
+                adjacency.save(folder=folder)
+            tables_folder = None
+            if tables is not None:
+                tables_folder = join(tmp, 'node2vec')
+                tables.save(folder=tables_folder)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(folder, tables_folder)) as pool:
+                yield from tqdm(pool.map(_walk_shard, jobs(None, None)), total=num_shards)
+
+
+def build_walks(adjacency: CSRAdjacency, num_paths: int, path_length: int, alpha: float = 0, seed: int = 0,
+                workers: int = 1, shard_size: int = SHARD_SIZE, starts: np.ndarray = None, p: float = 1,
+                q: float = 1, memory_budget: int = MEMORY_BUDGET) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Records num_paths walks per node of the graph (see iter_walk_shards()) and combines all shards.
+
+    :param adjacency:   graph in CSR format
+    :param num_paths:   number of paths to be recorded per node
+    :param path_length: number of vertices in a (complete) walk
+    :param alpha:       possibility of being reset to the start
+    :param seed:        seed for random actions, the same seed always results in the same corpus
+    :param workers:     number of processes recording walks
+    :param shard_size:  number of walks per job
+    :param starts:      unique ids of the nodes walks start from (by default: all nodes of the graph)
+    :param p:           return parameter of node2vec (1: uniform)
+    :param q:           in-out parameter of node2vec (1: uniform)
+    :param memory_budget: maximum number of bytes used by the second order tables (see alias.SecondOrderTables)
+    :return:            matrix of walks (one walk per row, padded with -1) and the length of each walk
+    """
+
+    logger.trace('build_walks(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)', adjacency, num_paths, path_length, alpha,
+                 seed, workers, shard_size, None if starts is None else len(starts), p, q, memory_budget)
+
+    shards = list(iter_walk_shards(adjacency=adjacency, num_paths=num_paths, path_length=path_length, alpha=alpha,
+                                   seed=seed, workers=workers, shard_size=shard_size, starts=starts, p=p, q=q,
+                                   memory_budget=memory_budget))
+
+    if not shards:
+        return np.full((0, path_length), -1, dtype=adjacency.indices.dtype), np.zeros(0, dtype=np.int32)
+    return np.concatenate([walks for walks, _ in shards]), np.concatenate([lengths for _, lengths in shards])
+
+
+class WalkCorpus:
+    """
+    A WalkCorpus stores random walks as a fixed-width matrix (one walk per row, padded with -1) and the length of
+    each walk, instead of a list of lists of Python ints. A step takes 4 bytes (int32 unique ids) instead of about
+    36 bytes (a pointer and an int object), i.e. the corpus needs a fraction of the memory.
+
+    Iterating yields one walk after another as a list of unique ids (what Word2Vec expects), converted block by
+    block while iterating. The token frequencies are counted with np.bincount, so that the vocabulary of a model
+    can be built without scanning the corpus (see train_word2vec()).
+
+    A corpus is stored as .npy files (see save()) that are memory-mapped when they are loaded, so that a corpus
+    used again (e.g. by the trials of tuning.py) is neither parsed nor copied into every process.
+    """
+
+    ARRAYS = ('walks', 'lengths')
+
+    def __init__(self, walks: np.ndarray, lengths: np.ndarray):
+        self.walks = walks
+        self.lengths = lengths
+
+    @classmethod
+    def from_shards(cls, shards: Iterable[tuple[np.ndarray, np.ndarray]], path_length: int,
+                    num_walks: int = None) -> 'WalkCorpus':
+        """
+        Combines the shards of walks recorded by iter_walk_shards(). If the number of walks is known, the shards are
+        copied into a matrix allocated once, so that they are never held twice.
+
+        :param shards:      matrix of walks and length of each walk, per shard
+        :param path_length: number of vertices in a (complete) walk
+        :param num_walks:   number of walks of all shards (optional)
+        :return:            corpus of all walks
+        """
+
+        logger.trace('WalkCorpus.from_shards(%s, %s)', path_length, num_walks)
+
+        if num_walks is None:
+            shards = list(shards)
+            if not shards:
+                return cls(walks=np.full((0, path_length), -1, dtype=np.int32), lengths=np.zeros(0, dtype=np.int32))
+            return cls(walks=np.concatenate([walks for walks, _ in shards]),
+                       lengths=np.concatenate([lengths for _, lengths in shards]))
+
+        corpus = cls(walks=np.full((num_walks, path_length), -1, dtype=np.int32),
+                     lengths=np.zeros(num_walks, dtype=np.int32))
+        position = 0
+        for walks, lengths in shards:
+            if walks.dtype != corpus.walks.dtype:
+                corpus.walks = corpus.walks.astype(walks.dtype)
+            corpus.walks[position:position + len(walks)] = walks
+            corpus.lengths[position:position + len(walks)] = lengths
+            position += len(walks)
+        if position != num_walks:
+            raise ValueError(f'expected {num_walks} walks, got {position}')
+        return corpus
+
+    @classmethod
+    def from_lists(cls, walks: Iterable[list[int]], path_length: int, block_size: int = SHARD_SIZE) -> 'WalkCorpus':
+        """
+        Collects walks given as lists of unique ids (e.g. recorded by the python engine or read from a corpus file).
+        Walks are converted block by block, so that only block_size of them are held as lists at once.
+
+        :param walks:       walks, each walk is a list of at most path_length unique ids
+        :param path_length: number of vertices in a (complete) walk
+        :param block_size:  number of walks converted at once
+        :return:            corpus of all walks
+        """
+
+        logger.trace('WalkCorpus.from_lists(%s, %s)', path_length, block_size)
+
+        walks = iter(walks)
+        shards = []
+        while block := list(islice(walks, block_size)):
+            lengths = np.fromiter(map(len, block), dtype=np.int32, count=len(block))
+            if lengths.max() > path_length:
+                raise ValueError(f'walk of length {lengths.max()} exceeds path length {path_length}')
+            steps = np.fromiter(chain.from_iterable(block), dtype=np.int64, count=int(lengths.sum()))
+            matrix = np.full((len(block), path_length), -1, dtype=np.int64)
+            matrix[np.arange(path_length) < lengths[:, None]] = steps
+            if len(steps) == 0 or steps.max() <= np.iinfo(np.int32).max:
+                matrix = matrix.astype(np.int32)
+            shards.append((matrix, lengths))
+        return cls.from_shards(shards=shards, path_length=path_length)
+
+    def save(self, folder: str) -> None:
+        """
+        Stores the walks and their lengths as .npy files in a folder.
+
+        :param folder:  path to the folder (created if it does not exist)
+        :return:
+        """
+
+        logger.trace('WalkCorpus.save(%s)', folder)
+
+        makedirs(folder, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(join(folder, f'{name}.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode: str = 'r') -> 'WalkCorpus':
+        """
+        Loads a corpus stored by save(). By default, the arrays are memory-mapped.
+
+        :param folder:      path to the folder
+        :param mmap_mode:   mode for memory-mapping the files (None loads the arrays into memory)
+        :return:            corpus
+        """
+
+        logger.trace('WalkCorpus.load(%s, %s)', folder, mmap_mode)
+
+        return cls(**{name: np.load(join(folder, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS})
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __iter__(self) -> Iterator[list[int]]:
+        for start in range(0, len(self), SHARD_SIZE):
+            yield from walks_to_lists(walks=self.walks[start:start + SHARD_SIZE],
+                                      lengths=self.lengths[start:start + SHARD_SIZE])
+
+    def num_tokens(self) -> int:
+        """
+        :return:    number of vertices of all walks
+        """
+        return int(self.lengths.sum())
+
+    def word_freq(self) -> dict[int, int]:
+        """
+        Counts how often each unique id occurs in the walks (np.bincount). The ids are ordered by their first
+        occurrence, like the vocabulary collected by Word2Vec when it scans the corpus, so that both result in
+        the same model.
+
+        :return:    number of occurrences, by unique id
+        """
+
+        logger.trace('word_freq(%s)', len(self))
+
+        tokens = self.walks[self.walks >= 0]
+        counts = np.bincount(tokens)
+        ids = pd.unique(tokens)
+        return dict(zip(ids.tolist(), counts[ids].tolist()))
+
+
+def train_word2vec(corpus: WalkCorpus, model: 'Word2Vec' = None, **params) -> 'Word2Vec':
+    """
+    Trains a Word2Vec model on a corpus of walks. The vocabulary is built from the token frequencies of the corpus
+    (see WalkCorpus.word_freq()) instead of scanning all walks once more before training.
+
+    :param corpus:  walks to train on
+    :param model:   model to be trained further (new unique ids are added to its vocabulary), by default a new model
+    :param params:  parameters of a new model (e.g. window, min_count, workers or seed)
+    :return:        trained model
+    """
+
+    logger.trace('train_word2vec(%s, %s, %s)', len(corpus), model, params)
+
+    from gensim.models import Word2Vec
+
+    update = model is not None
+    if not update:
+        model = Word2Vec(**params)
+    model.build_vocab_from_freq(word_freq=corpus.word_freq(), corpus_count=len(corpus), update=update)
+    model.corpus_total_words = corpus.num_tokens()
+    model.train(corpus_iterable=corpus, total_examples=model.corpus_count, total_words=model.corpus_total_words,
+                epochs=model.epochs)
+    return model
@@ -0,0 +1,25 @@
+from rec2vec.util.binary_graph import export_pickle, import_pickle
+from rec2vec import configure_logging, logger
+
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a graph between the pickle and the binary format')
+    parser.add_argument('direction', choices=['to-binary', 'to-pickle'], help='Direction of the conversion')
+    parser.add_argument('-gp', '--graph-path', default='./output/graph.obj', type=str, help='Path to pickled graph')
+    parser.add_argument('-ndp', '--node-dict-path', default='./output/node_dict.obj', type=str, help='Path to pickled nodedict')
+    parser.add_argument('-bp', '--binary-path', default='./output/graph_csr', type=str, help='Path to binary graph folder')
+    args = parser.parse_args()
+    configure_logging()
+
+    logger.info(f'converting graph ({args.direction})...')
+    if args.direction == 'to-binary':
+        import_pickle(graph_path=args.graph_path, node_dict_path=args.node_dict_path, folder=args.binary_path)
+    else:
+        export_pickle(folder=args.binary_path, graph_path=args.graph_path, node_dict_path=args.node_dict_path)
+    logger.info('graph converted successfully')
+
+
+if __name__ == '__main__':
+    exit(main())
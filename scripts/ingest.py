@@ -0,0 +1,22 @@
+from rec2vec.util.incremental import ingest_edges
+from rec2vec.util.load_config import load_config
+from rec2vec import GRAPH_CONFIG_PATH, configure_logging, logger
+
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add new rows of an edge (e.g. ratings) to an existing graph')
+    parser.add_argument('edge', type=str, help='Name of the edge in the configuration (e.g. users_ratings)')
+    parser.add_argument('rows', type=str, help='Path to a csv file containing the new rows')
+    parser.add_argument('-cp', '--config-path', default=GRAPH_CONFIG_PATH, type=str, help='Path to custom config')
+    args = parser.parse_args()
+    configure_logging()
+
+    logger.info(f'ingesting {args.rows} into {args.edge}...')
+    result = ingest_edges(config=load_config(path=args.config_path), edge_name=args.edge, rows=args.rows)
+    logger.info(f'ingested {len(result.v1_ids)} edges touching {len(result.touched)} nodes')
+
+
+if __name__ == '__main__':
+    exit(main())
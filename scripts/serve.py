@@ -0,0 +1,55 @@
+from os.path import exists
+from rec2vec.predict.candidates import build_candidate_tables, get_candidates_path, load_candidates
+from rec2vec.predict.recommend import Recommender
+from rec2vec.predict.serving import MAX_BATCH_SIZE, MAX_WAIT, PredictionServer, PredictionService
+from rec2vec.util.load_config import load_config
+from rec2vec.util.mapped_vectors import load_model, load_node_dict
+from rec2vec import GRAPH_CONFIG_PATH, configure_logging, logger
+
+import argparse
+import asyncio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve rating predictions and recommendations of a trained model')
+    parser.add_argument('-mp', '--model-path', default='./models/rec2vec.obj', type=str, help='Path to rec2vec model (or exported vectors)')
+    parser.add_argument('-ndp', '--node-dict-path', default='./output/node_dict.obj', type=str, help='Path to nodedict')
+    parser.add_argument('-cp', '--config-path', default=GRAPH_CONFIG_PATH, type=str, help='Path to custom config')
+    parser.add_argument('-ut', '--user-type', default='users', type=str, help='Node type of users')
+    parser.add_argument('-it', '--item-type', default='movies', type=str, help='Node type of items (must be extended)')
+    parser.add_argument('-H', '--host', default='127.0.0.1', type=str, help='Host to listen on')
+    parser.add_argument('-P', '--port', default=8080, type=int, help='Port to listen on')
+    parser.add_argument('-us', '--unix-socket', default=None, type=str, help='Listen on this Unix socket instead')
+    parser.add_argument('-bs', '--max-batch-size', default=MAX_BATCH_SIZE, type=int, help='Maximum number of requests per batch')
+    parser.add_argument('-mw', '--max-wait-ms', default=MAX_WAIT * 1000, type=float, help='Maximum time a request waits for its batch')
+    args = parser.parse_args()
+    configure_logging()
+
+    config = load_config(path=args.config_path)
+
+    logger.info('loading model...')
+    model = load_model(path=args.model_path)
+    node_dict = load_node_dict(model_path=args.model_path, node_dict_path=args.node_dict_path)
+
+    candidates_path = get_candidates_path(model_path=args.model_path)
+    if exists(candidates_path):
+        candidates = load_candidates(path=candidates_path)
+    else:
+        candidates = build_candidate_tables(config=config, node_dict=node_dict, model=model)
+    target_type = config['nodes'][args.item_type]['extended']['by']
+
+    logger.info('building recommender...')
+    recommender = Recommender.build(config=config, model=model, node_dict=node_dict, item_type=args.item_type,
+                                    user_type=args.user_type)
+
+    service = PredictionService(config=config, model=model, node_dict=node_dict, candidates=candidates[target_type],
+                                recommender=recommender, user_type=args.user_type, item_type=args.item_type)
+    server = PredictionServer(service=service, max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000)
+    try:
+        asyncio.run(server.serve(host=args.host, port=args.port, unix_socket=args.unix_socket))
+    except KeyboardInterrupt:
+        logger.info('server stopped')
+
+
+if __name__ == '__main__':
+    exit(main())
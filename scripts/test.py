@@ -1,15 +1,20 @@
-from pickle import load
-from sklearn.metrics import confusion_matrix, accuracy_score, mean_squared_error
-from rec2vec import logger
+from rec2vec import GRAPH_CONFIG_PATH, configure_logging, logger
 from rec2vec.util.load_config import load_config
-from rec2vec.util.encoding_detector import get_encoding
-from rec2vec.predict.prediction_util import predict_from_data
-from gensim.models import Word2Vec
+from rec2vec.util.mapped_vectors import load_model, load_node_dict
+from rec2vec.util.encoding_detector import get_source_encoding
+from rec2vec.util.profiling import profiler, span
+from os.path import exists, getmtime
+from typing import TYPE_CHECKING
 
-import pandas as pd
 import argparse
 import time
 
+# gensim, sklearn and pandas take seconds to import, they are imported when needed (not for --help)
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+    from rec2vec.predict.candidates import CandidateTable
+    from rec2vec.util.id_registry import IdRegistry
+
 
 def _report_prediction(args: argparse.Namespace) -> None:
     """
@@ -19,7 +24,7 @@ def _report_prediction(args: argparse.Namespace) -> None:
     :return:
     """
 
-    logger.trace(f'predict({args})')
+    logger.trace('predict(%s)', args)
 
     argument_notice = 'Predicting with the following arguments:\n' + \
         f'path to test data:\t{args.data_path}\n' + \
@@ -35,20 +40,25 @@ def _report_prediction(args: argparse.Namespace) -> None:
     # Get config that stores information about graph and data sources
     config = load_config(path=args.config_path)
 
-    # Load trained model
-    filehandler = open(file=args.model_path, mode='rb')
-    model = load(file=filehandler)
-    filehandler.close()
+    with span('load_model'):
+        # Load trained model (exported vectors are memory-mapped)
+        model = load_model(path=args.model_path)
+
+        # Load node dictionary (node registry)
+        node_dict = load_node_dict(model_path=args.model_path, node_dict_path=args.node_dict_path)
+
+    from rec2vec.predict.candidates import get_candidates_path, load_candidates
 
-    # Load node dictionary
-    filehandler = open(file=args.node_dict_path, mode='rb')
-    node_dict = load(file=filehandler)
-    filehandler.close()
+    # Load candidate tables, if they have been stored together with the model
+    candidates = None
+    candidates_path = get_candidates_path(model_path=args.model_path)
+    if exists(candidates_path) and getmtime(candidates_path) >= getmtime(args.model_path):
+        candidates = load_candidates(path=candidates_path)
 
     # Perform training
     acc, cm, mse = predict_and_test(data_path=args.data_path, predictor_variable=args.predictor_variable,
                                     target_variable=args.target_variable, config=config, model=model,
-                                    node_dict=node_dict)
+                                    node_dict=node_dict, candidates=candidates)
 
     # Write report and include timestamp in the file name to ensure uniqueness
     index_of_extension = args.report_path.rfind('.')
@@ -61,8 +71,9 @@ def _report_prediction(args: argparse.Namespace) -> None:
         f.write(f'MSE = {mse}\nAccuracy = {acc}\n\nConfusion Matrix: \n{cm}')
 
 
-def predict_and_test(data_path: str, predictor_variable: str, target_variable: str, config: dict, model: Word2Vec,
-                     node_dict: dict) -> tuple[float, float, str]:
+def predict_and_test(data_path: str, predictor_variable: str, target_variable: str, config: dict, model: 'Word2Vec',
+                     node_dict: 'IdRegistry', candidates: dict[str, 'CandidateTable'] = None) \
+        -> tuple[float, float, str]:
     """
     Performs prediction on test set and writes report which demonstrate the fit of the model.
 
@@ -70,20 +81,26 @@ def predict_and_test(data_path: str, predictor_variable: str, target_variable: s
     :param predictor_variable:  node type whose similarity to each target should be predicted
     :param target_variable:     node type which forms the possible ratings
     :param config:              dictionary containing graph configuration
-    :param model:               trained Word2Vec model
-    :param node_dict:           dictionary mapping original ids to unique ids
+    :param model:               trained Word2Vec model (or its exported vectors, see mapped_vectors.MappedVectors)
+    :param node_dict:           registry mapping original ids to unique ids
+    :param candidates:          precomputed candidate tables of the model (optional)
     :return:                    accuracy, mean squared error and confusion matrix of prediction results
     """
 
-    logger.trace(f'predict_and_test({data_path}, {predictor_variable}, {target_variable}, {config}, {model}, {node_dict})')
+    logger.trace('predict_and_test(%s, %s, %s, %s, %s, %s)', data_path, predictor_variable, target_variable, config,
+                 model, node_dict)
+
+    from rec2vec.predict.prediction_util import predict_from_data
+    from sklearn.metrics import confusion_matrix, accuracy_score, mean_squared_error
+    import pandas as pd
 
     df = pd.read_csv(filepath_or_buffer=data_path,
                      sep=config['data']['separator'],
-                     encoding=get_encoding(file=data_path))
+                     encoding=get_source_encoding(file=data_path, config=config))
 
     y_prediction, target_column, suffix = predict_from_data(config=config, df=df, model=model, node_dict=node_dict,
                                                             predictor_variable=predictor_variable,
-                                                            target_variable=target_variable)
+                                                            target_variable=target_variable, candidates=candidates)
 
     y_true = [int(y) for y in df[target_column].to_list()]
 
@@ -97,14 +114,24 @@ def predict_and_test(data_path: str, predictor_variable: str, target_variable: s
 def main() -> None:
     parser = argparse.ArgumentParser(description='Predict data')
     parser.add_argument('-dp', '--data-path', default='./data/test_user_ratings.csv', type=str, help='Path to test data')
-    parser.add_argument('-mp', '--model-path', default='./models/rec2vec.obj', type=str, help='Path to rec2vec model')
+    parser.add_argument('-mp', '--model-path', default='./models/rec2vec.obj', type=str, help='Path to rec2vec model (or exported vectors)')
     parser.add_argument('-ndp', '--node-dict-path', default='./output/node_dict.obj', type=str, help='Path to nodedict')
     parser.add_argument('-rp', '--report-path', default='./output/report.txt', type=str, help='Path to report')
     parser.add_argument('-t', '--target-variable', default='ratings:rating', type=str, help='Link to be predicted')
     parser.add_argument('-p', '--predictor-variable', default='users:userID;movies:movieID', type=str, help='Predictor nodes')
-    parser.add_argument('-cp', '--config-path', default='./rec2vec/configs/graph_config.yaml', type=str, help='Path to custom config')
+    parser.add_argument('-cp', '--config-path', default=GRAPH_CONFIG_PATH, type=str, help='Path to custom config')
+    parser.add_argument('-pf', '--profile', default=None, type=str, help='Write timings and memory of each stage to this JSON file')
     args = parser.parse_args()
-    _report_prediction(args=args)
+    configure_logging()
+
+    if args.profile is not None:
+        profiler.enable()
+
+    try:
+        _report_prediction(args=args)
+    finally:
+        if args.profile is not None:
+            profiler.export(path=args.profile)
 
 
 if __name__ == '__main__':
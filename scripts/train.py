@@ -1,23 +1,98 @@
-import gensim.models
-
 from rec2vec.util.Graph import Graph
-from gensim.models import Word2Vec
+from rec2vec.util.incremental import ingest_edges
+from rec2vec.util.load_config import load_config
+from rec2vec.predict.candidates import build_candidate_tables, get_candidates_path, save_candidates
+from rec2vec.util.mapped_vectors import export_model
+from rec2vec.util.profiling import profiler, span
+from rec2vec.util.walks import train_word2vec
+from shutil import copyfile
 from sys import exit
-from pickle import dump
-from rec2vec import logger
+from pickle import dump, load
+from rec2vec import GRAPH_CONFIG_PATH, configure_logging, logger
+from typing import TYPE_CHECKING
 
 import random
 import argparse
 
+# gensim takes seconds to import, it is imported when a model is trained (not for --help)
+if TYPE_CHECKING:
+    from gensim.models import Word2Vec
+
 
-def save_model(path: str, model: gensim.models.Word2Vec):
-    logger.trace(f'save_model({path}, {model})')
+def save_model(path: str, model: 'Word2Vec'):
+    logger.trace('save_model(%s, %s)', path, model)
     logger.info('saving model...')
     filehandler = open(file=path, mode='wb')
     dump(obj=model, file=filehandler)
     filehandler.close()
 
 
+def save_candidates_for(path: str, model: 'Word2Vec', g: Graph, config_path: str) -> None:
+    """
+    Precomputes the candidate tables of a model (see candidates.build_candidate_tables()) and stores them next to it.
+
+    :param path:        path to the (pickled) model
+    :param model:       trained model
+    :param g:           graph the model has been trained on
+    :param config_path: path to the configuration of the graph
+    :return:
+    """
+    logger.trace('save_candidates_for(%s, %s, %s)', path, model, config_path)
+    logger.info('saving candidate tables...')
+    save_candidates(path=get_candidates_path(model_path=path),
+                    tables=build_candidate_tables(config=load_config(path=config_path), node_dict=g.get_node_dict(),
+                                                  model=model))
+
+
+def export_vectors_for(path: str, model: 'Word2Vec', g: Graph, model_path: str) -> None:
+    """
+    Exports the vectors and the node dictionary of a model to a folder that test.py and serve.py memory-map
+    (see mapped_vectors.export_model()) and copies the candidate tables of the model next to it.
+
+    :param path:        path to the folder of the exported vectors
+    :param model:       trained model
+    :param g:           graph the model has been trained on
+    :param model_path:  path to the (pickled) model, its candidate tables have to be saved already
+    :return:
+    """
+    logger.trace('export_vectors_for(%s, %s, %s)', path, model, model_path)
+    logger.info('exporting vectors...')
+    export_model(model=model, folder=path, node_dict=g.get_node_dict())
+    copyfile(get_candidates_path(model_path=model_path), get_candidates_path(model_path=path))
+
+
+def load_model(path: str) -> 'Word2Vec':
+    logger.trace('load_model(%s)', path)
+    logger.info('loading model...')
+    with open(file=path, mode='rb') as f:
+        return load(file=f)
+
+
+def _use_string_keys(model: 'Word2Vec') -> None:
+    """
+    Converts the keys of a model (unique ids) to strings, so that they match the words of a corpus file.
+
+    :param model:   trained model
+    :return:
+    """
+    logger.trace('_use_string_keys(%s)', model)
+    model.wv.index_to_key = [str(key) for key in model.wv.index_to_key]
+    model.wv.key_to_index = {key: index for index, key in enumerate(model.wv.index_to_key)}
+
+
+def _use_integer_keys(model: 'Word2Vec') -> None:
+    """
+    Converts the keys of a model trained from a corpus file (strings) to unique ids (integers), so that
+    the model can be used exactly like a model trained from a list of walks.
+
+    :param model:   trained model
+    :return:
+    """
+    logger.trace('_use_integer_keys(%s)', model)
+    model.wv.index_to_key = [int(key) for key in model.wv.index_to_key]
+    model.wv.key_to_index = {key: index for index, key in enumerate(model.wv.index_to_key)}
+
+
 def train(args: argparse.Namespace, g: Graph = None, save: bool = True):
     """
     Trains a Word2Vec model with the arguments the user provided.
@@ -27,35 +102,122 @@ def train(args: argparse.Namespace, g: Graph = None, save: bool = True):
     :param save:    boolean indicating whether to save the trained model or not
     :return:
     """
-    logger.trace(f'train({args})')
+    logger.trace('train(%s)', args)
     logger.info('Training with the following arguments:\n'
                 f'number of paths:\t{args.number_paths}\n'
                 f'path length:\t\t{args.length_path}\n'
                 f'alpha:\t\t\t{args.alpha}\n'
+                f'p, q:\t\t\t{args.return_param}, {args.inout_param}\n'
                 f'seed:\t\t\t{args.seed}\n'
                 f'window size:\t\t{args.window_size}\n'
                 f'workers:\t\t{args.workers}\n'
+                f'graph backend:\t\t{args.graph_backend}\n'
+                f'walk engine:\t\t{args.walk_engine}\n'
+                f'corpus file:\t\t{args.corpus_file}\n'
                 f'save path:\t\t{args.save_path}\n'
+                f'export path:\t\t{args.export_path}\n'
                 f'config path:\t\t{args.config_path}\n')
 
     if g is None:
         logger.info('constructing graph...')
-        g = Graph(config_path=args.config_path)
+        with span('graph', backend=args.graph_backend):
+            g = Graph(config_path=args.config_path, backend=args.graph_backend)
         logger.info('graph constructed successfully')
 
     rand = random.Random(args.seed)
 
     logger.info('constructing corpus...')
-    corpus = g.build_deepwalk_corpus(num_paths=args.number_paths, path_length=args.length_path,
-                                     alpha=args.alpha, rand=rand)
+    with span('walks', engine=args.walk_engine, number_paths=args.number_paths, length_path=args.length_path):
+        if args.corpus_file is None:
+            corpus = g.build_deepwalk_corpus(num_paths=args.number_paths, path_length=args.length_path,
+                                             alpha=args.alpha, rand=rand, engine=args.walk_engine,
+                                             workers=args.workers, p=args.return_param, q=args.inout_param)
+        else:
+            g.write_deepwalk_corpus(path=args.corpus_file, num_paths=args.number_paths, path_length=args.length_path,
+                                    alpha=args.alpha, rand=rand, engine=args.walk_engine, workers=args.workers,
+                                    p=args.return_param, q=args.inout_param)
     logger.info('corpus constructed successfully')
 
     logger.info('creating model...')
-    model = Word2Vec(sentences=corpus, window=args.window_size, min_count=0, workers=args.workers)
+    with span('training', window_size=args.window_size, workers=args.workers):
+        if args.corpus_file is None:
+            model = train_word2vec(corpus=corpus, window=args.window_size, min_count=0, workers=args.workers)
+        else:
+            from gensim.models import Word2Vec
+
+            model = Word2Vec(corpus_file=args.corpus_file, window=args.window_size, min_count=0,
+                             workers=args.workers)
+            _use_integer_keys(model=model)
     logger.info('model created successfully')
 
     if save:
-        save_model(path=args.save_path, model=model)
+        with span('save'):
+            save_model(path=args.save_path, model=model)
+            save_candidates_for(path=args.save_path, model=model, g=g, config_path=args.config_path)
+            if args.export_path is not None:
+                export_vectors_for(path=args.export_path, model=model, g=g, model_path=args.save_path)
+
+    return model
+
+
+def update(args: argparse.Namespace, touched: list[int], g: Graph = None, save: bool = True):
+    """
+    Continues training a stored model after new edges have been added to the graph (see ingest_edges()).
+    Walks are only started from the nodes touched by the new edges and their neighborhood (args.hops steps),
+    so the time needed depends on the size of the change rather than on the size of the graph. New nodes are
+    added to the vocabulary of the model, the vectors of existing nodes are trained further.
+
+    :param args:    see help for detailed information on the user input
+    :param touched: unique ids of the nodes touched by the new edges
+    :param g:       graph to be used for training (containing the new edges)
+    :param save:    boolean indicating whether to save the updated model or not
+    :return:
+    """
+    logger.trace('update(%s, %s)', args, len(touched))
+
+    if g is None:
+        logger.info('constructing graph...')
+        with span('graph', backend=args.graph_backend):
+            g = Graph(config_path=args.config_path, backend=args.graph_backend)
+        logger.info('graph constructed successfully')
+
+    start_nodes = g.get_neighborhood(nodes=touched, hops=args.hops)
+    logger.info(f'updating model with walks from {len(start_nodes)} nodes ({len(touched)} touched, {args.hops} hops)')
+
+    model = load_model(path=args.save_path)
+    rand = random.Random(args.seed)
+
+    logger.info('constructing corpus...')
+    with span('walks', engine=args.walk_engine, start_nodes=len(start_nodes)):
+        if args.corpus_file is None:
+            corpus = g.build_deepwalk_corpus(num_paths=args.number_paths, path_length=args.length_path,
+                                             alpha=args.alpha, rand=rand, engine=args.walk_engine,
+                                             workers=args.workers, start_nodes=start_nodes, p=args.return_param,
+                                             q=args.inout_param)
+        else:
+            g.write_deepwalk_corpus(path=args.corpus_file, num_paths=args.number_paths, path_length=args.length_path,
+                                    alpha=args.alpha, rand=rand, engine=args.walk_engine, workers=args.workers,
+                                    start_nodes=start_nodes, p=args.return_param, q=args.inout_param)
+    logger.info('corpus constructed successfully')
+
+    logger.info('updating model...')
+    with span('training', update=True):
+        if args.corpus_file is None:
+            train_word2vec(corpus=corpus, model=model)
+        else:
+            _use_string_keys(model=model)
+            model.build_vocab(corpus_file=args.corpus_file, update=True)
+            model.train(corpus_file=args.corpus_file, total_examples=model.corpus_count,
+                        total_words=model.corpus_total_words, epochs=model.epochs)
+            _use_integer_keys(model=model)
+    logger.info('model updated successfully')
+
+    if save:
+        with span('save'):
+            save_model(path=args.save_path, model=model)
+            save_candidates_for(path=args.save_path, model=model, g=g, config_path=args.config_path)
+            if args.export_path is not None:
+                export_vectors_for(path=args.export_path, model=model, g=g, model_path=args.save_path)
 
     return model
 
@@ -68,10 +230,35 @@ def main():
     parser.add_argument('-ws', '--window-size', default=5, type=int, help='Window size for skipgram')
     parser.add_argument('-wo', '--workers', default=8, type=int, help='Number of workers')
     parser.add_argument('-sp', '--save-path', default='./models/rec2vec.obj', type=str, help='Path where trained model shall be stored')
-    parser.add_argument('-cp', '--config-path', default='./rec2vec/configs/graph_config.yaml', type=str, help='Path to custom config')
+    parser.add_argument('-ex', '--export-path', default=None, type=str, help='Also export the vectors to this folder (memory-mapped for predictions)')
+    parser.add_argument('-cp', '--config-path', default=GRAPH_CONFIG_PATH, type=str, help='Path to custom config')
     parser.add_argument('-a', '--alpha', default=0, type=float, help='Chance for path to be reset to start')
+    parser.add_argument('-gb', '--graph-backend', default='dict', choices=Graph.BACKENDS, help='Representation of the graph')
+    parser.add_argument('-cf', '--corpus-file', default=None, type=str, help='Stream walks to this file and train from it')
+    parser.add_argument('-we', '--walk-engine', default='python', choices=Graph.ENGINES, help='Engine recording the walks')
+    parser.add_argument('-p', '--return-param', default=1, type=float, help='node2vec return parameter p (vectorized engine)')
+    parser.add_argument('-q', '--inout-param', default=1, type=float, help='node2vec in-out parameter q (vectorized engine)')
+    parser.add_argument('-ur', '--update-rows', default=None, type=str, help='Add these rows to the graph and update the model at save path')
+    parser.add_argument('-ue', '--update-edge', default='users_ratings', type=str, help='Edge the update rows belong to')
+    parser.add_argument('-kh', '--hops', default=0, type=int, help='Update walks also start from nodes this many steps away')
+    parser.add_argument('-pf', '--profile', default=None, type=str, help='Write timings and memory of each stage to this JSON file')
     args = parser.parse_args()
-    train(args=args)
+    configure_logging()
+
+    if args.profile is not None:
+        profiler.enable()
+
+    try:
+        if args.update_rows is None:
+            train(args=args)
+        else:
+            with span('ingestion'):
+                result = ingest_edges(config=load_config(path=args.config_path), edge_name=args.update_edge,
+                                      rows=args.update_rows)
+            update(args=args, touched=result.touched.tolist())
+    finally:
+        if args.profile is not None:
+            profiler.export(path=args.profile)
 
 
 if __name__ == '__main__':
@@ -1,46 +1,259 @@
-import pandas as pd
-from rec2vec.util.encoding_detector import get_encoding
-from rec2vec.util.load_config import load_config
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from math import ceil
+from os import makedirs
+from os.path import dirname, exists
 from rec2vec.util.Graph import Graph
+from rec2vec.util.artifact_cache import artifact_key, is_valid, store_directory_artifact
+from rec2vec.util.graph_loader import graph_cache_key
+from rec2vec.util.id_registry import IdRegistry
+from rec2vec.util.load_config import load_config
+from rec2vec.util.profiling import span
+from rec2vec.util.walks import WalkCorpus, train_word2vec
+from rec2vec import GRAPH_CONFIG_PATH, configure_logging, logger
+from typing import NamedTuple
+
+import argparse
+import json
 import random
-from gensim.models import Word2Vec
-from scripts.test import predict_and_test
-
-config = load_config()
-config_path = './rec2vec/configs/graph_config.yaml'
-data_path = './data/test_user_ratings.csv'
-
-df = pd.read_csv(filepath_or_buffer=data_path,
-                 sep=config['data']['separator'],
-                 encoding=get_encoding(file=data_path))
-
-
-number_paths = [5, 10]
-length_path = [5]
-alpha = [0]
-window_size = [5]
-
-g = Graph(config_path)
-rand = random.Random(0)
-
-node_dict = g.get_node_dict()
-
-acc = 0
-mse = float('inf')
-
-best_config = []
-with open('./output/hyperparameter_tuning_report.csv', 'w') as f:
-    for paths in number_paths:
-        for lengths in length_path:
-            for alphas in alpha:
-                for windows in window_size:
-                    corpus = g.build_deepwalk_corpus(num_paths=paths, path_length=lengths,
-                                                     alpha=alphas, rand=rand)
-                    model = Word2Vec(sentences=corpus, window=windows, min_count=0, workers=8)
-                    res_acc, res_cm, res_mse = predict_and_test(data_path, 'users:userID;movies:movieID', 'ratings:rating', config, model, node_dict)
-                    if mse > float(res_mse):
-                        best_config = [paths, lengths, alphas, windows, res_acc, res_cm, res_mse]
-                    mse = float(res_mse)
-                    f.write(f'{paths};{lengths};{alphas};{windows};{res_acc};"{res_cm}";{res_mse}\n')
-                    print(f'{[paths, lengths, alphas, windows, res_acc, res_cm, res_mse]}')
+import time
+
+WALK_PARAMETERS = ('number_paths', 'length_path', 'alpha', 'seed')     # parameters the corpus depends on
+CORPUS_FOLDER = 'tuning/'   # folder (in the output folder) containing the cached corpora
+
+
+class Trial(NamedTuple):
+    params: dict    # number_paths, length_path, alpha, seed and window_size
+    epochs: int     # training budget of the trial
+
+
+def _trial_id(trial: Trial) -> str:
+    return json.dumps({**trial.params, 'epochs': trial.epochs}, sort_keys=True)
+
+
+def corpus_key(params: dict) -> tuple:
+    """
+    Returns the part of the parameters of a trial the walk corpus depends on. Trials that only differ in their
+    window size (or epochs) share one corpus.
+
+    :param params:  parameters of a trial
+    :return:        walk parameters
+    """
+
+    return tuple(params[name] for name in WALK_PARAMETERS)
+
+
+def build_corpora(g: Graph, config: dict, trials: list[Trial], walk_engine: str = 'vectorized',
+                  workers: int = 1) -> dict[tuple, str]:
+    """
+    Stores the corpus of every combination of walk parameters in a folder (see WalkCorpus.save()), once. Corpora
+    are cached in the output folder and are only recorded again when the graph changes. Every corpus is recorded
+    with its own random state (seeded by the seed of the trial), so that it does not depend on the other corpora.
+
+    :param g:               graph
+    :param config:          configuration of the graph
+    :param trials:          trials to be run
+    :param walk_engine:     engine recording the walks
+    :param workers:         number of processes recording the walks (vectorized engine)
+    :return:                path to the corpus folder, by walk parameters (see corpus_key())
+    """
+
+    logger.trace('build_corpora(%s, %s, %s, %s)', len(trials), walk_engine, workers)
+
+    folder = config['data']['output_folder'] + CORPUS_FOLDER
+    makedirs(folder, exist_ok=True)
+
+    paths = {}
+    for key in sorted({corpus_key(trial.params) for trial in trials}):
+        walk_params = dict(zip(WALK_PARAMETERS, key))
+        path = folder + 'corpus_' + '_'.join(f'{value}' for value in key)
+        cache_key = artifact_key(section={**walk_params, 'engine': walk_engine}, sources=[],
+                                 parent=graph_cache_key(config))
+        if not is_valid(path=path, key=cache_key):
+            logger.info(f'recording corpus {walk_params}...')
+            with span('walks', **walk_params):
+                corpus = g.build_deepwalk_corpus(num_paths=walk_params['number_paths'],
+                                                 path_length=walk_params['length_path'], alpha=walk_params['alpha'],
+                                                 rand=random.Random(walk_params['seed']), engine=walk_engine,
+                                                 seed=walk_params['seed'], workers=workers)
+            store_directory_artifact(path=path, key=cache_key, write=lambda tmp: corpus.save(folder=tmp),
+                                     **walk_params)
+            del corpus
+        paths[key] = path
+    return paths
+
+
+# State of a worker process (see _init_worker())
+_worker = {}
+
+
+def _init_worker(config_path: str, data_path: str, node_dict: IdRegistry, corpus_paths: dict[tuple, str],
+                 training_workers: int) -> None:
+    _worker.update(config=load_config(path=config_path), data_path=data_path, node_dict=node_dict,
+                   corpus_paths=corpus_paths, training_workers=training_workers, corpus=(None, None))
+
+
+def _load_corpus(key: tuple) -> WalkCorpus:
+    """
+    Returns a corpus of the worker. Corpora are memory-mapped (see WalkCorpus.load()), so all workers share one
+    copy of a corpus in the page cache. The last corpus is kept open for consecutive trials on the same corpus.
+
+    :param key: walk parameters (see corpus_key())
+    :return:    walks
+    """
+
+    if _worker['corpus'][0] != key:
+        _worker['corpus'] = (key, WalkCorpus.load(folder=_worker['corpus_paths'][key], mmap_mode='r'))
+    return _worker['corpus'][1]
+
+
+def run_trial(trial: Trial) -> dict:
+    """
+    Trains a model with the parameters of a trial and evaluates it on the test data. All predictions of a
+    trial are scored at once with the candidate tables of the model (see prediction_util.predict_from_data()).
+    The model is seeded by the seed of the trial, so a trial yields the same result in any process and order.
+
+    :param trial:   parameters and training budget
+    :return:        trial record (parameters, epochs, accuracy, mse, confusion matrix and seconds)
+    """
+
+    logger.trace('run_trial(%s)', trial)
+
+    from rec2vec.predict.candidates import build_candidate_tables
+    from scripts.test import predict_and_test
+
+    start = time.perf_counter()
+    corpus = _load_corpus(key=corpus_key(trial.params))
+    model = train_word2vec(corpus=corpus, window=trial.params['window_size'], min_count=0, seed=trial.params['seed'],
+                           epochs=trial.epochs, workers=_worker['training_workers'])
+    candidates = build_candidate_tables(config=_worker['config'], node_dict=_worker['node_dict'], model=model)
+    acc, cm, mse = predict_and_test(data_path=_worker['data_path'], predictor_variable='users:userID;movies:movieID',
+                                    target_variable='ratings:rating', config=_worker['config'], model=model,
+                                    node_dict=_worker['node_dict'], candidates=candidates)
+    return {'params': trial.params, 'epochs': trial.epochs, 'accuracy': float(acc), 'mse': float(mse),
+            'confusion_matrix': cm.tolist(), 'seconds': time.perf_counter() - start}
+
+
+def read_log(path: str, key: str) -> dict[str, dict]:
+    """
+    Reads the trials that have already been run (on the same graph and test data) from a trial log.
+
+    :param path:    path to the log (one JSON record per line)
+    :param key:     key of the graph and test data the trials have been run on (see tune())
+    :return:        trial records by trial id
+    """
+
+    logger.trace('read_log(%s)', path)
+
+    records = {}
+    if exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # last line of an interrupted run
+                    continue
+                if record.get('key') == key:
+                    records[_trial_id(Trial(params=record['params'], epochs=record['epochs']))] = record
+    return records
+
+
+def budgets(min_epochs: int, max_epochs: int, eta: int) -> list[int]:
+    """
+    Returns the training budgets of the rungs of successive halving, e.g. 1, 3, 5 for min 1, max 5 and eta 3.
+
+    :param min_epochs:  budget of the first rung
+    :param max_epochs:  budget of the last rung
+    :param eta:         factor the budget grows by (and the number of trials shrinks by) from rung to rung
+    :return:            budget of every rung
+    """
+
+    rungs = [min(min_epochs, max_epochs)]
+    while rungs[-1] < max_epochs and eta > 1:
+        rungs.append(min(rungs[-1] * eta, max_epochs))
+    return rungs
+
+
+def tune(args: argparse.Namespace) -> dict:
+    """
+    Searches the grid of parameters given by the user. With successive halving, all combinations are trained
+    with a small number of epochs first; only the best 1 / eta of them are trained with eta times as many
+    epochs, until the full number of epochs is reached. Trials run in a process pool, every finished trial is
+    appended to the trial log immediately, and trials found in the log are not run again.
+
+    :param args:    see help for detailed information on the user input
+    :return:        record of the best trial
+    """
+
+    logger.trace('tune(%s)', args)
+
+    config = load_config(path=args.config_path)
+    key = artifact_key(section={'data_path': args.data_path}, sources=[args.data_path], parent=graph_cache_key(config))
+    grid = [dict(zip(('number_paths', 'length_path', 'alpha', 'window_size', 'seed'), values))
+            for values in product(args.number_paths, args.length_path, args.alpha, args.window_size, args.seed)]
+    rungs = budgets(min_epochs=args.min_epochs, max_epochs=args.epochs, eta=args.eta)
+    logger.info(f'tuning {len(grid)} combinations with budgets {rungs} (epochs)')
+
+    g = Graph(config_path=args.config_path, backend=args.graph_backend)
+    corpus_paths = build_corpora(g=g, config=config, trials=[Trial(params, 0) for params in grid],
+                                 walk_engine=args.walk_engine, workers=args.processes)
+    node_dict = g.get_node_dict()
+
+    makedirs(dirname(args.log_path) or '.', exist_ok=True)
+    records = read_log(path=args.log_path, key=key)
+    sign = 1 if args.metric == 'mse' else -1    # lower is better for mse, higher for accuracy
+
+    survivors = grid
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker,
+                             initargs=(args.config_path, args.data_path, node_dict, corpus_paths,
+                                       args.training_workers)) as pool, open(args.log_path, 'a') as log:
+        for rung, epochs in enumerate(rungs):
+            trials = [Trial(params=params, epochs=epochs) for params in survivors]
+            pending = sorted((t for t in trials if _trial_id(t) not in records), key=lambda t: corpus_key(t.params))
+            logger.info(f'rung {rung}: {len(trials)} trials with {epochs} epochs ({len(pending)} not in the log)')
+
+            for record in pool.map(run_trial, pending):
+                record['key'] = key
+                records[_trial_id(Trial(params=record['params'], epochs=record['epochs']))] = record
+                log.write(json.dumps(record) + '\n')
+                log.flush()
+                logger.info(f'{record["params"]} ({epochs} epochs): accuracy {record["accuracy"]:.4f}, '
+                            f'mse {record["mse"]:.4f}')
+
+            ranked = sorted(trials, key=lambda t: sign * records[_trial_id(t)][args.metric])
+            survivors = [t.params for t in ranked[:max(1, ceil(len(ranked) / args.eta))]] \
+                if rung < len(rungs) - 1 else [t.params for t in ranked]
+
+    best = records[_trial_id(Trial(params=survivors[0], epochs=rungs[-1]))]
+    logger.info(f'best parameters: {best["params"]} (accuracy {best["accuracy"]:.4f}, mse {best["mse"]:.4f})')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune the hyperparameters of the model')
+    parser.add_argument('-np', '--number-paths', default=[5, 10], type=int, nargs='+', help='Numbers of paths for each node')
+    parser.add_argument('-lp', '--length-path', default=[5], type=int, nargs='+', help='Numbers of steps per path')
+    parser.add_argument('-a', '--alpha', default=[0.0], type=float, nargs='+', help='Chances for path to be reset to start')
+    parser.add_argument('-ws', '--window-size', default=[5], type=int, nargs='+', help='Window sizes for skipgram')
+    parser.add_argument('-s', '--seed', default=[0], type=int, nargs='+', help='Random seeds (of walks and model)')
+    parser.add_argument('-e', '--epochs', default=5, type=int, help='Number of epochs of the final trials')
+    parser.add_argument('-me', '--min-epochs', default=None, type=int, help='Number of epochs of the first rung of successive halving (default: no halving)')
+    parser.add_argument('-et', '--eta', default=3, type=int, help='Factor by which successive halving reduces the trials')
+    parser.add_argument('-m', '--metric', default='mse', choices=('mse', 'accuracy'), help='Metric the trials are ranked by')
+    parser.add_argument('-pr', '--processes', default=4, type=int, help='Number of trials run in parallel')
+    parser.add_argument('-tw', '--training-workers', default=1, type=int, help='Number of threads training each model')
+    parser.add_argument('-gb', '--graph-backend', default='csr', choices=Graph.BACKENDS, help='Representation of the graph')
+    parser.add_argument('-we', '--walk-engine', default='vectorized', choices=Graph.ENGINES, help='Engine recording the walks')
+    parser.add_argument('-dp', '--data-path', default='./data/test_user_ratings.csv', type=str, help='Path to test data')
+    parser.add_argument('-lg', '--log-path', default='./output/tuning_trials.jsonl', type=str, help='Path to the trial log (resumed if it exists)')
+    parser.add_argument('-cp', '--config-path', default=GRAPH_CONFIG_PATH, type=str, help='Path to custom config')
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.min_epochs is None:
+        args.min_epochs = args.epochs
+    tune(args=args)
+
 
+if __name__ == '__main__':
+    exit(main())
@@ -9,11 +9,13 @@ setup(
     license="MIT",
     install_requires=[
         "PyYAML==6.0",
+        "numpy==1.24.3",
         "pandas==2.0.0",
         "chardet==5.1.0",
         "tqdm==4.65.0"
     ],
     packages=find_packages(),
+    package_data={"rec2vec": ["configs/*.yaml"]},
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Education",